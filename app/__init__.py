@@ -2,10 +2,12 @@ import os
 import sys
 import json
 import locale
-from flask import Flask, session, jsonify, render_template, request, flash, redirect, url_for
+import click
+from datetime import timedelta
+from flask import Flask, session, jsonify, render_template, request, flash, redirect, url_for, g
 from sqlalchemy import create_engine, func, text, inspect
 from sqlalchemy.orm import sessionmaker, scoped_session, joinedload
-from sqlalchemy.exc import ProgrammingError, OperationalError
+from sqlalchemy.exc import ProgrammingError, OperationalError, SQLAlchemyError
 
 # --- Configuración de Rutas para Importación (tu bloque original) ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -43,18 +45,50 @@ def create_app(config_class=Config):
     app.jinja_env.filters['month_name'] = get_month_name
     app.jinja_env.filters['get_kpi_color'] = get_kpi_color_class
 
+    from .cache import FragmentCacheExtension
+    app.jinja_env.add_extension(FragmentCacheExtension)
+
+    from . import singleflight
+    singleflight.configure(app.config['SINGLEFLIGHT_SHARED_DIR'], app.config['SINGLEFLIGHT_RESULT_TTL'],
+                           app.config['SINGLEFLIGHT_WAIT_SECONDS'])
+    from . import snapshots
+    snapshots.configure(app.config['SNAPSHOT_DIR'], app.config['SNAPSHOT_BREAKER_FAILURES'], app.config['SNAPSHOT_BREAKER_OPEN_SECONDS'],
+                        app.config['SNAPSHOT_SLOW_SECONDS'], app.config['SNAPSHOT_MAX_ENTRIES'])
+
+    from . import programs
+    programs.configure(app.config['PROGRAM_CELL_STORAGE'])
+
     # --- Registro de Blueprints ---
     from .auth import bp as auth_bp
     from .production import bp as production_bp
     from .programa_lm import bp as lm_bp
     from .programa_rotores import bp as rotores_bp
     from .admin import bp as admin_bp
+    from .exports import bp as exports_bp
+    from . import ingest
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(production_bp)
     app.register_blueprint(lm_bp, url_prefix='/programa_lm')
     app.register_blueprint(rotores_bp, url_prefix='/programa_rotores')
     app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(exports_bp, url_prefix='/exports')
+    ingest.configure(app.config['INGEST_DIR'], app.config['INGEST_TOKENS'], app.config['INGEST_FLUSH_SECONDS'],
+                     app.config['INGEST_FLUSH_EVENTS'], app.config['INGEST_MAX_AGE_DAYS'], app.config['INGEST_FSYNC'],
+                     app.config['INGEST_MAX_BYTES'])
+    app.register_blueprint(ingest.bp)
+
+    # --- Instrumentación (conteo de consultas, Server-Timing, métricas por endpoint) ---
+    from . import instrumentation, metrics, profiling
+    instrumentation.init_app(app, engine)
+    profiling.init_app(app)
+    metrics.register_pool_metrics(engine)
+    metrics.register_production_metrics()
+    app.register_blueprint(metrics.bp)
+
+    # --- Jobs en segundo plano (resúmenes, cachés, archivado) ---
+    from . import scheduler
+    scheduler.init_app(app)
 
     @app.teardown_appcontext
     def shutdown_session(exception=None):
@@ -67,18 +101,27 @@ def create_app(config_class=Config):
     @app.context_processor
     def inject_global_vars():
         from .models import Usuario, Pronostico, SolicitudCorreccion, Rol
+        from .snapshots import DB_BREAKER
         
         user = None
         viewable_roles = []
-        if 'username' in session:
-            user = db_session.query(Usuario).options(
-                joinedload(Usuario.role).joinedload(Rol.viewable_roles)
-            ).filter_by(username=session['username']).first()
+        # Con el cortacircuitos abierto la página se arma con datos guardados y la sesión, sin consultar la base.
+        if 'username' in session and DB_BREAKER.is_open:
+            viewable_roles = session.get('viewable_roles', [])
+        elif 'username' in session:
+            try:
+                user = db_session.query(Usuario).options(
+                    joinedload(Usuario.role).joinedload(Rol.viewable_roles)
+                ).filter_by(username=session['username']).first()
+            except SQLAlchemyError as e:
+                db_session.rollback()
+                app.logger.error(f"Error al cargar el usuario de la sesión: {e}")
+                viewable_roles = session.get('viewable_roles', [])
             if user and user.role:
                 viewable_roles = [r.nombre for r in user.role.viewable_roles]
 
         pending_actions_count = 0
-        if 'actions.center' in session.get('permissions', []):
+        if 'actions.center' in session.get('permissions', []) and not DB_BREAKER.is_open:
             try:
                 desviaciones_count = db_session.query(func.count(Pronostico.id)).filter(
                     Pronostico.status == 'Nuevo', Pronostico.razon_desviacion.isnot(None), Pronostico.razon_desviacion != ''
@@ -86,13 +129,15 @@ def create_app(config_class=Config):
                 correcciones_count = db_session.query(func.count(SolicitudCorreccion.id)).filter(SolicitudCorreccion.status == 'Pendiente').scalar() or 0
                 pending_actions_count = desviaciones_count + correcciones_count
             except Exception as e:
+                db_session.rollback()
                 app.logger.error(f"Error al contar acciones pendientes: {e}")
 
         return dict(
             current_user=user,
             pending_actions_count=pending_actions_count,
             permissions=session.get('permissions', []),
-            viewable_roles=viewable_roles
+            viewable_roles=viewable_roles,
+            datos_al=g.get('datos_al')
         )
 
     @app.cli.command("init-db")
@@ -102,4 +147,117 @@ def create_app(config_class=Config):
         create_default_admin()
         print("Base de datos inicializada con valores por defecto.")
 
+    @app.cli.command("db-migrate")
+    @click.option('--target', default=None, help='Última versión a aplicar (por defecto, todas).')
+    def db_migrate_command(target):
+        from .migrations import run_migrations
+        from .models import prepare_schema, ensure_indexes
+        prepare_schema()
+        applied = run_migrations(target)
+        ensure_indexes()
+        print(f"{len(applied)} migraciones aplicadas." if applied else "No hay migraciones pendientes.")
+
+    @app.cli.command("db-status")
+    def db_status_command():
+        from .migrations import MIGRATIONS, applied_versions, backfill_status
+        applied = applied_versions()
+        for m in sorted(MIGRATIONS, key=lambda m: m.version):
+            row = applied.get(m.version)
+            status = f"aplicada {row.applied_at:%Y-%m-%d %H:%M} ({row.duration_ms} ms)" if row else "PENDIENTE"
+            print(f"{m.version:<28} {status:<36} {m.description}")
+        for bf, progress in backfill_status():
+            if progress is None:
+                status = "sin iniciar"
+            elif progress.finished_at:
+                status = f"terminado {progress.finished_at:%Y-%m-%d %H:%M}, {progress.rows_done} filas"
+            else:
+                status = f"en curso: id {progress.last_id}, {progress.rows_done} filas"
+            print(f"backfill {bf.name:<19} {status:<36} {bf.description}")
+
+    @app.cli.command("db-backfill")
+    @click.argument('name')
+    @click.option('--batch-size', type=int, default=None, help='Filas por lote (por defecto, el del backfill).')
+    @click.option('--sleep', type=float, default=0.1, help='Pausa en segundos entre lotes.')
+    @click.option('--max-batches', type=int, default=None, help='Detenerse tras N lotes; se reanuda en la siguiente ejecución.')
+    @click.option('--restart', is_flag=True, help='Empezar desde el principio aunque haya avance guardado.')
+    def db_backfill_command(name, batch_size, sleep, max_batches, restart):
+        from .migrations import BACKFILLS, run_backfill
+        if name not in BACKFILLS:
+            raise click.BadParameter(f"Backfills disponibles: {', '.join(BACKFILLS)}", param_hint='NAME')
+        run_backfill(name, batch_size=batch_size, sleep=sleep, max_batches=max_batches, restart=restart)
+
+    @app.cli.command("archive-logs")
+    @click.option('--keep-months', type=int, default=None, help='Meses de log que se conservan en la base.')
+    @click.option('--output-dir', default=None, help='Directorio destino de los archivos .ndjson.gz.')
+    def archive_logs_command(keep_months, output_dir):
+        from .log_archive import archive_activity_logs
+        from .models import ensure_monthly_partitions
+        keep_months = keep_months if keep_months is not None else app.config['LOG_RETENTION_MONTHS']
+        output_dir = output_dir or app.config['LOG_ARCHIVE_DIR']
+        archived = archive_activity_logs(keep_months, output_dir)
+        for month, count, path in archived:
+            print(f"{month}: {count} registros archivados en {path}")
+        if not archived:
+            print(f"No hay registros anteriores a {keep_months} meses para archivar.")
+        ensure_monthly_partitions()
+
+    @app.cli.command("logs-partition")
+    def logs_partition_command():
+        from .log_archive import convert_to_partitioned
+        if convert_to_partitioned():
+            print("activity_logs convertida a tabla particionada por mes.")
+        else:
+            print("activity_logs ya estaba particionada.")
+
+    @app.cli.command("run-job")
+    @click.argument('job_id')
+    def run_job_command(job_id):
+        from .scheduler import run_job_now, job_definitions
+        if not run_job_now(app, job_id):
+            raise click.BadParameter(f"Jobs disponibles: {', '.join(d[0] for d in job_definitions(app))}", param_hint='JOB_ID')
+        print(f"Job {job_id} ejecutado.")
+
+    @app.cli.command("kpi-rollup")
+    @click.option('--desde', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help='Primer día a resumir.')
+    @click.option('--hasta', default=None, type=click.DateTime(formats=['%Y-%m-%d']), help='Último día (por defecto, el último día hábil cerrado).')
+    @click.option('--solo-faltantes', is_flag=True, help='Omitir los días que ya tienen resumen.')
+    def kpi_rollup_command(desde, hasta, solo_faltantes):
+        from .rollups import rebuild_range
+        from .utils import get_business_date
+        hasta = hasta.date() if hasta else get_business_date() - timedelta(days=1)
+        rebuilt = rebuild_range(desde.date(), hasta, only_missing=solo_faltantes)
+        print(f"{len(rebuilt)} días resumidos en kpi_diario.")
+
+    @app.cli.command("ingest-flush")
+    def ingest_flush_command():
+        from .ingest import flush_pending
+        written = flush_pending()
+        print(f"{written} celdas de contadores escritas en produccion_capturas.")
+
+    @app.cli.command("db-advise")
+    @click.option('--group', default='IHP', help='Grupo usado como parámetro de las consultas.')
+    @click.option('--area', default='Cuerpos', help='Área usada como parámetro de las consultas.')
+    @click.option('--verbose', is_flag=True, help='Muestra el plan completo de cada consulta.')
+    def db_advise_command(group, area, verbose):
+        from .db_advisor import canonical_queries, explain_queries, index_report
+        results = explain_queries(canonical_queries(group.upper(), area))
+        flagged = 0
+        for result in results:
+            status = 'REVISAR' if result['hallazgos'] else 'OK'
+            flagged += bool(result['hallazgos'])
+            print(f"[{status}] {result['nombre']} ({result['origen']})")
+            for finding in result['hallazgos']:
+                print(f"    - {finding}")
+            if verbose:
+                for line in result['plan']:
+                    print(f"      {line}")
+        missing, obsolete = index_report()
+        for name in missing:
+            print(f"Índice declarado que falta en la base: {name}")
+        for name in obsolete:
+            print(f"Índice redundante que sigue en la base: {name}")
+        if missing or obsolete:
+            print("Ejecute 'flask init-db' para crear/eliminar los índices pendientes.")
+        print(f"{flagged} de {len(results)} consultas con hallazgos.")
+
     return app
\ No newline at end of file
@@ -1,20 +1,81 @@
 # app/admin.py
 
 from flask import (Blueprint, render_template, request, redirect, url_for, session,
-                   flash, abort, jsonify)
+                   flash, abort, jsonify, current_app, Response, stream_with_context)
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
+import csv
+import io
+import json
+import time
+import zlib
 
-from . import db_session
+from . import db_session, engine, instrumentation, profiling
 from .decorators import login_required, permission_required, csrf_required
 from .utils import log_activity
+from .metrics import observe_export
 from .models import (Usuario, Rol, Turno, Permission, ActivityLog,
-                     Pronostico, SolicitudCorreccion)
-from sqlalchemy import exc
+                     Pronostico, SolicitudCorreccion, DimGrupo, DimArea, DimTurno)
+from sqlalchemy import exc, or_, and_, select, func, literal, null, union_all
 from sqlalchemy.orm import joinedload
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+ACCIONES_FILTER_KEYS = ['fecha_inicio', 'fecha_fin', 'grupo', 'tipo', 'status', 'orden']
+ACCIONES_PAGE_SIZE = 20
+ACCIONES_STATUSES = ['Nuevo', 'Pendiente', 'En Proceso', 'Resuelto']
+SIN_FECHA = datetime(1900, 1, 1)
+
+def _acciones_base_query(filtros):
+    """UNION ALL de desviaciones y solicitudes con columnas comunes, sin filtrar por estado."""
+    desviaciones = select(
+        literal('Desviacion').label('kind'), Pronostico.id.label('id'),
+        func.coalesce(Pronostico.fecha_razon, SIN_FECHA).label('sort_ts'), Pronostico.fecha_razon.label('ts'),
+        Pronostico.fecha.label('fecha_evento'), DimGrupo.nombre.label('grupo'), DimArea.nombre.label('area'),
+        DimTurno.nombre.label('turno'), func.coalesce(Usuario.nombre_completo, Pronostico.usuario_razon).label('usuario'),
+        Pronostico.razon_desviacion.label('detalles'), Pronostico.status.label('status'), null().label('tipo_error')
+    ).select_from(Pronostico).join(DimGrupo, Pronostico.grupo == DimGrupo.id).join(DimArea, Pronostico.area == DimArea.id).join(
+        DimTurno, Pronostico.turno == DimTurno.id).outerjoin(Usuario, Pronostico.usuario_razon == Usuario.username).where(
+        Pronostico.razon_desviacion.isnot(None), Pronostico.razon_desviacion != '')
+    solicitudes = select(
+        literal('Correccion').label('kind'), SolicitudCorreccion.id.label('id'),
+        func.coalesce(SolicitudCorreccion.timestamp, SIN_FECHA).label('sort_ts'), SolicitudCorreccion.timestamp.label('ts'),
+        SolicitudCorreccion.fecha_problema.label('fecha_evento'), SolicitudCorreccion.grupo.label('grupo'), SolicitudCorreccion.area.label('area'),
+        SolicitudCorreccion.turno.label('turno'), func.coalesce(Usuario.nombre_completo, SolicitudCorreccion.usuario_solicitante).label('usuario'),
+        SolicitudCorreccion.descripcion.label('detalles'), SolicitudCorreccion.status.label('status'), SolicitudCorreccion.tipo_error.label('tipo_error')
+    ).select_from(SolicitudCorreccion).outerjoin(Usuario, SolicitudCorreccion.usuario_solicitante == Usuario.username)
+
+    date_error = False
+    try:
+        if filtros.get('fecha_inicio'):
+            fecha_inicio = datetime.strptime(filtros['fecha_inicio'], '%Y-%m-%d').date()
+            desviaciones = desviaciones.where(Pronostico.fecha >= fecha_inicio)
+            solicitudes = solicitudes.where(SolicitudCorreccion.fecha_problema >= fecha_inicio)
+        if filtros.get('fecha_fin'):
+            fecha_fin = datetime.strptime(filtros['fecha_fin'], '%Y-%m-%d').date()
+            desviaciones = desviaciones.where(Pronostico.fecha <= fecha_fin)
+            solicitudes = solicitudes.where(SolicitudCorreccion.fecha_problema <= fecha_fin)
+    except ValueError:
+        date_error = True
+
+    if filtros.get('grupo') and filtros.get('grupo') != 'Todos':
+        desviaciones = desviaciones.where(DimGrupo.nombre == filtros['grupo'])
+        solicitudes = solicitudes.where(SolicitudCorreccion.grupo == filtros['grupo'])
+
+    tipo = filtros.get('tipo') or 'Todos'
+    selects = [q for q, kind in [(desviaciones, 'Desviacion'), (solicitudes, 'Correccion')] if tipo in ('Todos', kind)]
+    return union_all(*selects).subquery('acciones'), date_error
+
+def _encode_accion_cursor(row):
+    return f"{row.sort_ts.isoformat()}|{row.kind}|{row.id}"
+
+def _decode_accion_cursor(cursor):
+    try:
+        ts_str, kind, id_str = cursor.split('|')
+        return datetime.fromisoformat(ts_str), kind, int(id_str)
+    except (ValueError, AttributeError):
+        return None
+
 @bp.route('/centro_acciones')
 @login_required
 @permission_required('actions.center')
@@ -25,54 +86,67 @@ def centro_acciones():
 
     filtros = session.get('acciones_filtros', {})
     if not request.args:
-        filtros = {'status': 'Pendientes', 'tipo': 'Todos', 'grupo': 'Todos'}
-    elif any(arg in request.args for arg in ['fecha_inicio', 'fecha_fin', 'grupo', 'tipo', 'status']):
+        filtros = {'status': 'Pendientes', 'tipo': 'Todos', 'grupo': 'Todos', 'orden': 'recientes'}
+    elif any(arg in request.args for arg in ACCIONES_FILTER_KEYS):
         filtros = {
             'fecha_inicio': request.args.get('fecha_inicio'),
             'fecha_fin': request.args.get('fecha_fin'),
             'grupo': request.args.get('grupo'),
             'tipo': request.args.get('tipo', 'Todos'),
-            'status': request.args.get('status', 'Pendientes')
+            'status': request.args.get('status', 'Pendientes'),
+            'orden': request.args.get('orden', 'recientes')
         }
     session['acciones_filtros'] = filtros
-    items = []
-
-    query_desviaciones = db_session.query(Pronostico, Usuario.nombre_completo).join(Usuario, Pronostico.usuario_razon == Usuario.username, isouter=True).filter(Pronostico.razon_desviacion.isnot(None), Pronostico.razon_desviacion != '')
-    query_solicitudes = db_session.query(SolicitudCorreccion, Usuario.nombre_completo).join(Usuario, SolicitudCorreccion.usuario_solicitante == Usuario.username, isouter=True)
 
-    try:
-        if filtros.get('fecha_inicio'):
-            fecha_inicio = datetime.strptime(filtros['fecha_inicio'], '%Y-%m-%d').date()
-            query_desviaciones = query_desviaciones.filter(Pronostico.fecha >= fecha_inicio)
-            query_solicitudes = query_solicitudes.filter(SolicitudCorreccion.fecha_problema >= fecha_inicio)
-        if filtros.get('fecha_fin'):
-            fecha_fin = datetime.strptime(filtros['fecha_fin'], '%Y-%m-%d').date()
-            query_desviaciones = query_desviaciones.filter(Pronostico.fecha <= fecha_fin)
-            query_solicitudes = query_solicitudes.filter(SolicitudCorreccion.fecha_problema <= fecha_fin)
-    except ValueError:
+    acciones, date_error = _acciones_base_query(filtros)
+    if date_error:
         flash("Formato de fecha inválido.", "warning")
 
-    if filtros.get('grupo') and filtros.get('grupo') != 'Todos':
-        query_desviaciones = query_desviaciones.filter(Pronostico.grupo == filtros['grupo'])
-        query_solicitudes = query_solicitudes.filter(SolicitudCorreccion.grupo == filtros['grupo'])
-
     status_filter = filtros.get('status')
+    page_query = select(literal('item').label('row_type'), *acciones.c, null().label('total'))
     if status_filter == 'Pendientes':
-        query_desviaciones = query_desviaciones.filter(Pronostico.status == 'Nuevo')
-        query_solicitudes = query_solicitudes.filter(SolicitudCorreccion.status == 'Pendiente')
+        page_query = page_query.where(acciones.c.status.in_(['Nuevo', 'Pendiente']))
     elif status_filter and status_filter != 'Todos':
-        query_desviaciones = query_desviaciones.filter(Pronostico.status == status_filter)
-        query_solicitudes = query_solicitudes.filter(SolicitudCorreccion.status == status_filter)
-
-    if filtros.get('tipo', 'Todos') in ['Todos', 'Desviacion']:
-        for d, nombre in query_desviaciones.all():
-            items.append({'id': d.id, 'tipo': 'Desviación', 'timestamp': d.fecha_razon, 'fecha_evento': d.fecha, 'grupo': d.grupo, 'area': d.area, 'turno': d.turno, 'usuario': nombre or d.usuario_razon, 'detalles': d.razon_desviacion, 'status': d.status})
-    if filtros.get('tipo', 'Todos') in ['Todos', 'Correccion']:
-        for s, nombre in query_solicitudes.all():
-            items.append({'id': s.id, 'tipo': f"Corrección ({s.tipo_error})", 'timestamp': s.timestamp, 'fecha_evento': s.fecha_problema, 'grupo': s.grupo, 'area': s.area, 'turno': s.turno, 'usuario': nombre or s.usuario_solicitante, 'detalles': s.descripcion, 'status': s.status})
-    
-    items.sort(key=lambda x: x['timestamp'] if x['timestamp'] else datetime.min, reverse=True)
-    return render_template('centro_acciones.html', items=items, filtros=filtros)
+        page_query = page_query.where(acciones.c.status == status_filter)
+
+    # Cursor sobre (sort_ts, kind, id): orden total y estable entre ambas fuentes.
+    ascending = filtros.get('orden') == 'antiguos'
+    sort_cols = [acciones.c.sort_ts, acciones.c.kind, acciones.c.id]
+    cursor = _decode_accion_cursor(request.args.get('cursor'))
+    if cursor:
+        ts, kind, item_id = cursor
+        after = (lambda col, val: col > val) if ascending else (lambda col, val: col < val)
+        page_query = page_query.where(or_(
+            after(acciones.c.sort_ts, ts),
+            and_(acciones.c.sort_ts == ts, after(acciones.c.kind, kind)),
+            and_(acciones.c.sort_ts == ts, acciones.c.kind == kind, after(acciones.c.id, item_id))
+        ))
+    page_query = page_query.order_by(*[c.asc() if ascending else c.desc() for c in sort_cols]).limit(ACCIONES_PAGE_SIZE + 1).subquery()
+
+    # Los conteos por estado viajan en la misma consulta como filas adicionales del UNION.
+    counts_query = select(literal('count').label('row_type'), *[null().label(c.name) if c.name != 'status' else c for c in acciones.c],
+                          func.count().label('total')).group_by(acciones.c.status)
+    rows = db_session.execute(union_all(select(*page_query.c), counts_query)).all()
+
+    status_counts = {status: 0 for status in ACCIONES_STATUSES}
+    page_rows = []
+    for row in rows:
+        if row.row_type == 'count':
+            status_counts[row.status] = row.total
+        else:
+            page_rows.append(row)
+    page_rows.sort(key=lambda r: (r.sort_ts, r.kind, r.id), reverse=not ascending)
+    status_counts['Pendientes'] = status_counts.get('Nuevo', 0) + status_counts.get('Pendiente', 0)
+    status_counts['Todos'] = sum(v for k, v in status_counts.items() if k != 'Pendientes')
+
+    next_cursor = _encode_accion_cursor(page_rows[ACCIONES_PAGE_SIZE - 1]) if len(page_rows) > ACCIONES_PAGE_SIZE else None
+    items = []
+    for r in page_rows[:ACCIONES_PAGE_SIZE]:
+        tipo = 'Desviación' if r.kind == 'Desviacion' else f"Corrección ({r.tipo_error})"
+        items.append({'id': r.id, 'tipo': tipo, 'timestamp': r.ts, 'fecha_evento': r.fecha_evento, 'grupo': r.grupo, 'area': r.area, 'turno': r.turno, 'usuario': r.usuario, 'detalles': r.detalles, 'status': r.status})
+
+    return render_template('centro_acciones.html', items=items, filtros=filtros, status_counts=status_counts,
+                           next_cursor=next_cursor, is_first_page=cursor is None)
 
 @bp.route('/solicitar_correccion', methods=['POST'])
 @login_required
@@ -221,21 +295,13 @@ def delete_user(user_id):
             flash('El usuario no existe.', 'danger')
     return redirect(url_for('admin.manage_users'))
 
-@bp.route('/activity_log')
-@login_required
-@permission_required('logs.view')
-def activity_log():
-    if request.args.get('limpiar'):
-        session.pop('log_filtros', None)
-        return redirect(url_for('admin.activity_log'))
-        
-    filtros = session.get('log_filtros', {})
-    if request.args:
-        filtros = {'fecha_inicio': request.args.get('fecha_inicio'), 'fecha_fin': request.args.get('fecha_fin'), 'usuario': request.args.get('usuario'), 'area_grupo': request.args.get('area_grupo'), 'category': request.args.get('category'), 'severity': request.args.get('severity')}
-    session['log_filtros'] = filtros
+LOG_FILTER_KEYS = ['fecha_inicio', 'fecha_fin', 'usuario', 'area_grupo', 'category', 'severity']
+LOG_CATEGORIES = ['Autenticación', 'Datos', 'Seguridad', 'Sistema', 'General']
+LOG_SEVERITIES = ['Info', 'Warning', 'Critical', 'Error']
 
-    query = db_session.query(ActivityLog, Usuario).outerjoin(Usuario, ActivityLog.username == Usuario.username)
-    
+def _apply_log_filters(query, filtros):
+    """Aplica los filtros del log de actividad. Devuelve (query, error_de_fecha)."""
+    date_error = False
     try:
         if filtros.get('fecha_inicio'):
             query = query.filter(ActivityLog.timestamp >= datetime.strptime(filtros['fecha_inicio'], '%Y-%m-%d'))
@@ -243,17 +309,184 @@ def activity_log():
             end_date = datetime.strptime(filtros['fecha_fin'], '%Y-%m-%d') + timedelta(days=1)
             query = query.filter(ActivityLog.timestamp < end_date)
     except ValueError:
-        flash("Formato de fecha inválido.", "warning")
+        date_error = True
 
     if filtros.get('usuario'): query = query.filter(ActivityLog.username.ilike(f"%{filtros['usuario']}%"))
     if filtros.get('area_grupo') and filtros.get('area_grupo') != 'Todos': query = query.filter(ActivityLog.area_grupo == filtros['area_grupo'])
     if filtros.get('category') and filtros.get('category') != 'Todos': query = query.filter(ActivityLog.category == filtros['category'])
     if filtros.get('severity') and filtros.get('severity') != 'Todos': query = query.filter(ActivityLog.severity == filtros['severity'])
-    
-    logs = query.order_by(ActivityLog.timestamp.desc()).limit(500).all()
-    log_categories = ['Autenticación', 'Datos', 'Seguridad', 'Sistema', 'General']
-    log_severities = ['Info', 'Warning', 'Critical', 'Error']
-    return render_template('activity_log.html', logs=logs, filtros=filtros, log_categories=log_categories, log_severities=log_severities)
+    return query, date_error
+
+def _encode_log_cursor(log):
+    return f"{log.timestamp.isoformat()}_{log.id}"
+
+def _decode_log_cursor(cursor):
+    try:
+        ts_str, id_str = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(ts_str), int(id_str)
+    except (ValueError, AttributeError):
+        return None
+
+@bp.route('/activity_log')
+@login_required
+@permission_required('logs.view')
+def activity_log():
+    if request.args.get('limpiar'):
+        session.pop('log_filtros', None)
+        return redirect(url_for('admin.activity_log'))
+        
+    filtros = session.get('log_filtros', {})
+    if any(arg in request.args for arg in LOG_FILTER_KEYS):
+        filtros = {k: request.args.get(k) for k in LOG_FILTER_KEYS}
+    session['log_filtros'] = filtros
+
+    query, date_error = _apply_log_filters(db_session.query(ActivityLog), filtros)
+    if date_error:
+        flash("Formato de fecha inválido.", "warning")
+
+    # Paginación por cursor (timestamp, id): cada "Cargar más" continúa justo después
+    # del último registro mostrado sin recorrer las filas anteriores como haría OFFSET.
+    cursor = _decode_log_cursor(request.args.get('cursor'))
+    if cursor:
+        cursor_ts, cursor_id = cursor
+        query = query.filter(or_(ActivityLog.timestamp < cursor_ts,
+                                 and_(ActivityLog.timestamp == cursor_ts, ActivityLog.id < cursor_id)))
+
+    page_size = current_app.config['LOG_PAGE_SIZE']
+    page = query.order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc()).limit(page_size + 1).all()
+    next_cursor = _encode_log_cursor(page[page_size - 1]) if len(page) > page_size else None
+    page = page[:page_size]
+
+    # Los usuarios se cargan solo para la página actual en lugar de unir toda la tabla de logs.
+    usernames = {log.username for log in page if log.username}
+    usuarios = {}
+    if usernames:
+        usuarios = {u.username: u for u in db_session.query(Usuario).options(joinedload(Usuario.turno)).filter(Usuario.username.in_(usernames))}
+    logs = [(log, usuarios.get(log.username)) for log in page]
+
+    if request.args.get('partial'):
+        return jsonify({'html': render_template('partials/_activity_log_rows.html', logs=logs), 'next_cursor': next_cursor})
+    return render_template('activity_log.html', logs=logs, filtros=filtros, next_cursor=next_cursor, log_categories=LOG_CATEGORIES, log_severities=LOG_SEVERITIES)
+
+EXPORT_COLUMNS = ['timestamp', 'username', 'action', 'details', 'area_grupo', 'ip_address', 'category', 'severity']
+EXPORT_BATCH_SIZE = 2000
+
+def _measure_export(chunks, kind):
+    started, size = time.perf_counter(), 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    observe_export(kind, started, size)
+
+def _iter_log_export(statement, fmt):
+    """Genera el export fila por fila con un cursor del lado del servidor."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(EXPORT_COLUMNS)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE).execute(statement)
+        for count, row in enumerate(result, start=1):
+            record = dict(row._mapping)
+            record['timestamp'] = record['timestamp'].isoformat() if record['timestamp'] else None
+            if fmt == 'csv':
+                writer.writerow([record[col] for col in EXPORT_COLUMNS])
+            else:
+                buffer.write(json.dumps(record, ensure_ascii=False) + '\n')
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 produce formato gzip
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+@bp.route('/activity_log/export')
+@login_required
+@permission_required('logs.view')
+def export_activity_log():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        abort(400)
+    use_gzip = request.args.get('gzip') in ('1', 'true')
+
+    filtros = session.get('log_filtros', {})
+    if any(arg in request.args for arg in LOG_FILTER_KEYS):
+        filtros = {k: request.args.get(k) for k in LOG_FILTER_KEYS}
+    statement, date_error = _apply_log_filters(select(*[ActivityLog.__table__.c[col] for col in EXPORT_COLUMNS]), filtros)
+    if date_error:
+        flash("Formato de fecha inválido.", "warning")
+        return redirect(url_for('admin.activity_log'))
+    statement = statement.order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc())
+
+    log_activity("Exportación Log de Actividad", f"Formato: {fmt}{' (gzip)' if use_gzip else ''}. Filtros: {json.dumps(filtros, ensure_ascii=False)}", 'ADMIN', 'Seguridad', 'Info')
+
+    chunks = _iter_log_export(statement, fmt)
+    filename = f"activity_log_{datetime.utcnow():%Y%m%d_%H%M%S}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if use_gzip:
+        chunks = _gzip_stream(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    response = Response(stream_with_context(_measure_export(chunks, f'activity_log_{fmt}')), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/metrics')
+@login_required
+@permission_required('admin.access')
+def metrics():
+    return render_template('metrics.html', stats=instrumentation.get_endpoint_stats(),
+                           window=current_app.config['METRICS_WINDOW'], slow_query_ms=current_app.config['SLOW_QUERY_MS'])
+
+@bp.route('/metrics/reset', methods=['POST'])
+@login_required
+@permission_required('admin.access')
+@csrf_required
+def reset_metrics():
+    instrumentation.reset_endpoint_stats()
+    flash("Métricas reiniciadas.", "success")
+    return redirect(url_for('admin.metrics'))
+
+@bp.route('/profiles')
+@login_required
+@permission_required('admin.access')
+def profiles():
+    return render_template('profiles.html', profiles=profiling.store.list(),
+                           enabled=current_app.config['PROFILING_ENABLED'],
+                           sample_rate=current_app.config['PROFILING_SAMPLE_RATE'],
+                           header=current_app.config['PROFILING_HEADER'])
+
+@bp.route('/profiles/clear', methods=['POST'])
+@login_required
+@permission_required('admin.access')
+@csrf_required
+def clear_profiles():
+    profiling.store.clear()
+    flash("Perfiles eliminados.", "success")
+    return redirect(url_for('admin.profiles'))
+
+@bp.route('/profiles/<int:profile_id>.<fmt>')
+@login_required
+@permission_required('admin.access')
+def download_profile(profile_id, fmt):
+    profile = profiling.store.get(profile_id)
+    if profile is None or fmt not in ('pstats', 'speedscope.json'):
+        flash("El perfil solicitado ya no está disponible.", "warning")
+        return redirect(url_for('admin.profiles'))
+    if fmt == 'pstats':
+        body, mimetype = profiling.to_pstats(profile), 'application/octet-stream'
+    else:
+        body, mimetype = profiling.to_speedscope(profile), 'application/json'
+    filename = f"perfil_{profile['endpoint']}_{profile['started_at'].strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 @bp.route('/roles', methods=['GET', 'POST'])
 @login_required
@@ -0,0 +1,96 @@
+import time
+import threading
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from .metrics import CACHE_REQUESTS
+from .singleflight import SingleFlight
+
+
+class TTLCache:
+    """Caché en memoria del proceso con expiración por entrada.
+
+    Cada acierto o fallo se cuenta en `nidec_cache_requests_total{cache=<name>}`. Los fallos
+    concurrentes de una misma clave en `get_or_set` se calculan una sola vez (app/singleflight.py);
+    con `shared=True` también entre workers si SINGLEFLIGHT_SHARED_DIR está configurado.
+    """
+    def __init__(self, name, ttl, max_entries=1024, shared=False):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight(name, shared=shared)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                CACHE_REQUESTS.inc(cache=self.name, result='hit')
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+        CACHE_REQUESTS.inc(cache=self.name, result='miss')
+        return default
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                self._evict()
+            self._data[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+
+    def get_or_set(self, key, factory, ttl=None):
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = self._flight.do(key, lambda: self._fill(key, factory, ttl))
+        return value
+
+    def _fill(self, key, factory, ttl):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]  # lo llenó otra llamada entre el fallo y el inicio del cálculo
+        value = factory()
+        self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [k for k, (expires, _) in self._data.items() if expires <= now]
+        for k in expired:
+            del self._data[k]
+        if len(self._data) >= self.max_entries:
+            # Sin expirados: se descarta la entrada que vence antes.
+            del self._data[min(self._data, key=lambda k: self._data[k][0])]
+
+
+FRAGMENT_CACHE = TTLCache('fragmentos', ttl=3600, max_entries=256)
+
+
+class FragmentCacheExtension(Extension):
+    """`{% cache 'nombre', clave, ... %}...{% endcache %}` guarda el HTML ya renderizado del bloque.
+
+    La clave debe incluir todo lo que cambia el contenido (fecha, versión de los datos); no hay
+    invalidación: al cambiar los datos cambia la clave y la entrada vieja vence por TTL.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(key)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        return FRAGMENT_CACHE.get_or_set(tuple(key), caller)
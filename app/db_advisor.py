@@ -0,0 +1,151 @@
+# app/db_advisor.py
+"""EXPLAIN sobre las consultas canónicas de la aplicación (`flask db-advise`).
+
+Cada consulta reproduce la forma de una de app/services.py, app/admin.py o el contador de
+acciones de la barra lateral. Se reportan los recorridos secuenciales, los ordenamientos en
+tablas temporales y los índices declarados en models.py que faltan en la base actual.
+"""
+import json
+from datetime import timedelta
+
+from sqlalchemy import select, func, inspect, desc
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.ext.compiler import compiles
+
+from . import engine
+from .models import Base, Pronostico, ProduccionCaptura, OutputData, ActivityLog, DIALECT_ONLY_INDEXES
+from .migrations import OBSOLETE_INDEXES
+from .utils import get_business_date
+
+
+class Explain(Executable, ClauseElement):
+    """Envuelve una sentencia para ejecutarla con EXPLAIN conservando sus parámetros tipados."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = 'EXPLAIN (FORMAT JSON) ' if compiler.dialect.name == 'postgresql' else 'EXPLAIN QUERY PLAN '
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def canonical_queries(group='IHP', area='Cuerpos', fecha=None):
+    """(nombre, origen, sentencia) de las consultas que sostienen dashboard, captura y reportes."""
+    fecha = fecha or get_business_date()
+    inicio, fin = fecha.replace(day=1), fecha
+    semana = fecha - timedelta(days=6)
+    return [
+        ('rendimiento_pronostico', 'services.get_group_performance',
+         select(func.sum(Pronostico.valor_pronostico)).where(Pronostico.grupo == group, Pronostico.fecha.between(inicio, fin))),
+        ('rendimiento_produccion', 'services.get_group_performance',
+         select(func.sum(ProduccionCaptura.valor_producido)).where(ProduccionCaptura.grupo == group, ProduccionCaptura.fecha.between(inicio, fin))),
+        ('rendimiento_output', 'services.get_group_performance',
+         select(func.sum(OutputData.output)).where(OutputData.grupo == group, OutputData.fecha.between(inicio, fin))),
+        ('area_dia_pronostico', 'services.get_daily_area_summary',
+         select(func.sum(Pronostico.valor_pronostico)).where(
+             Pronostico.grupo == group, Pronostico.fecha == fecha, Pronostico.area == area)),
+        ('area_dia_produccion', 'services.get_daily_area_summary',
+         select(func.sum(ProduccionCaptura.valor_producido)).where(
+             ProduccionCaptura.grupo == group, ProduccionCaptura.fecha == fecha, ProduccionCaptura.area == area)),
+        ('captura_pronosticos', 'services.get_capture_state',
+         select(Pronostico.area, Pronostico.turno, Pronostico.valor_pronostico, Pronostico.version).where(
+             Pronostico.fecha == fecha, Pronostico.grupo == group)),
+        ('captura_produccion', 'services.get_capture_state',
+         select(ProduccionCaptura.area, ProduccionCaptura.hora, ProduccionCaptura.valor_producido).where(
+             ProduccionCaptura.fecha == fecha, ProduccionCaptura.grupo == group)),
+        ('captura_output', 'services.get_capture_state',
+         select(OutputData.pronostico, OutputData.output).where(OutputData.fecha == fecha, OutputData.grupo == group)),
+        ('detalle_dia', 'services.get_detailed_performance_data',
+         select(Pronostico).where(Pronostico.fecha == fecha)),
+        ('reporte_pronostico_por_dia', 'services._get_period_data_optimized',
+         select(Pronostico.fecha, func.sum(Pronostico.valor_pronostico)).where(
+             Pronostico.grupo == group, Pronostico.fecha.between(semana, fin), Pronostico.area == area).group_by(Pronostico.fecha)),
+        ('reporte_produccion_por_dia', 'services._get_period_data_optimized',
+         select(ProduccionCaptura.fecha, func.sum(ProduccionCaptura.valor_producido)).where(
+             ProduccionCaptura.grupo == group, ProduccionCaptura.fecha.between(semana, fin)).group_by(ProduccionCaptura.fecha)),
+        ('reporte_output_por_dia', 'services._get_period_data_optimized',
+         select(OutputData.fecha, func.sum(OutputData.output)).where(
+             OutputData.grupo == group, OutputData.fecha.between(semana, fin)).group_by(OutputData.fecha)),
+        ('acciones_pendientes', 'inject_global_vars',
+         select(func.count(Pronostico.id)).where(
+             Pronostico.status == 'Nuevo', Pronostico.razon_desviacion.isnot(None), Pronostico.razon_desviacion != '')),
+        ('bitacora_reciente', 'admin.activity_log',
+         select(ActivityLog.id).order_by(desc(ActivityLog.timestamp), desc(ActivityLog.id)).limit(50)),
+        ('bitacora_por_area', 'admin.activity_log',
+         select(ActivityLog.id).where(ActivityLog.area_grupo == group).order_by(
+             desc(ActivityLog.timestamp), desc(ActivityLog.id)).limit(50)),
+    ]
+
+
+def _sqlite_findings(rows):
+    plan, findings = [], []
+    for row in rows:
+        detail = row[-1]
+        plan.append(detail)
+        # "SCAN tabla" sin índice es un recorrido completo; "SCAN tabla USING INDEX" recorre un índice entero.
+        if detail.startswith('SCAN ') and 'USING' not in detail:
+            findings.append(f"Recorrido secuencial: {detail}")
+        elif detail.startswith('SCAN ') and 'COVERING INDEX' not in detail:
+            findings.append(f"Recorrido completo de índice: {detail}")
+        elif 'USE TEMP B-TREE' in detail:
+            findings.append(f"Ordenamiento temporal: {detail}")
+    return plan, findings
+
+
+def _postgres_findings(rows):
+    plan, findings = [], []
+
+    def walk(node, depth=0):
+        relation = node.get('Relation Name')
+        label = node['Node Type'] + (f" on {relation}" if relation else '')
+        if node.get('Index Name'):
+            label += f" using {node['Index Name']}"
+        plan.append('  ' * depth + label)
+        if node['Node Type'] == 'Seq Scan':
+            findings.append(f"Recorrido secuencial: {label} (filas estimadas: {node.get('Plan Rows')})")
+        elif node['Node Type'] == 'Sort':
+            findings.append(f"Ordenamiento: {', '.join(node.get('Sort Key', []))}")
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    document = rows[0][0]
+    if isinstance(document, str):
+        document = json.loads(document)
+    walk(document[0]['Plan'])
+    return plan, findings
+
+
+def explain_queries(queries):
+    """Devuelve una lista de dicts {nombre, origen, plan, hallazgos} en el orden de `queries`."""
+    parse = _postgres_findings if engine.dialect.name == 'postgresql' else _sqlite_findings
+    results = []
+    with engine.connect() as conn:
+        for name, source, statement in queries:
+            try:
+                plan, findings = parse(conn.execute(Explain(statement)).all())
+            except SQLAlchemyError as e:
+                # Típicamente una columna que aún no existe porque falta `flask init-db`.
+                conn.rollback()
+                plan, findings = [], [f"No se pudo analizar: {e.orig if getattr(e, 'orig', None) else e}"]
+            results.append({'nombre': name, 'origen': source, 'plan': plan, 'hallazgos': findings})
+    return results
+
+
+def index_report():
+    """Índices declarados que faltan y los marcados como obsoletos que siguen en la base."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    missing, obsolete = [], []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        missing += [f"{table.name}.{ix.name} ({', '.join(c.name for c in ix.columns)})"
+                    for ix in table.indexes if ix.name not in existing
+                    and DIALECT_ONLY_INDEXES.get(ix.name, engine.dialect.name) == engine.dialect.name]
+        obsolete += [f"{table.name}.{name}" for name in OBSOLETE_INDEXES.get(table.name, []) if name in existing]
+    return missing, obsolete
@@ -0,0 +1,83 @@
+# app/dimensions.py
+"""Códigos enteros fijos para grupo, área, turno y hora de las tablas de producción.
+
+Los códigos se guardan como SMALLINT y nunca deben reutilizarse ni cambiar de significado:
+las tablas `dim_*` se siembran desde aquí y los datos existentes se migran con estos valores.
+Para agregar un área nueva se le asigna el siguiente código libre.
+"""
+from sqlalchemy.types import TypeDecorator, SmallInteger
+
+GRUPOS = {1: 'IHP', 2: 'FHP'}
+
+AREAS = {
+    1: 'Soporte', 2: 'Servicio', 3: 'Cuerpos', 4: 'Flechas', 5: 'Misceláneos', 6: 'Embobinado',
+    7: 'ECC', 8: 'ERF', 9: 'Carga', 10: 'Rotores Inyección', 11: 'Rotores ERF', 12: 'Barniz', 13: 'Pintura',
+}
+
+TURNOS = {1: 'Turno A', 2: 'Turno B', 3: 'Turno C'}
+
+# Hora -> (nombre, código de turno). El orden de los códigos es el orden del día productivo.
+HORAS = {
+    1: ('10AM', 1), 2: ('1PM', 1), 3: ('4PM', 1),
+    4: ('7PM', 2), 5: ('10PM', 2), 6: ('12AM', 2),
+    7: ('3AM', 3), 8: ('6AM', 3),
+}
+
+DIMENSIONS = {
+    'grupo': GRUPOS,
+    'area': AREAS,
+    'turno': TURNOS,
+    'hora': {code: nombre for code, (nombre, _) in HORAS.items()},
+}
+
+CODES = {dim: {nombre: code for code, nombre in names.items()} for dim, names in DIMENSIONS.items()}
+
+# Búsqueda directa hora -> turno, en lugar de recorrer HORAS_TURNO.
+TURNO_DE_HORA = {nombre: TURNOS[turno] for nombre, turno in HORAS.values()}
+
+
+# Código para nombres sin catálogo: un filtro por ellos no encuentra filas (como antes con texto).
+# Las altas y ediciones del ORM los rechazan antes de llegar a la base (reject_unknown en models.py):
+# SQLite, sin PRAGMA foreign_keys, guardaría el -1 sin que la llave foránea a dim_* lo impida.
+UNKNOWN_CODE = -1
+
+
+def encode(dimension, value):
+    if value is None or isinstance(value, int):
+        return value
+    return CODES[dimension].get(value, UNKNOWN_CODE)
+
+
+def check_known(dimension, value):
+    """ValueError si `value` es un nombre sin código en el catálogo de `dimension`."""
+    if encode(dimension, value) == UNKNOWN_CODE:
+        raise ValueError(f"Valor de {dimension} desconocido: {value!r}")
+
+
+def decode(dimension, code):
+    if code is None:
+        return None
+    return DIMENSIONS[dimension].get(code, code)
+
+
+class DimensionCode(TypeDecorator):
+    """Columna SMALLINT que en Python se lee y escribe con el nombre ('IHP', 'Turno A', '10AM'...).
+
+    Así los filtros existentes (`Pronostico.grupo == 'IHP'`) siguen funcionando mientras la base
+    guarda y compara enteros.
+    """
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, dimension):
+        super().__init__()
+        self.dimension = dimension
+
+    def process_bind_param(self, value, dialect):
+        return encode(self.dimension, value)
+
+    def process_result_value(self, value, dialect):
+        return decode(self.dimension, value)
+
+    def process_literal_param(self, value, dialect):
+        return str(encode(self.dimension, value))
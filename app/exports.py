@@ -0,0 +1,255 @@
+# app/exports.py
+"""Exportaciones en segundo plano.
+
+`POST /exports/<kind>` registra un ExportJob y responde de inmediato con su id; un pool de hilos
+del propio worker genera el archivo en EXPORT_DIR y el navegador consulta el estado hasta que
+puede descargarlo. El estado vive en la tabla export_jobs, así que cualquier worker de gunicorn
+contesta el sondeo; el archivo queda en el disco de la instancia que lo generó.
+
+Una solicitud igual (mismo tipo y parámetros) a un job pendiente, o a uno que terminó hace menos
+de EXPORT_REUSE_SECONDS, devuelve ese mismo job en lugar de generar otro archivo. El job
+cleanup_exports de app/scheduler.py borra los archivos y sus jobs al cumplir EXPORT_TTL_SECONDS y
+marca como Error los que no terminan en EXPORT_JOB_TIMEOUT_SECONDS (p. ej. porque el worker se
+reinició); mientras tanto, un job así ya no se reutiliza y su consulta de estado responde Error.
+Sin el scheduler (SCHEDULER_ENABLED=0), la limpieza corre al encolar, como mucho una vez por
+CLEANUP_INTERVAL_SECONDS en cada proceso.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import Blueprint, current_app, jsonify, request, send_file, session, url_for
+from sqlalchemy import or_, and_
+
+from . import db_session
+from .decorators import login_required, csrf_required
+from .metrics import registry, observe_export
+from .models import ExportJob, ActivityLog
+
+bp = Blueprint('exports', __name__)
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+ACTIVE_STATUSES = ('Pendiente', 'Procesando')
+TIMEOUT_ERROR = 'La exportación no terminó a tiempo.'
+CLEANUP_INTERVAL_SECONDS = 60
+
+ExportKind = namedtuple('ExportKind', 'kind builder permission download_name log_action area_grupo detail empty_message mimetype params')
+
+# kind -> ExportKind; cada módulo registra sus exportaciones al importarse.
+EXPORT_KINDS = {}
+
+EXPORT_JOBS = registry.counter('nidec_export_jobs_total', 'Solicitudes de exportación en segundo plano por resultado.', ('kind', 'result'))
+
+_executor = None
+_submit_lock = threading.Lock()
+_cleanup_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+def register_export(kind, builder, permission, download_name, log_action, area_grupo=None,
+                    detail='{} registros exportados.', empty_message='No hay datos para exportar.', mimetype=XLSX_MIMETYPE, params=None):
+    """Registra `builder(output, **params)`, que escribe el archivo y devuelve cuántas filas exportó (0 si ninguna).
+
+    `params(datos_del_cliente)` valida y normaliza los parámetros (lanza ValueError con el mensaje
+    para el usuario); sin él la exportación no acepta parámetros. `download_name` puede usarlos
+    como campos de formato, p. ej. 'Reporte_{desde}.xlsx'.
+    """
+    EXPORT_KINDS[kind] = ExportKind(kind, builder, permission, download_name, log_action, area_grupo, detail, empty_message, mimetype, params)
+
+
+def has_permission(permission):
+    return session.get('role') in ['ADMIN', 'ARTISAN'] or permission in session.get('permissions', [])
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=app.config['EXPORT_WORKERS'], thread_name_prefix='export')
+    return _executor
+
+
+def _job_path(app, job):
+    extension = os.path.splitext(EXPORT_KINDS[job.kind].download_name)[1]
+    return os.path.join(app.config['EXPORT_DIR'], f"{job.id}{extension}")
+
+
+def _serialize_params(params):
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def submit_export(kind, params=None):
+    """Encola una exportación o devuelve la equivalente en curso/recién terminada: (job, es_nuevo)."""
+    app = current_app._get_current_object()
+    params = params or {}
+    serialized = _serialize_params(params)
+    params_key = hashlib.sha1(serialized.encode()).hexdigest()
+    now = datetime.utcnow()
+    if not app.config['SCHEDULER_ENABLED']:
+        _throttled_cleanup(app)
+    with _submit_lock:
+        reuse_since = now - timedelta(seconds=app.config['EXPORT_REUSE_SECONDS'])
+        active_since = now - timedelta(seconds=app.config['EXPORT_JOB_TIMEOUT_SECONDS'])
+        job = db_session.query(ExportJob).filter(
+            ExportJob.kind == kind, ExportJob.params_key == params_key,
+            or_(and_(ExportJob.status.in_(ACTIVE_STATUSES), ExportJob.created_at >= active_since),
+                and_(ExportJob.status == 'Listo', ExportJob.finished_at >= reuse_since))
+        ).order_by(ExportJob.created_at.desc()).first()
+        if job is not None:
+            EXPORT_JOBS.inc(kind=kind, result='dedup')
+            return job, False
+        job = ExportJob(id=uuid.uuid4().hex, kind=kind, params_key=params_key, params=serialized, status='Pendiente',
+                        username=session.get('username'), created_at=now)
+        db_session.add(job)
+        db_session.commit()
+    _get_executor(app).submit(_run_export, app, job.id, params)
+    return job, True
+
+
+def _throttled_cleanup(app):
+    """cleanup_exports como mucho una vez por CLEANUP_INTERVAL_SECONDS; si otro hilo ya limpia, no espera."""
+    global _last_cleanup
+    if time.monotonic() - _last_cleanup < CLEANUP_INTERVAL_SECONDS or not _cleanup_lock.acquire(blocking=False):
+        return
+    try:
+        _last_cleanup = time.monotonic()
+        cleanup_exports(app)
+    finally:
+        _cleanup_lock.release()
+
+
+def _log(job, action, details, area_grupo, category='General', severity='Info'):
+    # Fuera de la petición no hay session/request para log_activity: se registra a nombre de quien pidió el archivo.
+    db_session.add(ActivityLog(timestamp=datetime.utcnow(), username=job.username or 'Sistema', action=action,
+                               details=details, area_grupo=area_grupo, category=category, severity=severity))
+
+
+def _run_export(app, job_id, params):
+    started = time.perf_counter()
+    with app.app_context():
+        job = db_session.get(ExportJob, job_id)
+        spec = EXPORT_KINDS[job.kind]
+        path = _job_path(app, job)
+        root, extension = os.path.splitext(path)
+        tmp_path = f"{root}.tmp{extension}"  # pandas elige el motor por la extensión
+        try:
+            job.status = 'Procesando'
+            db_session.commit()
+            os.makedirs(app.config['EXPORT_DIR'], exist_ok=True)
+            exported = spec.builder(tmp_path, **params)
+            if exported:
+                os.replace(tmp_path, path)
+                job.status, job.size_bytes = 'Listo', os.path.getsize(path)
+                job.detalle = spec.detail.format(exported)
+                observe_export(spec.kind, started, job.size_bytes)
+                _log(job, spec.log_action, job.detalle, spec.area_grupo)
+            else:
+                job.status, job.detalle = 'Sin datos', spec.empty_message
+            job.finished_at = datetime.utcnow()
+            db_session.commit()
+            EXPORT_JOBS.inc(kind=spec.kind, result='ok' if exported else 'empty')
+        except Exception as e:
+            db_session.rollback()
+            app.logger.error(f"Error en la exportación {job_id} ({spec.kind}): {e}")
+            job = db_session.get(ExportJob, job_id)
+            job.status, job.error, job.finished_at = 'Error', str(e), datetime.utcnow()
+            _log(job, f"Error {spec.log_action}", str(e), None, 'Sistema', 'Error')
+            db_session.commit()
+            EXPORT_JOBS.inc(kind=spec.kind, result='error')
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            db_session.remove()
+
+
+def cleanup_exports(app):
+    """Borra los archivos y jobs vencidos y da por fallidos los que se quedaron sin terminar."""
+    now = datetime.utcnow()
+    ttl = app.config['EXPORT_TTL_SECONDS']
+    removed = 0
+    if os.path.isdir(app.config['EXPORT_DIR']):
+        for entry in os.scandir(app.config['EXPORT_DIR']):
+            if entry.is_file() and entry.stat().st_mtime < time.time() - ttl:
+                os.remove(entry.path)
+                removed += 1
+    db_session.query(ExportJob).filter(ExportJob.created_at < now - timedelta(seconds=ttl)).delete(synchronize_session=False)
+    db_session.query(ExportJob).filter(
+        ExportJob.status.in_(ACTIVE_STATUSES),
+        ExportJob.created_at < now - timedelta(seconds=app.config['EXPORT_JOB_TIMEOUT_SECONDS'])
+    ).update({'status': 'Error', 'error': TIMEOUT_ERROR, 'finished_at': now}, synchronize_session=False)
+    db_session.commit()
+    return removed
+
+
+def _job_payload(job):
+    payload = {
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'detalle': job.detalle,
+        'error': job.error,
+        'status_url': url_for('exports.export_status', job_id=job.id),
+    }
+    if job.status == 'Listo':
+        payload['download_url'] = url_for('exports.download_export', job_id=job.id)
+        payload['size_bytes'] = job.size_bytes
+    return payload
+
+
+def _get_job_or_error(job_id):
+    job = db_session.get(ExportJob, job_id)
+    if job is None:
+        return None, (jsonify({'status': 'error', 'message': 'La exportación no existe o ya expiró.'}), 404)
+    if not has_permission(EXPORT_KINDS[job.kind].permission):
+        return None, (jsonify({'status': 'error', 'message': 'No tienes permiso para esta exportación.'}), 403)
+    return job, None
+
+
+@bp.route('/<kind>', methods=['POST'])
+@login_required
+@csrf_required
+def submit(kind):
+    spec = EXPORT_KINDS.get(kind)
+    if spec is None:
+        return jsonify({'status': 'error', 'message': f"Tipo de exportación desconocido: {kind}"}), 404
+    if not has_permission(spec.permission):
+        return jsonify({'status': 'error', 'message': 'No tienes permiso para esta exportación.'}), 403
+    try:
+        params = spec.params(request.get_json(silent=True) or {}) if spec.params else {}
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    job, _ = submit_export(kind, params)
+    return jsonify(_job_payload(job)), 202
+
+
+@bp.route('/job/<job_id>')
+@login_required
+def export_status(job_id):
+    job, error = _get_job_or_error(job_id)
+    if error:
+        return error
+    timeout = timedelta(seconds=current_app.config['EXPORT_JOB_TIMEOUT_SECONDS'])
+    if job.status in ACTIVE_STATUSES and job.created_at < datetime.utcnow() - timeout:
+        # El worker que la generaba se reinició: se da por fallida sin esperar al scheduler.
+        job.status, job.error, job.finished_at = 'Error', TIMEOUT_ERROR, datetime.utcnow()
+        db_session.commit()
+    return jsonify(_job_payload(job))
+
+
+@bp.route('/job/<job_id>/descarga')
+@login_required
+def download_export(job_id):
+    job, error = _get_job_or_error(job_id)
+    if error:
+        return error
+    path = _job_path(current_app, job)
+    if job.status != 'Listo' or not os.path.exists(path):
+        return jsonify({'status': 'error', 'message': 'El archivo no está disponible.'}), 409 if job.status in ACTIVE_STATUSES else 410
+    spec = EXPORT_KINDS[job.kind]
+    download_name = spec.download_name.format(**json.loads(job.params or '{}'))
+    return send_file(path, mimetype=spec.mimetype, as_attachment=True, download_name=download_name)
@@ -0,0 +1,369 @@
+# app/ingest.py
+"""Ingesta de contadores de máquina (PLC) hacia ProduccionCaptura.
+
+`POST /api/contadores` recibe lotes NDJSON, un evento por línea:
+
+    {"ts": "2026-10-19T09:12:30-06:00", "grupo": "IHP", "area": "Cuerpos", "piezas": 12}
+
+y se autentica con `Authorization: Bearer <token>` (INGEST_TOKENS = "linea1:token1,linea2:token2";
+el nombre queda como usuario_captura). Cada evento suma sus piezas a la celda (día hábil, grupo,
+área, hora de captura) de su `ts`: la hora es la primera de HORAS_TURNO que aún no pasa, y lo que
+llega entre las 6:00 y el corte de las 7:00 va a '6AM'. Los `ts` sin zona son hora de planta.
+
+El lote se agrega en memoria y se escribe en una sola línea de un archivo de diario propio del
+worker (INGEST_DIR) antes de responder, así que un 202 no se pierde aunque el worker muera. Un hilo
+vacía lo pendiente cada INGEST_FLUSH_SECONDS, o antes si se juntan INGEST_FLUSH_EVENTS eventos,
+con upserts por bloques (ON CONFLICT ... valor_producido + piezas) y un solo commit; después borra
+los diarios que cubrió. Los diarios de workers muertos se recuperan al arrancar el hilo o con
+`flask ingest-flush`. Si el proceso muere entre el commit y el borrado del diario, ese bloque se
+volvería a sumar: la ventana es de microsegundos y se acepta.
+"""
+import os
+import json
+import time
+import hmac
+import atexit
+import bisect
+import threading
+from datetime import datetime, timedelta
+
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import exc, func
+
+from . import db_session, rollups
+from .dimensions import HORAS
+from .metrics import registry
+from .models import ProduccionCaptura, dialect_insert
+from .utils import AREAS_IHP, AREAS_FHP, get_business_date, now_mexico
+
+bp = Blueprint('ingest', __name__)
+
+AREAS_POR_GRUPO = {'IHP': frozenset(a for a in AREAS_IHP if a != 'Output'),
+                   'FHP': frozenset(a for a in AREAS_FHP if a != 'Output')}
+MAX_ERRORES_RESPUESTA = 20
+UPSERT_CHUNK = 500
+
+INGEST_EVENTS = registry.counter('nidec_ingest_events_total', 'Eventos de contadores recibidos por resultado.', ('result',))
+INGEST_FLUSHES = registry.counter('nidec_ingest_flushes_total', 'Vaciados de la ingesta de contadores por resultado.', ('result',))
+INGEST_FLUSH_SECONDS = registry.histogram('nidec_ingest_flush_seconds', 'Duración de cada vaciado de la ingesta a la base.')
+
+
+def _hora_relativa(nombre):
+    """Horas desde el corte de las 7:00 hasta la hora de captura: '10AM' -> 3, '12AM' -> 17, '6AM' -> 23."""
+    value, suffix = int(nombre[:-2]), nombre[-2:]
+    return (value % 12 + (12 if suffix == 'PM' else 0) - 7) % 24
+
+
+_HORAS_CAPTURA = [nombre for _, (nombre, _) in sorted(HORAS.items())]
+_LIMITES = [_hora_relativa(nombre) for nombre in _HORAS_CAPTURA]
+
+
+def get_capture_hour(local_dt):
+    """Hora de captura de HORAS_TURNO a la que pertenece un instante en hora de planta."""
+    relativa = (local_dt.hour - 7) % 24 + local_dt.minute / 60 + local_dt.second / 3600
+    return _HORAS_CAPTURA[min(bisect.bisect_right(_LIMITES, relativa), len(_HORAS_CAPTURA) - 1)]
+
+
+def parse_event(line, now):
+    """Evento NDJSON -> ((fecha, grupo, area, hora), piezas); lanza ValueError con el motivo."""
+    try:
+        event = json.loads(line)
+    except ValueError:
+        raise ValueError("JSON inválido.")
+    if not isinstance(event, dict):
+        raise ValueError("Cada línea debe ser un objeto.")
+    grupo, area, piezas = event.get('grupo'), event.get('area'), event.get('piezas')
+    if grupo not in AREAS_POR_GRUPO:
+        raise ValueError(f"Grupo desconocido: {grupo}")
+    if area not in AREAS_POR_GRUPO[grupo]:
+        raise ValueError(f"Área desconocida para {grupo}: {area}")
+    if not isinstance(piezas, int) or isinstance(piezas, bool) or piezas < 0:
+        raise ValueError("'piezas' debe ser un entero no negativo.")
+    try:
+        ts = datetime.fromisoformat(event.get('ts') or '')
+    except (TypeError, ValueError):
+        raise ValueError("'ts' debe ser una fecha ISO 8601.")
+    ts = ts.astimezone(now.tzinfo) if ts.tzinfo else ts.replace(tzinfo=now.tzinfo)
+    if ts > now + timedelta(minutes=10):
+        raise ValueError("'ts' está en el futuro.")
+    if ts < now - timedelta(days=_settings['max_age_days']):
+        raise ValueError(f"'ts' tiene más de {_settings['max_age_days']} días.")
+    return (get_business_date(ts), grupo, area, get_capture_hour(ts)), piezas
+
+
+_settings = {'dir': None, 'tokens': {}, 'flush_seconds': 5.0, 'flush_events': 5000, 'max_age_days': 7, 'fsync': True, 'max_bytes': 10 * 1024 * 1024}
+
+
+def configure(directory, tokens='', flush_seconds=5.0, flush_events=5000, max_age_days=7, fsync=True, max_bytes=10 * 1024 * 1024):
+    parsed = {}
+    for item in (tokens or '').split(','):
+        nombre, _, token = item.strip().partition(':')
+        if nombre and token:
+            parsed[token] = nombre
+    _settings.update(dir=directory, tokens=parsed, flush_seconds=flush_seconds, flush_events=flush_events,
+                     max_age_days=max_age_days, fsync=fsync, max_bytes=max_bytes)
+
+
+def _source_for_request():
+    """Nombre de la fuente dueña del token Bearer, o None."""
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer '):
+        return None
+    given = auth[len('Bearer '):].strip()
+    for token, nombre in _settings['tokens'].items():
+        if hmac.compare_digest(given, token):
+            return nombre
+    return None
+
+
+class _Buffer:
+    """Piezas pendientes por celda y los diarios que las respaldan, de este worker."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self.pending = {}      # (fecha, grupo, area, hora) -> [piezas, fuente]
+        self.events = 0
+        self.sealed = []       # diarios cuyos datos están en `pending`, además del actual
+        self._segment = None
+        self._fd = None
+        self._seq = 0
+        self._thread = None
+        self._app = None
+
+    # --- Diario ---
+    def _open_segment(self):
+        self._seq += 1
+        self._segment = os.path.join(_settings['dir'], f"{os.getpid()}-{int(time.time())}-{self._seq}.ndjson")
+        self._fd = os.open(self._segment, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def _rotate(self):
+        """Cierra el diario actual (el siguiente lote abre otro); devuelve los diarios que cubren lo pendiente."""
+        segments = self.sealed + ([self._segment] if self._segment else [])
+        if self._fd is not None:
+            os.close(self._fd)
+        self._segment, self._fd, self.sealed = None, None, []
+        return segments
+
+    def _merge(self, cells, fuente=None):
+        for key, value in cells.items():
+            piezas, origen = value if isinstance(value, list) else (value, fuente)
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = [piezas, origen]
+            else:
+                entry[0] += piezas
+                entry[1] = origen
+
+    # --- API ---
+    def add(self, cells, events, fuente):
+        """Escribe el lote (ya agregado) en el diario y lo suma a lo pendiente."""
+        record = json.dumps({'fuente': fuente, 'celdas': [[k[0].isoformat(), k[1], k[2], k[3], v] for k, v in cells.items()]},
+                            separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._fd is None:
+                self._open_segment()
+            os.write(self._fd, record.encode())
+            if _settings['fsync']:
+                os.fsync(self._fd)
+            self._merge(cells, fuente)
+            self.events += events
+            full = self.events >= _settings['flush_events']
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Vacía lo pendiente a la base; devuelve cuántas celdas escribió. Si falla, todo queda pendiente."""
+        with self._flush_lock:
+            with self._lock:
+                if not self.pending:
+                    for path in self.sealed:  # diarios recuperados que no traían celdas
+                        os.remove(path)
+                    self.sealed = []
+                    return 0
+                data, self.pending, self.events = self.pending, {}, 0
+                segments = self._rotate()
+            started = time.perf_counter()
+            try:
+                _upsert(data)
+            except Exception:
+                with self._lock:
+                    self._merge(data)
+                    self.sealed = segments + self.sealed
+                INGEST_FLUSHES.inc(result='error')
+                raise
+            finally:
+                INGEST_FLUSH_SECONDS.observe(time.perf_counter() - started)
+            for path in segments:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            INGEST_FLUSHES.inc(result='ok')
+            return len(data)
+
+    def recover(self):
+        """Toma los diarios de workers que ya no existen y suma su contenido a lo pendiente."""
+        recovered = 0
+        if not os.path.isdir(_settings['dir']):
+            return 0
+        for entry in os.scandir(_settings['dir']):
+            if not entry.name.endswith('.ndjson') or entry.path == self._segment or entry.path in self.sealed:
+                continue
+            try:
+                pid = int(entry.name.split('-', 1)[0])
+            except ValueError:
+                continue
+            if pid == os.getpid() or _pid_alive(pid):
+                continue
+            with self._lock:
+                self._seq += 1
+                claimed = os.path.join(_settings['dir'], f"{os.getpid()}-{int(time.time())}-{self._seq}-recuperado.ndjson")
+            try:
+                os.rename(entry.path, claimed)  # otro worker pudo tomarlo antes
+            except OSError:
+                continue
+            with open(claimed, encoding='utf-8') as f, self._lock:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # última línea a medias si el worker murió escribiendo
+                    cells = {(datetime.strptime(c[0], '%Y-%m-%d').date(), c[1], c[2], c[3]): c[4] for c in record['celdas']}
+                    self._merge(cells, record.get('fuente'))
+                    recovered += len(cells)
+                self.sealed.append(claimed)
+        return recovered
+
+    def start(self, app):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='ingest-flush', daemon=True)
+        os.makedirs(_settings['dir'], exist_ok=True)
+        self._thread.start()
+        atexit.register(self._final_flush)
+
+    def _run(self):
+        with self._app.app_context():
+            try:
+                recovered = self.recover()
+                if recovered:
+                    self._app.logger.info(f"Ingesta: {recovered} celdas recuperadas de diarios de workers anteriores.")
+            except OSError as e:
+                self._app.logger.error(f"Ingesta: no se pudieron recuperar diarios: {e}")
+        while True:
+            self._wake.wait(_settings['flush_seconds'])
+            self._wake.clear()
+            with self._app.app_context():
+                try:
+                    self.flush()
+                except Exception as e:
+                    self._app.logger.error(f"Ingesta: error al escribir contadores, se reintentará: {e}")
+                finally:
+                    db_session.remove()
+
+    def _final_flush(self):
+        try:
+            with self._app.app_context():
+                self.flush()
+                db_session.remove()
+        except Exception:
+            pass  # el diario sigue en disco y se recupera al arrancar otro worker
+
+
+_buffer = _Buffer()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _upsert(data):
+    """Suma las piezas de cada celda con INSERT ... ON CONFLICT por bloques y un solo commit."""
+    now = now_mexico()
+    rows = [dict(fecha=fecha, grupo=grupo, area=area, hora=hora, valor_producido=piezas,
+                 usuario_captura=fuente, fecha_captura=now, version=1)
+            for (fecha, grupo, area, hora), (piezas, fuente) in data.items()]
+    table = ProduccionCaptura.__table__
+    try:
+        for start in range(0, len(rows), UPSERT_CHUNK):
+            stmt = dialect_insert(table).values(rows[start:start + UPSERT_CHUNK])
+            stmt = stmt.on_conflict_do_update(index_elements=['fecha', 'grupo', 'area', 'hora'], set_={
+                'valor_producido': func.coalesce(table.c.valor_producido, 0) + stmt.excluded.valor_producido,
+                'usuario_captura': stmt.excluded.usuario_captura,
+                'fecha_captura': stmt.excluded.fecha_captura,
+                'version': table.c.version + 1,
+            })
+            db_session.execute(stmt)
+        for fecha, grupo in sorted({(k[0], k[1]) for k in data}):
+            rollups.invalidate(fecha, grupo)
+        db_session.commit()
+    except exc.SQLAlchemyError:
+        db_session.rollback()
+        raise
+
+
+def flush_pending():
+    """Recupera diarios huérfanos y vacía lo pendiente en este proceso (CLI); devuelve las celdas escritas."""
+    os.makedirs(_settings['dir'], exist_ok=True)
+    _buffer.recover()
+    return _buffer.flush()
+
+
+def _read_body(limit):
+    """Cuerpo de la petición, o None si pasa de `limit` bytes.
+
+    Se lee el stream con tope en lugar de confiar en Content-Length, que no viene en los envíos
+    con Transfer-Encoding: chunked.
+    """
+    chunks, size = [], 0
+    while size <= limit:
+        chunk = request.stream.read(min(64 * 1024, limit + 1 - size))
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+        size += len(chunk)
+    return None
+
+
+@bp.route('/api/contadores', methods=['POST'])
+def ingest_counters():
+    """Lote NDJSON de eventos de contadores; responde 202 en cuanto el lote está en el diario."""
+    fuente = _source_for_request()
+    if fuente is None:
+        return jsonify({'status': 'error', 'message': 'Token de ingesta inválido.'}), 401
+    body = _read_body(_settings['max_bytes']) if (request.content_length or 0) <= _settings['max_bytes'] else None
+    if body is None:
+        return jsonify({'status': 'error', 'message': f"El lote pasa de {_settings['max_bytes']} bytes; divídelo."}), 413
+    _buffer.start(current_app._get_current_object())
+
+    now = now_mexico()
+    cells, errores, aceptados, rechazados = {}, [], 0, 0
+    for numero, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            key, piezas = parse_event(line, now)
+        except ValueError as e:
+            rechazados += 1
+            if len(errores) < MAX_ERRORES_RESPUESTA:
+                errores.append({'linea': numero, 'error': str(e)})
+            continue
+        cells[key] = cells.get(key, 0) + piezas
+        aceptados += 1
+
+    if aceptados:
+        _buffer.add(cells, aceptados, fuente)
+    INGEST_EVENTS.inc(aceptados, result='aceptado')
+    INGEST_EVENTS.inc(rechazados, result='rechazado')
+    status = 202 if aceptados or not rechazados else 400
+    return jsonify({'status': 'success' if status == 202 else 'error', 'aceptados': aceptados,
+                    'rechazados': rechazados, 'errores': errores}), status
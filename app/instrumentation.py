@@ -0,0 +1,136 @@
+import time
+import threading
+from collections import deque
+
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+
+from . import metrics
+
+
+class EndpointStats:
+    """Ventana deslizante de las últimas N peticiones de un endpoint."""
+    def __init__(self, window):
+        self.count = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self.queries = deque(maxlen=window)
+        self.db_times = deque(maxlen=window)
+
+    def record(self, total_ms, queries, db_ms, status_code):
+        self.count += 1
+        if status_code >= 500:
+            self.errors += 1
+        self.latencies.append(total_ms)
+        self.queries.append(queries)
+        self.db_times.append(db_ms)
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lower, upper = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def get_endpoint_stats():
+    """Resumen por endpoint (p50/p95 de latencia, consultas y tiempo de BD), ordenado por p95."""
+    with _stats_lock:
+        snapshot = {name: (s.count, s.errors, list(s.latencies), list(s.queries), list(s.db_times)) for name, s in _stats.items()}
+    rows = []
+    for name, (count, errors, latencies, queries, db_times) in snapshot.items():
+        rows.append({
+            'endpoint': name,
+            'count': count,
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'max_ms': round(max(latencies), 1) if latencies else 0,
+            'queries_avg': round(sum(queries) / len(queries), 1) if queries else 0,
+            'queries_max': max(queries) if queries else 0,
+            'db_ms_avg': round(sum(db_times) / len(db_times), 1) if db_times else 0,
+        })
+    return sorted(rows, key=lambda r: r['p95_ms'], reverse=True)
+
+
+def reset_endpoint_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _on_db_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start_time'):
+        conn.info['query_start_time'].pop()
+
+
+def _make_after_cursor_execute(app):
+    slow_ms = app.config['SLOW_QUERY_MS']
+
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_start_time'].pop()) * 1000
+        if not has_request_context():
+            return
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time_ms = g.get('db_time_ms', 0.0) + elapsed_ms
+        if elapsed_ms >= slow_ms:
+            app.logger.warning("Consulta lenta (%.1f ms) en %s: %s", elapsed_ms, request.endpoint, ' '.join(statement.split())[:500])
+
+    return _after_cursor_execute
+
+
+def _on_before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.setdefault('render_stack', []).append(time.perf_counter())
+
+
+def _on_rendered(sender, template, context, **extra):
+    if has_request_context() and g.get('render_stack'):
+        g.render_time_ms = g.get('render_time_ms', 0.0) + (time.perf_counter() - g.render_stack.pop()) * 1000
+
+
+def init_app(app, engine):
+    """Cuenta consultas y tiempos por petición, registra consultas lentas y añade Server-Timing."""
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+    window = app.config['METRICS_WINDOW']
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _make_after_cursor_execute(app))
+    event.listen(engine, 'handle_error', _on_db_error)
+    before_render_template.connect(_on_before_render, app)
+    template_rendered.connect(_on_rendered, app)
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_start = time.perf_counter()
+        g.db_queries = 0
+        g.db_time_ms = 0.0
+        g.render_time_ms = 0.0
+
+    @app.after_request
+    def _record_request_metrics(response):
+        if 'request_start' not in g or request.endpoint in (None, 'static'):
+            return response
+        total_ms = (time.perf_counter() - g.request_start) * 1000
+        db_ms, render_ms = g.db_time_ms, g.render_time_ms
+        response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{g.db_queries} queries"')
+        response.headers.add('Server-Timing', f'render;dur={render_ms:.1f}')
+        response.headers.add('Server-Timing', f'total;dur={total_ms:.1f}')
+        metrics.observe_request(request.blueprint, request.endpoint, request.method, response.status_code, total_ms / 1000, g.db_queries)
+        with _stats_lock:
+            stats = _stats.get(request.endpoint)
+            if stats is None:
+                stats = _stats[request.endpoint] = EndpointStats(window)
+            stats.record(total_ms, g.db_queries, db_ms, response.status_code)
+        return response
@@ -0,0 +1,131 @@
+import os
+import gzip
+import json
+import time
+from datetime import datetime
+from sqlalchemy import text, select, func
+
+from . import engine
+from .models import (ActivityLog, ACTIVITY_LOG_PARTITIONED_DDL, is_activity_log_partitioned,
+                     ensure_monthly_partitions, month_start)
+
+ARCHIVE_COLUMNS = ['id', 'timestamp', 'username', 'action', 'details', 'area_grupo', 'ip_address', 'category', 'severity']
+
+
+def convert_to_partitioned():
+    """Convierte una activity_logs normal de PostgreSQL en una tabla particionada por mes.
+
+    Renombra la tabla actual, crea la particionada con sus particiones mensuales,
+    copia los datos y elimina la tabla anterior, todo en una sola transacción.
+    """
+    if engine.dialect.name != 'postgresql':
+        raise RuntimeError("El particionado nativo solo está disponible en PostgreSQL.")
+    if is_activity_log_partitioned():
+        return False
+
+    with engine.begin() as conn:
+        oldest = conn.execute(select(func.min(ActivityLog.timestamp))).scalar()
+        conn.execute(text("ALTER TABLE activity_logs RENAME TO activity_logs_legacy"))
+        for index_name in conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'activity_logs_legacy' AND indexname LIKE 'ix_activity_logs%'"
+        )).scalars().all():
+            conn.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_legacy"'))
+        conn.execute(text(ACTIVITY_LOG_PARTITIONED_DDL.format(table='activity_logs')))
+        conn.execute(text("CREATE TABLE activity_logs_default PARTITION OF activity_logs DEFAULT"))
+
+    ensure_monthly_partitions(since=oldest)
+
+    with engine.begin() as conn:
+        columns = ', '.join(ARCHIVE_COLUMNS)
+        conn.execute(text(f"INSERT INTO activity_logs ({columns}) SELECT {columns} FROM activity_logs_legacy"))
+        conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('activity_logs', 'id'), COALESCE((SELECT MAX(id) FROM activity_logs), 1))"
+        ))
+        conn.execute(text("DROP TABLE activity_logs_legacy"))
+
+    from .models import ensure_indexes
+    ensure_indexes()
+    return True
+
+
+def _archive_path(output_dir, month):
+    path = os.path.join(output_dir, f"activity_logs_{month:%Y%m}.ndjson.gz")
+    if os.path.exists(path):
+        # Un mes ya archivado (p. ej. filas tardías en la partición por defecto) no se sobrescribe.
+        path = os.path.join(output_dir, f"activity_logs_{month:%Y%m}.{int(time.time())}.ndjson.gz")
+    return path
+
+
+def _dump_month(conn, month, path, batch_size):
+    """Escribe las filas del mes en NDJSON comprimido sin cargarlas todas en memoria."""
+    upper = month_start(month, 1)
+    query = (select(*[ActivityLog.__table__.c[name] for name in ARCHIVE_COLUMNS])
+             .where(ActivityLog.timestamp >= month, ActivityLog.timestamp < upper)
+             .order_by(ActivityLog.timestamp, ActivityLog.id))
+    result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+
+    tmp_path = path + '.tmp'
+    count = 0
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as fh:
+        for row in result:
+            record = dict(row._mapping)
+            record['timestamp'] = record['timestamp'].isoformat() if record['timestamp'] else None
+            fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    if count == 0:
+        os.remove(tmp_path)
+        return 0
+    os.replace(tmp_path, path)
+    return count
+
+
+def _delete_month(month, batch_size):
+    upper = month_start(month, 1)
+    partition = f"activity_logs_{month:%Y%m}"
+    deleted = 0
+    if is_activity_log_partitioned():
+        with engine.begin() as conn:
+            if conn.execute(text("SELECT to_regclass(:name)"), {'name': partition}).scalar():
+                deleted += conn.execute(text(f"SELECT COUNT(*) FROM {partition}")).scalar()
+                conn.execute(text(f"ALTER TABLE activity_logs DETACH PARTITION {partition}"))
+                conn.execute(text(f"DROP TABLE {partition}"))
+
+    # Filas que no viven en una partición propia (SQLite o partición por defecto): borrado por lotes
+    # para no bloquear la tabla durante mucho tiempo.
+    while True:
+        with engine.begin() as conn:
+            result = conn.execute(text(
+                "DELETE FROM activity_logs WHERE id IN ("
+                "SELECT id FROM activity_logs WHERE timestamp >= :lo AND timestamp < :hi LIMIT :n)"
+            ), {'lo': month, 'hi': upper, 'n': batch_size})
+        if not result.rowcount:
+            break
+        deleted += result.rowcount
+    return deleted
+
+
+def archive_activity_logs(keep_months, output_dir, batch_size=5000):
+    """Mueve a archivos .ndjson.gz los meses de activity_logs anteriores a `keep_months`.
+
+    Cada mes se vuelca completo a disco antes de borrarse de la base; devuelve una
+    lista de (mes, filas archivadas, ruta del archivo).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cutoff = month_start(datetime.utcnow(), -keep_months)
+
+    with engine.connect() as conn:
+        oldest = conn.execute(select(func.min(ActivityLog.timestamp))).scalar()
+    if not oldest or oldest >= cutoff:
+        return []
+
+    archived = []
+    month = month_start(oldest)
+    while month < cutoff:
+        path = _archive_path(output_dir, month)
+        with engine.connect() as conn:
+            count = _dump_month(conn, month, path, batch_size)
+        if count:
+            _delete_month(month, batch_size)
+            archived.append((month.strftime('%Y-%m'), count, path))
+        month = month_start(month, 1)
+    return archived
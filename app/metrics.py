@@ -0,0 +1,258 @@
+import hmac
+import time
+import threading
+import ipaddress
+from bisect import bisect_left
+
+from flask import Blueprint, Response, request, current_app, abort
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10_000, 100_000, 500_000, 1_000_000, 5_000_000, 20_000_000, 100_000_000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}, recibió {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge con valor fijado a mano o calculado en cada scrape mediante `callback`."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def collect(self):
+        if self.callback is not None:
+            # El callback devuelve [(dict_de_etiquetas, valor), ...]
+            items = [(self._key(labels), value) for labels, value in self.callback()]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            state['counts'][bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def collect(self):
+        with self._lock:
+            items = [(key, {'counts': list(s['counts']), 'sum': s['sum'], 'count': s['count']}) for key, s in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state['counts']):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            try:
+                samples = metric.collect()
+            except Exception as e:
+                current_app.logger.error(f"Error al recolectar la métrica {metric.name}: {e}")
+                continue
+            lines.extend(metric.header())
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram('nidec_http_request_duration_seconds', 'Latencia de las peticiones HTTP.', ('blueprint', 'endpoint', 'method'))
+REQUESTS_TOTAL = registry.counter('nidec_http_requests_total', 'Peticiones HTTP atendidas.', ('blueprint', 'endpoint', 'status'))
+REQUEST_QUERIES = registry.histogram('nidec_http_request_db_queries', 'Consultas SQL por petición.', ('blueprint', 'endpoint'),
+                                     buckets=(1, 5, 10, 25, 50, 100, 250, 500))
+CACHE_REQUESTS = registry.counter('nidec_cache_requests_total', 'Consultas a cachés internas por resultado.', ('cache', 'result'))
+ACTIVITY_LOG_WRITES = registry.counter('nidec_activity_log_writes_total', 'Escrituras al log de actividad por resultado.', ('result',))
+EXPORT_DURATION = registry.histogram('nidec_export_duration_seconds', 'Duración de las exportaciones.', ('kind',),
+                                     buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+EXPORT_SIZE = registry.histogram('nidec_export_size_bytes', 'Tamaño de los archivos exportados.', ('kind',), buckets=SIZE_BUCKETS)
+
+
+def _cache_hit_ratio():
+    totals = {}
+    with CACHE_REQUESTS._lock:
+        for (cache, result), count in CACHE_REQUESTS._values.items():
+            totals.setdefault(cache, {'hit': 0, 'miss': 0})[result] = count
+    return [({'cache': cache}, t['hit'] / (t['hit'] + t['miss']) if (t['hit'] + t['miss']) else 0.0) for cache, t in totals.items()]
+
+
+registry.gauge('nidec_cache_hit_ratio', 'Proporción de aciertos por caché desde el arranque del proceso.', ('cache',), callback=_cache_hit_ratio)
+
+
+def observe_request(blueprint, endpoint, method, status_code, total_seconds, queries):
+    blueprint = blueprint or ''
+    REQUEST_LATENCY.observe(total_seconds, blueprint=blueprint, endpoint=endpoint, method=method)
+    REQUESTS_TOTAL.inc(blueprint=blueprint, endpoint=endpoint, status=status_code)
+    REQUEST_QUERIES.observe(queries, blueprint=blueprint, endpoint=endpoint)
+
+
+def observe_export(kind, started, size_bytes):
+    EXPORT_DURATION.observe(time.perf_counter() - started, kind=kind)
+    EXPORT_SIZE.observe(size_bytes, kind=kind)
+
+
+def register_pool_metrics(engine):
+    pool = engine.pool
+
+    def _pool_stats():
+        stats = []
+        for stat in ('size', 'checkedin', 'checkedout', 'overflow'):
+            method = getattr(pool, stat, None)
+            if callable(method):
+                stats.append(({'stat': stat}, method()))
+        return stats
+
+    registry.gauge('nidec_db_pool_connections', 'Estado del pool de conexiones de SQLAlchemy.', ('stat',), callback=_pool_stats)
+
+
+def register_production_metrics():
+    """Gauges de producción del día hábil, leídos de una foto cacheada (no se consulta la BD por scrape)."""
+    from . import services
+    from .cache import TTLCache
+
+    snapshot_cache = TTLCache('production_snapshot', ttl=60)
+
+    def _snapshot():
+        return snapshot_cache.get_or_set('today', services.get_live_production_snapshot)
+
+    def _by_area(field):
+        return [({'grupo': row['grupo'], 'area': row['area']}, row[field]) for row in _snapshot()['areas']]
+
+    registry.gauge('nidec_production_pronostico_units', 'Pronóstico del día hábil por grupo y área.', ('grupo', 'area'),
+                   callback=lambda: _by_area('pronostico'))
+    registry.gauge('nidec_production_producido_units', 'Producción capturada del día hábil por grupo y área.', ('grupo', 'area'),
+                   callback=lambda: _by_area('producido'))
+    registry.gauge('nidec_production_eficiencia_percent', 'Eficiencia del día hábil por grupo.', ('grupo',),
+                   callback=lambda: [({'grupo': g}, v['eficiencia']) for g, v in _snapshot()['grupos'].items()])
+    registry.gauge('nidec_production_snapshot_age_seconds', 'Antigüedad de la foto de producción usada por los gauges.',
+                   callback=lambda: [({}, round(time.time() - _snapshot()['generated_at'], 1))])
+
+
+def _is_authorized():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        # Solo en la cabecera: un ?token= quedaría en los logs de acceso y de los proxies.
+        auth = request.headers.get('Authorization', '')
+        return auth.startswith('Bearer ') and hmac.compare_digest(auth[len('Bearer '):].strip().encode(), token.encode())
+    try:
+        return ipaddress.ip_address(request.remote_addr or '').is_loopback
+    except ValueError:
+        return False
+
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    if not _is_authorized():
+        abort(403)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
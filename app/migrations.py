@@ -0,0 +1,270 @@
+# app/migrations.py
+"""Migraciones versionadas y backfills por lotes.
+
+`Base.metadata.create_all` solo crea tablas nuevas y `ensure_columns`/`ensure_indexes` solo agregan
+lo que falta. Los cambios que transforman datos o estructura existentes se escriben aquí como
+migraciones numeradas: cada una se aplica una sola vez, en orden, y queda registrada en
+`schema_migrations`. Una migración que falla no se registra y se reintenta en la siguiente
+ejecución, así que deben poder ejecutarse de nuevo sin efectos dobles.
+
+Los backfills recorren una tabla por rangos de id en transacciones cortas, con una pausa entre
+lotes, y guardan el último id procesado en `backfill_progress` para reanudarse tras una interrupción.
+"""
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import inspect, text, select, func, Integer
+
+from . import engine
+from .models import Base, OutputData, SchemaMigration, BackfillProgress, create_index
+from .dimensions import DIMENSIONS
+
+Migration = namedtuple('Migration', 'version description func')
+Backfill = namedtuple('Backfill', 'name description table batch_size func')
+
+MIGRATIONS = []
+BACKFILLS = {}
+
+
+def migration(version, description):
+    def decorator(func):
+        MIGRATIONS.append(Migration(version, description, func))
+        return func
+    return decorator
+
+
+def backfill(name, description, table, batch_size=1000):
+    """Registra `func(conn, first_id, last_id) -> filas actualizadas` como backfill por lotes."""
+    def decorator(func):
+        BACKFILLS[name] = Backfill(name, description, table, batch_size, func)
+        return func
+    return decorator
+
+
+def _ensure_control_tables():
+    for model in (SchemaMigration, BackfillProgress):
+        model.__table__.create(bind=engine, checkfirst=True)
+
+
+def applied_versions():
+    _ensure_control_tables()
+    with engine.connect() as conn:
+        return {row.version: row for row in conn.execute(select(SchemaMigration.__table__))}
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m.version) if m.version not in applied]
+
+
+def run_migrations(target=None, echo=print):
+    """Aplica en orden las migraciones pendientes (hasta `target` inclusive, si se indica)."""
+    applied = []
+    for m in pending_migrations():
+        if target and m.version > target:
+            break
+        echo(f"Aplicando migración {m.version}: {m.description}...")
+        started = time.perf_counter()
+        m.func()
+        with engine.begin() as conn:
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=m.version, description=m.description, applied_at=datetime.utcnow(),
+                duration_ms=int((time.perf_counter() - started) * 1000)))
+        applied.append(m.version)
+    return applied
+
+
+def backfill_status():
+    _ensure_control_tables()
+    with engine.connect() as conn:
+        progress = {row.name: row for row in conn.execute(select(BackfillProgress.__table__))}
+    return [(bf, progress.get(name)) for name, bf in BACKFILLS.items()]
+
+
+def run_backfill(name, batch_size=None, sleep=0.1, max_batches=None, restart=False, echo=print):
+    """Ejecuta (o reanuda) un backfill. Devuelve True si recorrió toda la tabla.
+
+    Cada lote es una transacción que actualiza el rango de ids y guarda el avance, así que al
+    interrumpirlo solo se repite, como máximo, el lote en curso.
+    """
+    bf = BACKFILLS[name]
+    batch_size = batch_size or bf.batch_size
+    table = Base.metadata.tables[bf.table]
+    progress = BackfillProgress.__table__
+    _ensure_control_tables()
+    with engine.begin() as conn:
+        row = conn.execute(select(progress).where(progress.c.name == name)).first()
+        if row is None:
+            conn.execute(progress.insert().values(name=name, last_id=0, rows_done=0, started_at=datetime.utcnow()))
+        elif restart:
+            conn.execute(progress.update().where(progress.c.name == name).values(
+                last_id=0, rows_done=0, started_at=datetime.utcnow(), finished_at=None))
+        elif row.finished_at:
+            echo(f"{name}: ya terminado el {row.finished_at:%Y-%m-%d %H:%M}.")
+            return True
+        last_id = 0 if row is None or restart else row.last_id
+        rows_done = 0 if row is None or restart else row.rows_done
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as conn:
+            window = select(table.c.id).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size).subquery()
+            first_id, batch_last_id = conn.execute(select(func.min(window.c.id), func.max(window.c.id))).one()
+            if first_id is None:
+                conn.execute(progress.update().where(progress.c.name == name).values(
+                    updated_at=datetime.utcnow(), finished_at=datetime.utcnow()))
+                echo(f"{name}: terminado, {rows_done} filas actualizadas.")
+                return True
+            rows_done += bf.func(conn, first_id, batch_last_id) or 0
+            last_id = batch_last_id
+            conn.execute(progress.update().where(progress.c.name == name).values(
+                last_id=last_id, rows_done=rows_done, updated_at=datetime.utcnow()))
+        batches += 1
+        echo(f"{name}: lote {batches} hasta id {last_id} ({rows_done} filas actualizadas).")
+        if sleep:
+            time.sleep(sleep)
+    echo(f"{name}: detenido tras {batches} lotes; se reanuda desde el id {last_id}.")
+    return False
+
+
+# --- Migraciones ---
+
+# Tablas de producción cuyas columnas de texto se reemplazan por códigos de dimensión.
+DIMENSION_COLUMNS = {
+    'pronosticos': ['grupo', 'area', 'turno'],
+    'produccion_capturas': ['grupo', 'area', 'hora'],
+    'output_data': ['grupo'],
+}
+
+# Índices de una sola columna que quedaron cubiertos por los compuestos (grupo, fecha, area, valor)
+# y por las restricciones únicas que empiezan por fecha; (status, fecha) del centro de acciones no
+# servía a su UNION y se reemplazó por los de razon/fecha_problema.
+OBSOLETE_INDEXES = {
+    'pronosticos': ['ix_pronosticos_fecha', 'ix_pronosticos_grupo', 'ix_pronosticos_status_fecha'],
+    'solicitudes_correccion': ['ix_solicitudes_status_fecha'],
+    'produccion_capturas': ['ix_produccion_capturas_fecha', 'ix_produccion_capturas_grupo'],
+    'output_data': ['ix_output_data_fecha', 'ix_output_data_grupo'],
+}
+
+COMPOSITE_INDEXES = ['ix_pronosticos_grupo_fecha_area', 'ix_produccion_grupo_fecha_area', 'ux_output_data_grupo_fecha']
+
+
+@migration('0001_output_data_unico', 'Una fila de output_data por (fecha, grupo)')
+def dedupe_output_data():
+    """Deja una sola fila de output_data por (fecha, grupo) antes de crear su índice único.
+
+    Se conserva la captura más reciente (fecha_captura y luego id), que es la que se ve en pantalla.
+    """
+    if 'output_data' not in inspect(engine).get_table_names():
+        return
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            "SELECT id, fecha, grupo FROM output_data WHERE (fecha, grupo) IN "
+            "(SELECT fecha, grupo FROM output_data GROUP BY fecha, grupo HAVING COUNT(*) > 1) "
+            "ORDER BY fecha, grupo, fecha_captura IS NULL, fecha_captura DESC, id DESC")).all()
+        seen, duplicates = set(), []
+        for row_id, fecha, grupo in rows:
+            if (fecha, grupo) in seen:
+                duplicates.append(row_id)
+            seen.add((fecha, grupo))
+        if duplicates:
+            print(f"Eliminando {len(duplicates)} filas duplicadas de output_data ({len(seen)} días afectados)...")
+            conn.execute(OutputData.__table__.delete().where(OutputData.id.in_(duplicates)))
+
+
+def _dimension_case(column, dimension):
+    whens = ' '.join(f"WHEN '{nombre}' THEN {code}" for code, nombre in DIMENSIONS[dimension].items())
+    return f"CASE {column} {whens} END"
+
+
+@migration('0002_codigos_dimension', 'grupo/area/turno/hora como códigos SMALLINT')
+def migrate_dimension_columns():
+    """Convierte a códigos SMALLINT las columnas grupo/area/turno/hora que aún sean texto.
+
+    Antes de tocar una tabla verifica que todos sus valores tengan código; si no, aborta sin cambios
+    para que se agreguen a app/dimensions.py. En PostgreSQL usa ALTER COLUMN ... TYPE; en SQLite,
+    que no puede cambiar tipos, reconstruye la tabla copiando los datos.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table_name, columns in DIMENSION_COLUMNS.items():
+        if table_name not in existing_tables:
+            continue
+        types = {col['name']: col['type'] for col in inspector.get_columns(table_name)}
+        pending = [c for c in columns if not isinstance(types[c].as_generic(), Integer)]
+        if not pending:
+            continue
+        with engine.connect() as conn:
+            for column in pending:
+                known = ', '.join(f"'{nombre}'" for nombre in DIMENSIONS[column].values())
+                unknown = [r[0] for r in conn.execute(text(
+                    f"SELECT DISTINCT {column} FROM {table_name} WHERE {column} IS NOT NULL AND {column} NOT IN ({known})"))]
+                if unknown:
+                    raise RuntimeError(f"{table_name}.{column} tiene valores sin código de dimensión: {unknown}. "
+                                       "Agréguelos a app/dimensions.py antes de migrar.")
+
+        print(f"Migrando {table_name} a códigos de dimensión ({', '.join(pending)})...")
+        table = Base.metadata.tables[table_name]
+        if engine.dialect.name == 'postgresql':
+            with engine.begin() as conn:
+                for column in pending:
+                    conn.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column} TYPE smallint USING {_dimension_case(column, column)}"))
+                    conn.execute(text(f"ALTER TABLE {table_name} ADD FOREIGN KEY ({column}) REFERENCES dim_{column}s (id)"))
+        else:
+            old_name = f"{table_name}__pre_dim"
+            index_names = [ix['name'] for ix in inspector.get_indexes(table_name) if ix.get('name')]
+            select_cols = ', '.join(_dimension_case(c.name, c.name) if c.name in pending else c.name for c in table.columns)
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {old_name}"))
+                # Los nombres de índice son globales en SQLite: se liberan antes de recrear la tabla.
+                for index_name in index_names:
+                    conn.execute(text(f'DROP INDEX IF EXISTS "{index_name}"'))
+                table.create(bind=conn)
+                conn.execute(text(f"INSERT INTO {table_name} ({', '.join(c.name for c in table.columns)}) SELECT {select_cols} FROM {old_name}"))
+                conn.execute(text(f"DROP TABLE {old_name}"))
+
+
+def drop_obsolete_indexes():
+    concurrently = 'CONCURRENTLY ' if engine.dialect.name == 'postgresql' else ''
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table_name, index_names in OBSOLETE_INDEXES.items():
+        if table_name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table_name)}
+        for index_name in index_names:
+            if index_name in existing:
+                print(f"Eliminando índice redundante {index_name}...")
+                with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    conn.execute(text(f'DROP INDEX {concurrently}"{index_name}"'))
+
+
+@migration('0003_indices_compuestos', 'Índices (grupo, fecha, area, valor) en lugar de fecha/grupo sueltos')
+def create_composite_indexes():
+    existing_tables = set(inspect(engine).get_table_names())
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in COMPOSITE_INDEXES and table.name in existing_tables:
+                create_index(index)
+    drop_obsolete_indexes()
+
+
+@migration('0004_indices_centro_acciones', 'Índices del centro de acciones por razón/fecha en lugar de (status, fecha)')
+def replace_action_center_indexes():
+    existing_tables = set(inspect(engine).get_table_names())
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in ('ix_pronosticos_razon_fecha', 'ix_solicitudes_fecha_problema') and table.name in existing_tables:
+                create_index(index)
+    drop_obsolete_indexes()
+
+
+# --- Backfills ---
+
+@backfill('activity_logs_categoria', 'Categoría y severidad por defecto en registros anteriores a esas columnas', 'activity_logs', batch_size=5000)
+def fill_activity_log_category(conn, first_id, last_id):
+    return conn.execute(text(
+        "UPDATE activity_logs SET category = COALESCE(category, 'General'), severity = COALESCE(severity, 'Info') "
+        "WHERE id BETWEEN :first AND :last AND (category IS NULL OR severity IS NULL)"),
+        {'first': first_id, 'last': last_id}).rowcount
@@ -2,8 +2,10 @@
 
 import os
 import sys
-from sqlalchemy import (create_engine, Column, Integer, String, Float, DateTime,
-                        ForeignKey, Date, Text, inspect, text, UniqueConstraint, Boolean, Table)
+from sqlalchemy import (create_engine, Column, Integer, SmallInteger, String, Float, DateTime,
+                        ForeignKey, Date, Text, inspect, text, UniqueConstraint, Boolean, Table, Index, JSON, event)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session, relationship
 from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError, NoSuchTableError
 from werkzeug.security import generate_password_hash
@@ -12,18 +14,29 @@ from dotenv import load_dotenv
 
 try:
     from . import db_session, engine
+    from .dimensions import DimensionCode, GRUPOS, AREAS, TURNOS, HORAS, check_known
 except ImportError:
     print("ADVERTENCIA: Ejecutando models.py como un script independiente. Configurando el entorno manualmente...")
     current_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(current_dir)
     sys.path.append(project_root)
     from config import Config
+    from app.dimensions import DimensionCode, GRUPOS, AREAS, TURNOS, HORAS, check_known
     engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
     db_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 
 Base = declarative_base()
 Base.query = db_session.query_property()
 
+@event.listens_for(Base, 'before_insert', propagate=True)
+@event.listens_for(Base, 'before_update', propagate=True)
+def reject_unknown(mapper, connection, target):
+    """Las columnas DimensionCode solo aceptan nombres del catálogo (ver UNKNOWN_CODE en dimensions.py)."""
+    for prop in mapper.column_attrs:
+        column = prop.columns[0]
+        if isinstance(column.type, DimensionCode):
+            check_known(column.type.dimension, getattr(target, prop.key))
+
 role_permissions = Table('role_permissions', Base.metadata,
     Column('role_id', Integer, ForeignKey('roles.id', ondelete='CASCADE'), primary_key=True),
     Column('permission_id', Integer, ForeignKey('permissions.id', ondelete='CASCADE'), primary_key=True)
@@ -51,6 +64,19 @@ class Usuario(Base):
     role = relationship('Rol', backref='usuarios'); turno = relationship('Turno', backref='usuarios')
     def __init__(self, username, password, role_id, nombre_completo=None, cargo=None, turno_id=None): self.username = username; self.password_hash = generate_password_hash(password); self.role_id = role_id; self.nombre_completo = nombre_completo; self.cargo = cargo; self.turno_id = turno_id
 
+# Celdas de una orden como documento {"<columna_id>": {"v": valor, "s": estilo_id}} cuando
+# PROGRAM_CELL_STORAGE = 'documento' (app/programs.py); con 'filas' se usan las tablas datos_celda_*.
+CELL_DOCUMENT = JSON().with_variant(JSONB(), 'postgresql')
+
+# Índices que solo existen en un motor (p. ej. GIN en PostgreSQL): nombre -> dialecto. ensure_indexes los
+# omite en los demás motores.
+DIALECT_ONLY_INDEXES = {}
+
+def dialect_index(dialect, name, *expressions, **kw):
+    """Index(...).ddl_if(dialect=...) registrado además en DIALECT_ONLY_INDEXES."""
+    DIALECT_ONLY_INDEXES[name] = dialect
+    return Index(name, *expressions, **kw).ddl_if(dialect=dialect)
+
 class OrdenLM(Base):
     __tablename__ = 'ordenes_lm'
     id = Column(Integer, primary_key=True)
@@ -59,7 +85,10 @@ class OrdenLM(Base):
     qty = Column(Integer, nullable=False, default=1)
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     status = Column(String(50), default='Pendiente', nullable=False, index=True)
+    celdas_doc = Column(CELL_DOCUMENT, nullable=True)
     celdas = relationship('DatoCeldaLM', backref='orden', cascade='all, delete-orphan')
+    __table_args__ = (Index('ix_ordenes_lm_status_ts_id', 'status', 'timestamp', 'id'),
+                      dialect_index('postgresql', 'ix_ordenes_lm_celdas_doc', 'celdas_doc', postgresql_using='gin', postgresql_ops={'celdas_doc': 'jsonb_path_ops'}),)
 
 class ColumnaLM(Base):
     __tablename__ = 'columnas_lm'
@@ -76,7 +105,8 @@ class DatoCeldaLM(Base):
     orden_id = Column(Integer, ForeignKey('ordenes_lm.id', ondelete='CASCADE'), nullable=False)
     columna_id = Column(Integer, ForeignKey('columnas_lm.id', ondelete='CASCADE'), nullable=False)
     valor = Column(Text)
-    estilos_css = Column(Text, nullable=True)
+    estilos_css = Column(Text, nullable=True)  # formato anterior a estilo_id; lo vacía el backfill celdas_*_estilos
+    estilo_id = Column(Integer, ForeignKey('estilos_celda.id'), nullable=True)
     __table_args__ = (UniqueConstraint('orden_id', 'columna_id', name='_orden_columna_uc'),)
 
 class OrdenRotores(Base):
@@ -87,7 +117,10 @@ class OrdenRotores(Base):
     cantidad = Column(Integer, nullable=False, default=1)
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     status = Column(String(50), default='Pendiente', nullable=False, index=True)
+    celdas_doc = Column(CELL_DOCUMENT, nullable=True)
     celdas = relationship('DatoCeldaRotores', backref='orden', cascade='all, delete-orphan')
+    __table_args__ = (Index('ix_ordenes_rotores_status_ts_id', 'status', 'timestamp', 'id'),
+                      dialect_index('postgresql', 'ix_ordenes_rotores_celdas_doc', 'celdas_doc', postgresql_using='gin', postgresql_ops={'celdas_doc': 'jsonb_path_ops'}),)
 
 class ColumnaRotores(Base):
     __tablename__ = 'columnas_rotores'
@@ -102,20 +135,232 @@ class DatoCeldaRotores(Base):
     orden_id = Column(Integer, ForeignKey('ordenes_rotores.id', ondelete='CASCADE'), nullable=False)
     columna_id = Column(Integer, ForeignKey('columnas_rotores.id', ondelete='CASCADE'), nullable=False)
     valor = Column(Text)
-    estilos_css = Column(Text, nullable=True)
+    estilos_css = Column(Text, nullable=True)  # formato anterior a estilo_id; lo vacía el backfill celdas_*_estilos
+    estilo_id = Column(Integer, ForeignKey('estilos_celda.id'), nullable=True)
     __table_args__ = (UniqueConstraint('orden_id', 'columna_id', name='_orden_rotor_columna_uc'),)
 
-class Pronostico(Base): __tablename__ = 'pronosticos'; id = Column(Integer, primary_key=True); fecha = Column(Date, nullable=False, index=True); grupo = Column(String(10), nullable=False, index=True); area = Column(String(50), nullable=False); turno = Column(String(20), nullable=False); valor_pronostico = Column(Integer); razon_desviacion = Column(Text); usuario_razon = Column(String(80)); fecha_razon = Column(DateTime); status = Column(String(50), default='Nuevo', index=True); __table_args__ = (UniqueConstraint('fecha', 'grupo', 'area', 'turno', name='_fecha_grupo_area_turno_uc'),)
-class ProduccionCaptura(Base): __tablename__ = 'produccion_capturas'; id = Column(Integer, primary_key=True); fecha = Column(Date, nullable=False, index=True); grupo = Column(String(10), nullable=False, index=True); area = Column(String(50), nullable=False); hora = Column(String(10), nullable=False); valor_producido = Column(Integer); usuario_captura = Column(String(80)); fecha_captura = Column(DateTime, default=datetime.utcnow); __table_args__ = (UniqueConstraint('fecha', 'grupo', 'area', 'hora', name='_fecha_grupo_area_hora_uc'),)
-class ActivityLog(Base): __tablename__ = 'activity_logs'; id = Column(Integer, primary_key=True); timestamp = Column(DateTime, default=datetime.utcnow, index=True); username = Column(String(80), index=True); action = Column(String(255)); details = Column(Text); area_grupo = Column(String(50), index=True); ip_address = Column(String(45)); category = Column(String(50)); severity = Column(String(20))
-class OutputData(Base): __tablename__ = 'output_data'; id = Column(Integer, primary_key=True); fecha = Column(Date, nullable=False, index=True); grupo = Column(String(10), nullable=False, index=True); pronostico = Column(Integer); output = Column(Integer); usuario_captura = Column(String(80)); fecha_captura = Column(DateTime, default=datetime.utcnow)
-class SolicitudCorreccion(Base): __tablename__ = 'solicitudes_correccion'; id = Column(Integer, primary_key=True); timestamp = Column(DateTime, default=datetime.utcnow, index=True); usuario_solicitante = Column(String(80), nullable=False); fecha_problema = Column(Date, nullable=False); grupo = Column(String(10), nullable=False); area = Column(String(50)); turno = Column(String(20)); tipo_error = Column(String(100), nullable=False); descripcion = Column(Text, nullable=False); status = Column(String(50), default='Pendiente', index=True); admin_username = Column(String(80)); fecha_resolucion = Column(DateTime); admin_notas = Column(Text)
+# Combinaciones de estilo de las celdas de los programas, guardadas una sola vez (app/styles.py).
+class EstiloCelda(Base): __tablename__ = 'estilos_celda'; id = Column(Integer, primary_key=True); hash = Column(String(40), unique=True, nullable=False); estilos = Column(Text, nullable=False); css = Column(Text, nullable=False)
+
+# Dimensiones de producción: catálogos con códigos SMALLINT fijos (ver app/dimensions.py).
+class DimGrupo(Base): __tablename__ = 'dim_grupos'; id = Column(SmallInteger, primary_key=True, autoincrement=False); nombre = Column(String(10), unique=True, nullable=False)
+class DimArea(Base): __tablename__ = 'dim_areas'; id = Column(SmallInteger, primary_key=True, autoincrement=False); nombre = Column(String(50), unique=True, nullable=False)
+class DimTurno(Base): __tablename__ = 'dim_turnos'; id = Column(SmallInteger, primary_key=True, autoincrement=False); nombre = Column(String(20), unique=True, nullable=False)
+class DimHora(Base): __tablename__ = 'dim_horas'; id = Column(SmallInteger, primary_key=True, autoincrement=False); nombre = Column(String(10), unique=True, nullable=False); turno_id = Column(SmallInteger, ForeignKey('dim_turnos.id'), nullable=False)
+
+class Pronostico(Base): __tablename__ = 'pronosticos'; id = Column(Integer, primary_key=True); fecha = Column(Date, nullable=False); grupo = Column(DimensionCode('grupo'), ForeignKey('dim_grupos.id'), nullable=False); area = Column(DimensionCode('area'), ForeignKey('dim_areas.id'), nullable=False); turno = Column(DimensionCode('turno'), ForeignKey('dim_turnos.id'), nullable=False); valor_pronostico = Column(Integer); razon_desviacion = Column(Text); usuario_razon = Column(String(80)); fecha_razon = Column(DateTime); status = Column(String(50), default='Nuevo', index=True); version = Column(Integer, nullable=False, default=1, server_default='1'); __table_args__ = (UniqueConstraint('fecha', 'grupo', 'area', 'turno', name='_fecha_grupo_area_turno_uc'), Index('ix_pronosticos_razon_fecha', 'fecha', postgresql_where=text("razon_desviacion IS NOT NULL AND razon_desviacion <> ''"), sqlite_where=text("razon_desviacion IS NOT NULL AND razon_desviacion <> ''")), Index('ix_pronosticos_grupo_fecha_area', 'grupo', 'fecha', 'area', 'valor_pronostico'))
+class ProduccionCaptura(Base): __tablename__ = 'produccion_capturas'; id = Column(Integer, primary_key=True); fecha = Column(Date, nullable=False); grupo = Column(DimensionCode('grupo'), ForeignKey('dim_grupos.id'), nullable=False); area = Column(DimensionCode('area'), ForeignKey('dim_areas.id'), nullable=False); hora = Column(DimensionCode('hora'), ForeignKey('dim_horas.id'), nullable=False); valor_producido = Column(Integer); usuario_captura = Column(String(80)); fecha_captura = Column(DateTime, default=datetime.utcnow); version = Column(Integer, nullable=False, default=1, server_default='1'); __table_args__ = (UniqueConstraint('fecha', 'grupo', 'area', 'hora', name='_fecha_grupo_area_hora_uc'), Index('ix_produccion_grupo_fecha_area', 'grupo', 'fecha', 'area', 'valor_producido'))
+class ActivityLog(Base):
+    __tablename__ = 'activity_logs'
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
+    username = Column(String(80), index=True)
+    action = Column(String(255))
+    details = Column(Text)
+    area_grupo = Column(String(50))
+    ip_address = Column(String(45))
+    category = Column(String(50))
+    severity = Column(String(20))
+    # Índices compuestos: columnas de igualdad primero y el rango de fechas al final,
+    # con el id como desempate para la paginación por cursor (keyset).
+    __table_args__ = (
+        Index('ix_activity_logs_ts_id', 'timestamp', 'id'),
+        Index('ix_activity_logs_area_ts', 'area_grupo', 'timestamp', 'id'),
+        Index('ix_activity_logs_cat_sev_ts', 'category', 'severity', 'timestamp', 'id'),
+        Index('ix_activity_logs_sev_ts', 'severity', 'timestamp', 'id'),
+        Index('ix_activity_logs_area_cat_sev_ts', 'area_grupo', 'category', 'severity', 'timestamp', 'id'),
+    )
+class OutputData(Base): __tablename__ = 'output_data'; id = Column(Integer, primary_key=True); fecha = Column(Date, nullable=False); grupo = Column(DimensionCode('grupo'), ForeignKey('dim_grupos.id'), nullable=False); pronostico = Column(Integer); output = Column(Integer); usuario_captura = Column(String(80)); fecha_captura = Column(DateTime, default=datetime.utcnow); version = Column(Integer, nullable=False, default=1, server_default='1'); __table_args__ = (Index('ux_output_data_grupo_fecha', 'grupo', 'fecha', unique=True),)
+class SolicitudCorreccion(Base): __tablename__ = 'solicitudes_correccion'; id = Column(Integer, primary_key=True); timestamp = Column(DateTime, default=datetime.utcnow, index=True); usuario_solicitante = Column(String(80), nullable=False); fecha_problema = Column(Date, nullable=False); grupo = Column(String(10), nullable=False); area = Column(String(50)); turno = Column(String(20)); tipo_error = Column(String(100), nullable=False); descripcion = Column(Text, nullable=False); status = Column(String(50), default='Pendiente', index=True); admin_username = Column(String(80)); fecha_resolucion = Column(DateTime); admin_notas = Column(Text); __table_args__ = (Index('ix_solicitudes_fecha_problema', 'fecha_problema'),)
+
+# Resumen diario por grupo y área de los días hábiles cerrados (app/rollups.py). area NULL es el Output
+# del grupo; esa fila se escribe siempre y marca el día como resumido.
+class KpiDiario(Base): __tablename__ = 'kpi_diario'; id = Column(Integer, primary_key=True); fecha = Column(Date, nullable=False); grupo = Column(DimensionCode('grupo'), ForeignKey('dim_grupos.id'), nullable=False); area = Column(DimensionCode('area'), ForeignKey('dim_areas.id'), nullable=True); pronostico = Column(Integer, nullable=False, default=0); producido = Column(Integer, nullable=False, default=0); actualizado = Column(DateTime, default=datetime.utcnow); __table_args__ = (Index('ix_kpi_diario_grupo_fecha_area', 'grupo', 'fecha', 'area', 'pronostico', 'producido'),)
+
+# Revisión de la captura de cada (fecha, grupo): rollups.invalidate la sube en cada escritura y
+# services.get_data_version la suma en las firmas de caché y ETag. Las filas no se borran.
+class DataRevision(Base): __tablename__ = 'data_revisions'; fecha = Column(Date, primary_key=True); grupo = Column(DimensionCode('grupo'), ForeignKey('dim_grupos.id'), primary_key=True); revision = Column(Integer, nullable=False, default=0)
+
+# Exportaciones generadas en segundo plano (app/exports.py); el archivo vive en EXPORT_DIR/<id>.
+class ExportJob(Base): __tablename__ = 'export_jobs'; id = Column(String(32), primary_key=True); kind = Column(String(50), nullable=False); params_key = Column(String(40), nullable=False); params = Column(Text); status = Column(String(20), nullable=False, default='Pendiente'); username = Column(String(80)); filename = Column(String(255)); size_bytes = Column(Integer); detalle = Column(String(255)); error = Column(Text); created_at = Column(DateTime, default=datetime.utcnow, nullable=False); finished_at = Column(DateTime); __table_args__ = (Index('ix_export_jobs_kind_key_created', 'kind', 'params_key', 'created_at'),)
+
+# Control de migraciones (app/migrations.py): versiones aplicadas y avance de los backfills por lotes.
+class SchemaMigration(Base): __tablename__ = 'schema_migrations'; version = Column(String(100), primary_key=True); description = Column(String(255)); applied_at = Column(DateTime, default=datetime.utcnow, nullable=False); duration_ms = Column(Integer)
+class BackfillProgress(Base): __tablename__ = 'backfill_progress'; name = Column(String(100), primary_key=True); last_id = Column(Integer, nullable=False, default=0); rows_done = Column(Integer, nullable=False, default=0); started_at = Column(DateTime, default=datetime.utcnow); updated_at = Column(DateTime); finished_at = Column(DateTime)
+
+def prepare_schema():
+    """Tablas, catálogos y columnas que las migraciones dan por existentes (init-db y db-migrate)."""
+    if engine.dialect.name == 'postgresql':
+        create_partitioned_activity_log()
+    Base.metadata.create_all(bind=engine)
+    seed_dimensions()
+    ensure_columns()
 
 def init_db():
     print("Verificando y creando tablas si es necesario...")
-    Base.metadata.create_all(bind=engine)
+    prepare_schema()
+    try:
+        from .migrations import run_migrations
+    except ImportError:
+        from app.migrations import run_migrations
+    run_migrations()
+    ensure_indexes()
     print("Verificación de tablas completada.")
 
+def create_partitioned_activity_log():
+    """En PostgreSQL crea activity_logs particionada por mes (RANGE sobre timestamp).
+
+    Solo actúa si la tabla no existe; las bases ya desplegadas se convierten con
+    `flask logs-partition`. La PK incluye timestamp porque Postgres exige que la
+    clave de partición forme parte de toda restricción única.
+    """
+    if inspect(engine).has_table('activity_logs'):
+        return
+    print("Creando activity_logs particionada por mes...")
+    with engine.begin() as conn:
+        conn.execute(text(ACTIVITY_LOG_PARTITIONED_DDL.format(table='activity_logs')))
+        conn.execute(text("CREATE TABLE IF NOT EXISTS activity_logs_default PARTITION OF activity_logs DEFAULT"))
+    ensure_monthly_partitions()
+
+def is_activity_log_partitioned():
+    if engine.dialect.name != 'postgresql':
+        return False
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'activity_logs'"
+        )).first() is not None
+
+def month_start(value, offset=0):
+    """Primer día del mes de `value` desplazado `offset` meses."""
+    month_index = value.year * 12 + (value.month - 1) + offset
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def ensure_monthly_partitions(months_ahead=2, since=None):
+    """Crea las particiones mensuales activity_logs_YYYYMM que falten.
+
+    Cubre desde `since` (o el mes actual) hasta `months_ahead` meses adelante.
+    No hace nada si la tabla no está particionada (p. ej. en SQLite).
+    """
+    if not is_activity_log_partitioned():
+        return []
+    now = datetime.utcnow()
+    current = month_start(since or now)
+    last = month_start(now, months_ahead)
+    created = []
+    with engine.begin() as conn:
+        while current <= last:
+            upper = month_start(current, 1)
+            name = f"activity_logs_{current:%Y%m}"
+            exists = conn.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar()
+            if not exists:
+                conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF activity_logs "
+                    f"FOR VALUES FROM ('{current:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+                ))
+                created.append(name)
+            current = upper
+    return created
+
+ACTIVITY_LOG_PARTITIONED_DDL = """
+CREATE TABLE {table} (
+    id SERIAL NOT NULL,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    username VARCHAR(80),
+    action VARCHAR(255),
+    details TEXT,
+    area_grupo VARCHAR(50),
+    ip_address VARCHAR(45),
+    category VARCHAR(50),
+    severity VARCHAR(20),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp)
+"""
+
+def ensure_columns():
+    """create_all no altera tablas existentes: añade las columnas declaradas que falten.
+
+    Solo se agregan columnas que admiten NULL o tienen `server_default`, para no fallar con filas existentes.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                print(f"ADVERTENCIA: no se puede añadir {table.name}.{column.name} (NOT NULL sin valor por defecto).")
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+            print(f"Añadiendo columna {table.name}.{column.name}...")
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+
+def seed_dimensions():
+    """Inserta o corrige las filas de las tablas dim_* a partir de app/dimensions.py."""
+    catalogs = [
+        (DimGrupo, [{'id': code, 'nombre': nombre} for code, nombre in GRUPOS.items()]),
+        (DimArea, [{'id': code, 'nombre': nombre} for code, nombre in AREAS.items()]),
+        (DimTurno, [{'id': code, 'nombre': nombre} for code, nombre in TURNOS.items()]),
+        (DimHora, [{'id': code, 'nombre': nombre, 'turno_id': turno} for code, (nombre, turno) in HORAS.items()]),
+    ]
+    for model, rows in catalogs:
+        for row in rows:
+            db_session.merge(model(**row))
+    db_session.commit()
+
+def ensure_indexes():
+    """create_all no altera tablas existentes: crea los índices declarados que falten."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if DIALECT_ONLY_INDEXES.get(index.name, engine.dialect.name) != engine.dialect.name:
+                continue
+            if index.name not in existing:
+                print(f"Creando índice {index.name} en {table.name}...")
+                create_index(index)
+
+def create_index(index):
+    """Crea un índice declarado sin bloquear escrituras en PostgreSQL (CREATE INDEX CONCURRENTLY).
+
+    CONCURRENTLY no puede ir dentro de una transacción ni sobre tablas particionadas; si una
+    ejecución anterior se interrumpió, el índice queda marcado como inválido y se reconstruye.
+    """
+    if engine.dialect.name != 'postgresql':
+        index.create(bind=engine, checkfirst=True)
+        return
+    table_name = index.table.name
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        relkind = conn.execute(text("SELECT relkind FROM pg_class WHERE relname = :t"), {'t': table_name}).scalar()
+        if relkind == 'p':
+            index.create(bind=conn, checkfirst=True)
+            return
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :n AND NOT i.indisvalid"),
+            {'n': index.name}).scalar()
+        if invalid:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+        ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+        conn.execute(text(ddl.replace('INDEX IF NOT EXISTS', 'INDEX CONCURRENTLY IF NOT EXISTS', 1)))
+
+def dialect_insert(table):
+    """INSERT del motor en uso, con .on_conflict_do_update() (PostgreSQL o SQLite)."""
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
 def create_default_admin():
     print("Iniciando verificación y creación de datos por defecto...")
     try:
@@ -1,17 +1,23 @@
 # app/production.py
 
 from flask import (Blueprint, render_template, request, redirect, url_for, session,
-                   flash, jsonify, send_file, abort)
+                   flash, jsonify, send_file, abort, current_app, g)
 from datetime import datetime, timedelta, date
 import calendar
 import pandas as pd
 import io
+import time
+import hashlib
+import xlsxwriter
 
-from . import db_session, services
+from . import db_session, services, rollups, snapshots
 from .decorators import login_required, permission_required, csrf_required
-from .utils import (log_activity, get_business_date, AREAS_IHP, AREAS_FHP,
-                    NOMBRES_TURNOS_PRODUCCION, HORAS_TURNO, to_slug, now_mexico)
+from .exports import register_export
+from .metrics import observe_export, ACTIVITY_LOG_WRITES
+from .utils import (log_activity, activity_entry, get_business_date, AREAS_IHP, AREAS_FHP,
+                    NOMBRES_TURNOS_PRODUCCION, HORAS_TURNO, to_slug, now_mexico, get_kpi_color_class)
 from .models import Pronostico, ProduccionCaptura, OutputData, SolicitudCorreccion
+from .dimensions import TURNO_DE_HORA
 from sqlalchemy import exc
 
 bp = Blueprint('production', __name__)
@@ -58,8 +64,9 @@ def dashboard_admin():
         selected_date_str = get_business_date().strftime('%Y-%m-%d')
         selected_date = get_business_date()
 
-    ihp_kpi_data = services.get_group_performance('IHP', selected_date_str)
-    fhp_kpi_data = services.get_group_performance('FHP', selected_date_str)
+    dashboard_data = services.get_dashboard_data(selected_date)
+    ihp_kpi_data = dashboard_data['kpis']['IHP']
+    fhp_kpi_data = dashboard_data['kpis']['FHP']
     
     try:
         total_pronostico = int(ihp_kpi_data['pronostico'].replace(',', '')) + int(fhp_kpi_data['pronostico'].replace(',', ''))
@@ -71,19 +78,14 @@ def dashboard_admin():
     total_eficiencia = (total_producido / total_pronostico * 100) if total_pronostico > 0 else 0
     
     global_kpis = {'pronostico': f"{total_pronostico:,.0f}", 'producido': f"{total_producido:,.0f}", 'eficiencia': round(total_eficiencia, 2)}
-    performance_data = services.get_detailed_performance_data(selected_date)
-    output_data_ihp = services.get_output_data('IHP', selected_date_str)
-    output_data_fhp = services.get_output_data('FHP', selected_date_str)
-    
-    return render_template('dashboard_admin.html', 
-                           selected_date=selected_date_str, 
-                           global_kpis=global_kpis, 
-                           ihp_data=ihp_kpi_data, fhp_data=fhp_kpi_data, 
-                           performance_data=performance_data, 
-                           output_data_ihp=output_data_ihp, output_data_fhp=output_data_fhp, 
-                           nombres_turnos=NOMBRES_TURNOS_PRODUCCION, 
-                           horas_turno=HORAS_TURNO, 
-                           AREAS_IHP=AREAS_IHP, AREAS_FHP=AREAS_FHP)
+    kpi_cards = [dict(kpis, titulo=titulo, color=get_kpi_color_class(kpis['eficiencia']))
+                 for titulo, kpis in (('Nidec General', global_kpis), ('Resumen IHP', ihp_kpi_data), ('Resumen FHP', fhp_kpi_data))]
+
+    return render_template('dashboard_admin.html',
+                           selected_date=selected_date_str,
+                           kpi_cards=kpi_cards,
+                           vista=dashboard_data['vista'],
+                           version=dashboard_data['version'])
 
 @bp.route('/dashboard/<group>')
 @login_required
@@ -103,9 +105,9 @@ def dashboard_group(group):
         selected_date_str = get_business_date().strftime('%Y-%m-%d')
         selected_date = get_business_date()
 
-    yesterday_str = (selected_date - timedelta(days=1)).strftime('%Y-%m-%d')
-    summary_today = services.get_group_performance(group_upper, selected_date_str)
-    summary_yesterday = services.get_group_performance(group_upper, yesterday_str)
+    dashboard_data = services.get_dashboard_data(selected_date)
+    summary_today = dict(dashboard_data['kpis'][group_upper])
+    summary_yesterday = services.get_dashboard_data(selected_date - timedelta(days=1))['kpis'][group_upper]
 
     try:
         prod_today_num = int(summary_today['producido'].replace(',', ''))
@@ -114,9 +116,8 @@ def dashboard_group(group):
     except (ValueError, KeyError):
         summary_today['trend'] = 'stable'
 
-    all_performance_data = services.get_detailed_performance_data(selected_date)
-    group_performance_data = all_performance_data.get(group_upper, {})
-    output_data = services.get_output_data(group_upper, selected_date_str)
+    group_performance_data = dashboard_data['detalle'].get(group_upper, {})
+    output_data = dashboard_data['output'][group_upper]
     areas_list = [a for a in (AREAS_IHP if group_upper == 'IHP' else AREAS_FHP) if a != 'Output']
     
     return render_template('dashboard_group.html', 
@@ -153,16 +154,14 @@ def reportes():
         selected_date = today
         selected_date_str = today.strftime('%Y-%m-%d')
 
-    # Obtener datos optimizados
-    weekly_data, monthly_data = services.get_optimized_report_data(group, selected_area, selected_date)
-    
-    # Obtener datos detallados del día específico para la tabla
-    daily_data = services.get_daily_detailed_data(group, selected_area, selected_date)
+    # Semana, mes y detalle del día para la tabla (cacheados por versión de los datos)
+    weekly_data, monthly_data, daily_data = services.get_report_data(group, selected_area, selected_date)
     
     context = {
         'group': group,
         'selected_area': selected_area,
         'selected_date': selected_date_str,
+        'export_desde': selected_date.replace(day=1).strftime('%Y-%m-%d'),
         'is_admin': is_admin,
         'weekly_data': weekly_data,
         'monthly_data': monthly_data,
@@ -173,15 +172,321 @@ def reportes():
 
     return render_template('reportes.html', **context)
 
+@bp.route('/api/reportes/<group>/<periodo>')
+@login_required
+@permission_required('reportes.view')
+def reportes_api(group, periodo):
+    """Serie de la semana o el mes, o detalle del día, de `/reportes` en JSON.
+
+    El ETag (fuerte) sale de los filtros y de la versión de los datos del periodo: si el cliente ya
+    tiene esa versión responde 304 sin recalcular nada. No se envía Last-Modified porque borrar o
+    editar un pronóstico no deja una fecha de captura más reciente; la versión sí cambia.
+
+    Si la base no responde se devuelve el último dato bueno con `datos_al`, sin ETag ni caché.
+    """
+    group = group.upper()
+    is_admin = 'admin.access' in session.get('permissions', [])
+    if group not in ('IHP', 'FHP') or (not is_admin and group not in session.get('viewable_roles', [])):
+        return jsonify({'status': 'error', 'message': f"No tienes acceso al grupo {group}."}), 403
+    if periodo not in services.REPORT_PERIODS:
+        return jsonify({'status': 'error', 'message': f"Periodo inválido: {periodo}"}), 404
+    try:
+        selected_date = datetime.strptime(request.args.get('fecha', ''), '%Y-%m-%d').date()
+    except ValueError:
+        selected_date = get_business_date()
+    area = request.args.get('area', 'GENERAL')
+
+    start, end = services.report_period_range(periodo, selected_date)
+    version = snapshots.attempt(lambda: services.get_data_version(start, end, group))
+    etag = hashlib.sha1(repr((periodo, group, area, start, version)).encode()).hexdigest()
+    if version is not None and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        data = services.get_report_period(group, area, periodo, selected_date, version)
+        datos_al = g.get('datos_al')
+        response = jsonify(grupo=group, area=area, periodo=periodo, inicio=start.isoformat(), fin=end.isoformat(),
+                           datos_al=datos_al.isoformat(timespec='seconds') if datos_al else None, **data)
+    if version is None or g.get('datos_al'):
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    response.set_etag(etag)
+    # El navegador guarda la respuesta pero la revalida siempre con If-None-Match.
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Máximo de días por libro de reportes (un año completo, ambos grupos).
+REPORTE_EXCEL_MAX_DIAS = 366
+
+
+def parse_reportes_export_params(args):
+    """Valida grupo/desde/hasta de la exportación de reportes; lanza ValueError con el mensaje."""
+    is_admin = 'admin.access' in session.get('permissions', [])
+    viewable = [g for g in ('IHP', 'FHP') if is_admin or g in session.get('viewable_roles', []) or session.get('role') == g]
+    if not viewable:
+        raise ValueError("No tienes acceso a ningún grupo.")
+    grupo = (args.get('grupo') or viewable[0]).upper()
+    grupos = viewable if grupo == 'AMBOS' else [grupo]
+    if not set(grupos) <= set(viewable):
+        raise ValueError(f"No tienes acceso al grupo {grupo}.")
+
+    today = get_business_date()
+    try:
+        desde = datetime.strptime(args['desde'], '%Y-%m-%d').date() if args.get('desde') else today.replace(day=1)
+        hasta = datetime.strptime(args['hasta'], '%Y-%m-%d').date() if args.get('hasta') else today
+    except ValueError:
+        raise ValueError("Formato de fecha inválido.")
+    if hasta < desde:
+        raise ValueError("La fecha final es anterior a la inicial.")
+    if (hasta - desde).days >= REPORTE_EXCEL_MAX_DIAS:
+        raise ValueError(f"El periodo no puede pasar de {REPORTE_EXCEL_MAX_DIAS} días.")
+    return {'grupos': grupos, 'desde': desde.isoformat(), 'hasta': hasta.isoformat()}
+
+
+def build_reportes_excel(output, grupos, desde, hasta):
+    """Escribe el libro de producción del periodo y devuelve cuántos días con captura contiene.
+
+    Una hoja por grupo y área (pronóstico por turno, producción por hora, eficiencia), una de Output
+    por grupo, el pivote diario por grupo y el resumen del periodo. Los días se recorren en un solo
+    pase sobre `services.iter_daily_detail` y xlsxwriter escribe en modo constant_memory, así que la
+    memoria no crece con el periodo.
+    """
+    desde, hasta = date.fromisoformat(desde), date.fromisoformat(hasta)
+    areas = {'IHP': [a for a in AREAS_IHP if a != 'Output'], 'FHP': [a for a in AREAS_FHP if a != 'Output']}
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    header = workbook.add_format({'bold': True, 'text_wrap': True, 'valign': 'top', 'fg_color': '#D7E4BC', 'border': 1})
+    fecha_fmt = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+    pct_fmt = workbook.add_format({'num_format': '0.0%'})
+
+    def add_sheet(name, headers):
+        sheet = workbook.add_worksheet(name[:31])
+        sheet.write_row(0, 0, headers, header)
+        sheet.set_column(0, 0, 12)
+        sheet.set_column(1, len(headers) - 1, 11)
+        sheet.freeze_panes(1, 1)
+        return sheet
+
+    def write_values(sheet, row, col, pron, prod):
+        """Escribe pronóstico, producido y eficiencia a partir de `col`; devuelve la siguiente columna."""
+        sheet.write_number(row, col, pron)
+        sheet.write_number(row, col + 1, prod)
+        if pron:
+            sheet.write_number(row, col + 2, prod / pron, pct_fmt)
+        return col + 3
+
+    # El resumen va primero en el libro pero se llena al final, cuando ya se tienen los totales.
+    turno_headers = [f"{t} {h}" for t in NOMBRES_TURNOS_PRODUCCION for h in ('Pron.', 'Prod.', 'Efic.')]
+    resumen = add_sheet('Resumen', ['Grupo', 'Área', 'Pronóstico', 'Producido', 'Eficiencia'] + turno_headers)
+    resumen.set_column(1, 1, 18)
+    diario = add_sheet('Diario', ['Fecha'] + [f"{g} {h}" for g in grupos for h in ('Pron.', 'Prod.', 'Efic.')])
+    area_headers = ['Fecha']
+    for turno in NOMBRES_TURNOS_PRODUCCION:
+        area_headers += [f"{turno} Pron."] + HORAS_TURNO[turno] + [f"{turno} Prod.", f"{turno} Efic."]
+    area_headers += ['Total Pron.', 'Total Prod.', 'Eficiencia']
+    sheets = {}
+    for grupo in grupos:
+        for area in areas[grupo]:
+            sheets[(grupo, area)] = add_sheet(f"{grupo} {area}", area_headers)
+        sheets[(grupo, 'Output')] = add_sheet(f"{grupo} Output", ['Fecha', 'Pronóstico', 'Output', 'Eficiencia'])
+
+    # Totales del periodo: (grupo, area) -> {turno: [pron, prod]}; Output con la llave de turno None.
+    totals = {key: {} for key in sheets}
+    row = dias_con_datos = 0
+    for fecha, pronosticos, producciones, outputs in services.iter_daily_detail(grupos, desde, hasta):
+        if not (pronosticos or producciones or outputs):
+            continue
+        row += 1
+        dias_con_datos += 1
+        diario.write_datetime(row, 0, fecha, fecha_fmt)
+        for g_index, grupo in enumerate(grupos):
+            out_pron, out_prod = outputs.get(grupo, (0, 0))
+            grupo_pron, grupo_prod = out_pron, out_prod
+            for area in areas[grupo]:
+                sheet = sheets[(grupo, area)]
+                sheet.write_datetime(row, 0, fecha, fecha_fmt)
+                col, area_pron, area_prod = 1, 0, 0
+                for turno in NOMBRES_TURNOS_PRODUCCION:
+                    pron = pronosticos.get((grupo, area, turno), 0)
+                    horas = [producciones.get((grupo, area, hora), 0) for hora in HORAS_TURNO[turno]]
+                    prod = sum(horas)
+                    sheet.write_number(row, col, pron)
+                    sheet.write_row(row, col + 1, horas)
+                    col += 1 + len(horas)
+                    sheet.write_number(row, col, prod)
+                    if pron:
+                        sheet.write_number(row, col + 1, prod / pron, pct_fmt)
+                    col += 2
+                    acc = totals[(grupo, area)].setdefault(turno, [0, 0])
+                    acc[0] += pron
+                    acc[1] += prod
+                    area_pron += pron
+                    area_prod += prod
+                write_values(sheet, row, col, area_pron, area_prod)
+                grupo_pron += area_pron
+                grupo_prod += area_prod
+            sheet = sheets[(grupo, 'Output')]
+            sheet.write_datetime(row, 0, fecha, fecha_fmt)
+            write_values(sheet, row, 1, out_pron, out_prod)
+            acc = totals[(grupo, 'Output')].setdefault(None, [0, 0])
+            acc[0] += out_pron
+            acc[1] += out_prod
+            write_values(diario, row, 1 + g_index * 3, grupo_pron, grupo_prod)
+
+    row = 0
+    for grupo in grupos:
+        grupo_pron = grupo_prod = 0
+        for area in areas[grupo] + ['Output']:
+            row += 1
+            by_turno = totals[(grupo, area)]
+            pron = sum(v[0] for v in by_turno.values())
+            prod = sum(v[1] for v in by_turno.values())
+            grupo_pron += pron
+            grupo_prod += prod
+            resumen.write_row(row, 0, [grupo, area])
+            col = write_values(resumen, row, 2, pron, prod)
+            if area != 'Output':
+                for turno in NOMBRES_TURNOS_PRODUCCION:
+                    col = write_values(resumen, row, col, *by_turno.get(turno, (0, 0)))
+        row += 1
+        resumen.write_row(row, 0, [grupo, 'GENERAL'], header)
+        write_values(resumen, row, 2, grupo_pron, grupo_prod)
+    workbook.close()
+    return dias_con_datos
+
+@bp.route('/reportes/export/excel')
+@login_required
+@permission_required('reportes.view')
+def export_reportes_excel():
+    started = time.perf_counter()
+    try:
+        params = parse_reportes_export_params(request.args)
+    except ValueError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('production.reportes'))
+    try:
+        output = io.BytesIO()
+        dias = build_reportes_excel(output, **params)
+        if not dias:
+            flash('No hay captura en el periodo seleccionado.', 'warning')
+            return redirect(url_for('production.reportes'))
+        output.seek(0)
+        observe_export('excel_reportes', started, output.getbuffer().nbytes)
+        log_activity("Exportación Excel Reportes", f"{', '.join(params['grupos'])} del {params['desde']} al {params['hasta']}: {dias} días exportados.", "REPORTES")
+        return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                         as_attachment=True, download_name=f"Reporte_Produccion_{params['desde']}_{params['hasta']}.xlsx")
+    except Exception as e:
+        log_activity("Error Exportación Excel Reportes", str(e), "Sistema", "Error")
+        flash(f"Ocurrió un error al generar el archivo Excel: {e}", "danger")
+        return redirect(url_for('production.reportes'))
+
+
+def _update_if_unchanged(model, row, values, version=None):
+    """UPDATE condicionado a la versión leída; False si otro usuario modificó la fila antes."""
+    version = row.version if version is None else version
+    return db_session.query(model).filter(model.id == row.id, model.version == version).update(
+        {**values, model.version: model.version + 1}, synchronize_session=False) == 1
+
+def _save_capture(group_upper, selected_date, pronosticos, producciones, new_pron_out=None, new_prod_out=None, versions=None):
+    """Aplica los valores capturados y devuelve las llaves que cambiaron y las que no se guardaron.
+
+    `pronosticos` es {(area, turno): valor} y `producciones` {(area, hora): valor}. Los registros
+    existentes del día se cargan en dos consultas en lugar de una por celda, y las entradas del log
+    de actividad se guardan en el mismo commit que los datos. Cada registro existente se actualiza
+    solo si conserva la versión que leyó el cliente (`versions`, con llaves ('pronostico', area, turno),
+    ('produccion', area, hora) y ('output',)) o, si no la envió, la leída aquí, como en
+    `captura_autosave`; si otro usuario lo cambió entre tanto, se conserva su valor y la llave se
+    devuelve en `conflicts`.
+    """
+    versions = versions or {}
+    now_dt, username = now_mexico(), session.get('username')
+    changed_pron, changed_prod, output_changed = set(), set(), False
+    conflicts, logs = [], []
+
+    existing_pron = {(p.area, p.turno): p for p in db_session.query(Pronostico).filter_by(fecha=selected_date, grupo=group_upper)}
+    for (area, turno), new_val in pronosticos.items():
+        existing = existing_pron.get((area, turno))
+        if existing:
+            if (existing.valor_pronostico or 0) != new_val:
+                old_val = existing.valor_pronostico
+                if not _update_if_unchanged(Pronostico, existing, {Pronostico.valor_pronostico: new_val}, versions.get(('pronostico', area, turno))):
+                    conflicts.append(('pronostico', area, turno))
+                    continue
+                changed_pron.add((area, turno))
+                logs.append(activity_entry("Modificación Pronóstico", f"Area: {area}, Turno: {turno}. Valor: {old_val} -> {new_val}", group_upper, 'Datos', 'Info'))
+        else:
+            db_session.add(Pronostico(fecha=selected_date, grupo=group_upper, area=area, turno=turno, valor_pronostico=new_val))
+            changed_pron.add((area, turno))
+            logs.append(activity_entry("Creación Pronóstico", f"Area: {area}, Turno: {turno}. Valor: {new_val}", group_upper, 'Datos', 'Info'))
+
+    existing_prod = {(p.area, p.hora): p for p in db_session.query(ProduccionCaptura).filter_by(fecha=selected_date, grupo=group_upper)}
+    for (area, hora), new_val in producciones.items():
+        existing = existing_prod.get((area, hora))
+        if existing:
+            if (existing.valor_producido or 0) != new_val:
+                old_val = existing.valor_producido
+                if not _update_if_unchanged(ProduccionCaptura, existing, {ProduccionCaptura.valor_producido: new_val,
+                                                                          ProduccionCaptura.usuario_captura: username,
+                                                                          ProduccionCaptura.fecha_captura: now_dt},
+                                            versions.get(('produccion', area, hora))):
+                    conflicts.append(('produccion', area, hora))
+                    continue
+                changed_prod.add((area, hora))
+                logs.append(activity_entry("Modificación Producción", f"Area: {area}, Hora: {hora}. Valor: {old_val} -> {new_val}", group_upper, 'Datos', 'Info'))
+        else:
+            db_session.add(ProduccionCaptura(fecha=selected_date, grupo=group_upper, area=area, hora=hora, valor_producido=new_val, usuario_captura=username, fecha_captura=now_dt))
+            changed_prod.add((area, hora))
+            logs.append(activity_entry("Creación Producción", f"Area: {area}, Hora: {hora}. Valor: {new_val}", group_upper, 'Datos', 'Info'))
+
+    existing_output = db_session.query(OutputData).filter_by(fecha=selected_date, grupo=group_upper).first()
+    if existing_output:
+        values = {}
+        if new_pron_out is not None and existing_output.pronostico != new_pron_out:
+            values[OutputData.pronostico] = new_pron_out
+        if new_prod_out is not None and existing_output.output != new_prod_out:
+            values[OutputData.output] = new_prod_out
+        if values and not _update_if_unchanged(OutputData, existing_output, {**values, OutputData.usuario_captura: username,
+                                                                             OutputData.fecha_captura: now_dt},
+                                                      versions.get(('output',))):
+            conflicts.append(('output',))
+        elif values:
+            output_changed = True
+            logs.append(activity_entry("Actualización Output", f"Pron: {new_pron_out}, Prod: {new_prod_out}", group_upper, 'Datos', 'Info'))
+    elif (new_pron_out is not None and new_pron_out > 0) or (new_prod_out is not None and new_prod_out > 0):
+        db_session.add(OutputData(
+            fecha=selected_date,
+            grupo=group_upper,
+            pronostico=new_pron_out if new_pron_out is not None else 0,
+            output=new_prod_out if new_prod_out is not None else 0,
+            usuario_captura=username,
+            fecha_captura=now_dt
+        ))
+        output_changed = True
+        logs.append(activity_entry("Creación Output", f"Pron: {new_pron_out}, Prod: {new_prod_out}", group_upper, 'Datos', 'Info'))
+
+    if changed_pron or changed_prod or output_changed:
+        rollups.invalidate(selected_date, group_upper)
+    db_session.add_all(logs)
+    db_session.commit()
+    if logs:
+        ACTIVITY_LOG_WRITES.inc(len(logs), result='ok')
+    return changed_pron, changed_prod, output_changed, conflicts
+
+def _capture_group_or_error(group):
+    """Valida el grupo y el acceso del usuario; devuelve (grupo, mensaje_de_error)."""
+    group_upper = group.upper()
+    if group_upper not in ['IHP', 'FHP']: abort(404)
+    if group_upper not in session.get('viewable_roles', []):
+        return group_upper, f'No tienes permiso para capturar datos del grupo {group_upper}.'
+    return group_upper, None
+
 @bp.route('/captura/<group>', methods=['GET', 'POST'])
 @login_required
 @permission_required('captura.access')
 @csrf_required
 def captura(group):
-    group_upper = group.upper()
-    if group_upper not in ['IHP', 'FHP']: abort(404)
-    if group_upper not in session.get('viewable_roles', []):
-        flash(f'No tienes permiso para capturar datos del grupo {group_upper}.', 'danger')
+    group_upper, error = _capture_group_or_error(group)
+    if error:
+        flash(error, 'danger')
         return redirect(url_for('production.dashboard'))
     
     areas_list = AREAS_IHP if group_upper == 'IHP' else AREAS_FHP
@@ -194,90 +499,38 @@ def captura(group):
             flash("Fecha inválida en el formulario.", "danger")
             return redirect(url_for('production.captura', group=group))
         
-        now_dt, changes_detected = now_mexico(), False
-        try:
-            for area in [a for a in areas_list if a != 'Output']:
-                for turno in NOMBRES_TURNOS_PRODUCCION:
-                    new_val_str = request.form.get(f'pronostico_{to_slug(area)}_{to_slug(turno)}')
+        pronosticos, producciones = {}, {}
+        for area in [a for a in areas_list if a != 'Output']:
+            for turno in NOMBRES_TURNOS_PRODUCCION:
+                new_val_str = request.form.get(f'pronostico_{to_slug(area)}_{to_slug(turno)}')
+                if new_val_str and new_val_str.isdigit():
+                    pronosticos[(area, turno)] = int(new_val_str)
+                for hora in HORAS_TURNO.get(turno, []):
+                    new_val_str = request.form.get(f'produccion_{to_slug(area)}_{hora}')
                     if new_val_str and new_val_str.isdigit():
-                        new_val = int(new_val_str)
-                        existing = db_session.query(Pronostico).filter_by(fecha=selected_date, grupo=group_upper, area=area, turno=turno).first()
-                        if existing:
-                            if (existing.valor_pronostico or 0) != new_val:
-                                old_val = existing.valor_pronostico
-                                existing.valor_pronostico = new_val
-                                changes_detected = True
-                                log_activity("Modificación Pronóstico", f"Area: {area}, Turno: {turno}. Valor: {old_val} -> {new_val}", group_upper, 'Datos', 'Info')
-                        else:
-                            db_session.add(Pronostico(fecha=selected_date, grupo=group_upper, area=area, turno=turno, valor_pronostico=new_val))
-                            changes_detected = True
-                            log_activity("Creación Pronóstico", f"Area: {area}, Turno: {turno}. Valor: {new_val}", group_upper, 'Datos', 'Info')
-
-            for area in [a for a in areas_list if a != 'Output']:
-                for turno in NOMBRES_TURNOS_PRODUCCION:
-                    for hora in HORAS_TURNO.get(turno, []):
-                        new_val_str = request.form.get(f'produccion_{to_slug(area)}_{hora}')
-                        if new_val_str and new_val_str.isdigit():
-                            new_val = int(new_val_str)
-                            existing = db_session.query(ProduccionCaptura).filter_by(fecha=selected_date, grupo=group_upper, area=area, hora=hora).first()
-                            if existing:
-                                if (existing.valor_producido or 0) != new_val:
-                                    old_val = existing.valor_producido
-                                    existing.valor_producido = new_val
-                                    existing.usuario_captura = session.get('username')
-                                    existing.fecha_captura = now_dt
-                                    changes_detected = True
-                                    log_activity("Modificación Producción", f"Area: {area}, Hora: {hora}. Valor: {old_val} -> {new_val}", group_upper, 'Datos', 'Info')
-                            else:
-                                db_session.add(ProduccionCaptura(fecha=selected_date, grupo=group_upper, area=area, hora=hora, valor_producido=new_val, usuario_captura=session.get('username'), fecha_captura=now_dt))
-                                changes_detected = True
-                                log_activity("Creación Producción", f"Area: {area}, Hora: {hora}. Valor: {new_val}", group_upper, 'Datos', 'Info')
+                        producciones[(area, hora)] = int(new_val_str)
 
-            try:
-                pronostico_output_raw = request.form.get('pronostico_output')
-                produccion_output_raw = request.form.get('produccion_output')
-                new_pron_out = None
-                new_prod_out = None
-                if pronostico_output_raw is not None and pronostico_output_raw != '':
-                    new_pron_out = int(pronostico_output_raw)
-                if produccion_output_raw is not None and produccion_output_raw != '':
-                    new_prod_out = int(produccion_output_raw)
-            except (ValueError, TypeError):
-                new_pron_out, new_prod_out = None, None
-                flash("Se detectó un valor no numérico en los campos de Output.", "warning")
-
-            existing_output = db_session.query(OutputData).filter_by(fecha=selected_date, grupo=group_upper).first()
-
-            if existing_output:
-                updated = False
-                if new_pron_out is not None and existing_output.pronostico != new_pron_out:
-                    existing_output.pronostico = new_pron_out
-                    updated = True
-                if new_prod_out is not None and existing_output.output != new_prod_out:
-                    existing_output.output = new_prod_out
-                    updated = True
-                if updated:
-                    existing_output.usuario_captura = session.get('username')
-                    existing_output.fecha_captura = now_dt
-                    changes_detected = True
-                    log_activity("Actualización Output", f"Pron: {new_pron_out}, Prod: {new_prod_out}", group_upper, 'Datos', 'Info')
-            elif (new_pron_out is not None and new_pron_out > 0) or (new_prod_out is not None and new_prod_out > 0):
-                db_session.add(OutputData(
-                    fecha=selected_date,
-                    grupo=group_upper,
-                    pronostico=new_pron_out if new_pron_out is not None else 0,
-                    output=new_prod_out if new_prod_out is not None else 0,
-                    usuario_captura=session.get('username'),
-                    fecha_captura=now_dt
-                ))
-                changes_detected = True
-                log_activity("Creación Output", f"Pron: {new_pron_out}, Prod: {new_prod_out}", group_upper, 'Datos', 'Info')
-            
-            db_session.commit()
-            if changes_detected:
+        try:
+            pronostico_output_raw = request.form.get('pronostico_output')
+            produccion_output_raw = request.form.get('produccion_output')
+            new_pron_out = None
+            new_prod_out = None
+            if pronostico_output_raw is not None and pronostico_output_raw != '':
+                new_pron_out = int(pronostico_output_raw)
+            if produccion_output_raw is not None and produccion_output_raw != '':
+                new_prod_out = int(produccion_output_raw)
+        except (ValueError, TypeError):
+            new_pron_out, new_prod_out = None, None
+            flash("Se detectó un valor no numérico en los campos de Output.", "warning")
+
+        try:
+            changed_pron, changed_prod, output_changed, conflicts = _save_capture(group_upper, selected_date, pronosticos, producciones, new_pron_out, new_prod_out)
+            if changed_pron or changed_prod or output_changed:
                 flash('Cambios guardados exitosamente.', 'success')
-            else:
+            elif not conflicts:
                 flash('No se detectaron cambios.', 'info')
+            if conflicts:
+                flash(f'Otro usuario modificó {len(conflicts)} valores mientras editabas; se conservaron sus cambios. Revisa los valores actuales.', 'warning')
         except exc.SQLAlchemyError as e:
             db_session.rollback()
             flash(f"Error al guardar en la base de datos: {e}", 'danger')
@@ -292,18 +545,222 @@ def captura(group):
         selected_date_str = get_business_date().strftime('%Y-%m-%d')
         selected_date = get_business_date()
         
-    data_for_template = services.get_structured_capture_data(group_upper, selected_date)
-    output_data = services.get_output_data(group_upper, selected_date_str)
-    
     return render_template('captura_group.html', 
-                           areas=areas_list, 
                            horas_turno=HORAS_TURNO, 
                            nombres_turnos=NOMBRES_TURNOS_PRODUCCION, 
                            selected_date=selected_date_str, 
-                           data=data_for_template, 
-                           output_data=output_data, 
+                           state=services.get_capture_state(group_upper, selected_date),
+                           bloquear_pronostico=session.get('role') in ['IHP', 'FHP'],
                            group_name=group_upper)
 
+def _parse_capture_value(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value >= 0 else None
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+@bp.route('/api/captura/<group>', methods=['GET', 'POST'])
+@login_required
+@permission_required('captura.access')
+@csrf_required
+def captura_api(group):
+    """Estado de captura en JSON (GET) y guardado de solo las celdas modificadas (POST).
+
+    El POST recibe `pronostico: [[a, t, valor]]`, `produccion: [[a, h, valor]]` y `output`, con índices
+    sobre los ejes de `services.get_capture_layout`, y responde únicamente con las celdas afectadas.
+    Cada celda puede llevar como cuarto elemento (y `output` en `version`) la versión que leyó el
+    cliente; las que otro usuario cambió después no se guardan y se cuentan en `conflicts`.
+    """
+    group_upper, error = _capture_group_or_error(group)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 403
+
+    payload = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+    selected_date_str = payload.get('fecha') or request.args.get('fecha') or get_business_date().strftime('%Y-%m-%d')
+    try:
+        selected_date = datetime.strptime(selected_date_str, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return jsonify({'status': 'error', 'message': 'Fecha inválida.'}), 400
+
+    if request.method == 'GET':
+        return jsonify(services.get_capture_state(group_upper, selected_date))
+
+    layout = services.get_capture_layout(group_upper)
+    areas, turnos, horas = layout['areas'], layout['turnos'], layout['horas']
+    pronosticos, producciones, versions, rejected = {}, {}, {}, 0
+    try:
+        for a, t, raw, *version in payload.get('pronostico', []):
+            value = _parse_capture_value(raw)
+            if value is None or not (0 <= a < len(areas) and 0 <= t < len(turnos)):
+                rejected += 1
+                continue
+            pronosticos[(areas[a], turnos[t])] = value
+            if version:
+                versions[('pronostico', areas[a], turnos[t])] = int(version[0])
+        for a, h, raw, *version in payload.get('produccion', []):
+            value = _parse_capture_value(raw)
+            if value is None or not (0 <= a < len(areas) and 0 <= h < len(horas)):
+                rejected += 1
+                continue
+            producciones[(areas[a], horas[h])] = value
+            if version:
+                versions[('produccion', areas[a], horas[h])] = int(version[0])
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Formato de celdas inválido.'}), 400
+
+    output = payload.get('output') or {}
+    new_pron_out = _parse_capture_value(output.get('pronostico')) if output.get('pronostico') not in (None, '') else None
+    new_prod_out = _parse_capture_value(output.get('output')) if output.get('output') not in (None, '') else None
+    if isinstance(output.get('version'), int):
+        versions[('output',)] = output['version']
+
+    try:
+        changed_pron, changed_prod, output_changed, conflicts = _save_capture(group_upper, selected_date, pronosticos, producciones, new_pron_out, new_prod_out, versions)
+    except exc.SQLAlchemyError as e:
+        db_session.rollback()
+        return jsonify({'status': 'error', 'message': f'Error al guardar en la base de datos: {e}'}), 500
+
+    state = services.get_capture_state(group_upper, selected_date)
+    area_idx = {area: i for i, area in enumerate(areas)}
+    turno_idx = {turno: i for i, turno in enumerate(turnos)}
+    hora_idx = {hora: i for i, hora in enumerate(horas)}
+    # Un cambio de pronóstico recalcula la clase de todas las horas de ese turno.
+    cells = {(area_idx[area], hora_idx[hora]) for area, hora in changed_prod}
+    for area, turno in changed_pron:
+        cells.update((area_idx[area], h) for h in layout['turno_horas'][turno_idx[turno]])
+
+    changed = bool(changed_pron or changed_prod or output_changed)
+    message = 'Cambios guardados exitosamente.' if changed else 'No se detectaron cambios.'
+    if rejected:
+        message += f' Se ignoraron {rejected} valores no válidos.'
+    if conflicts:
+        message += f' Otro usuario modificó {len(conflicts)} valores; se conservaron sus cambios.'
+    return jsonify({
+        'status': 'success',
+        'message': message,
+        'changed': changed,
+        'pronostico': sorted([a, t, state['pronostico'][a][t], state['pronostico_version'][a][t]]
+                             for a, t in ((area_idx[area], turno_idx[turno]) for area, turno in changed_pron)),
+        'produccion': [[a, h, state['produccion'][a][h], state['clase'][a][h], state['produccion_version'][a][h]] for a, h in sorted(cells)],
+        'output': state['output'] if output_changed else None,
+        'conflicts': len(conflicts),
+    })
+
+CELL_KINDS = ('pronostico', 'produccion', 'output_pronostico', 'output_output')
+
+def _cell_conflict(message, value, version):
+    return jsonify({'status': 'conflict', 'message': message, 'value': value, 'version': version}), 409
+
+@bp.route('/api/captura/<group>/celda', methods=['POST'])
+@login_required
+@permission_required('captura.access')
+@csrf_required
+def captura_autosave(group):
+    """Autoguardado de una sola celda con concurrencia optimista.
+
+    Recibe `{kind, a, i, value, version, fecha}`; `version` es la que el cliente leyó (0 si la fila no
+    existía). Si otro usuario la cambió antes, responde 409 con el valor y la versión actuales.
+    """
+    group_upper, error = _capture_group_or_error(group)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 403
+
+    payload = request.get_json(silent=True) or {}
+    kind = payload.get('kind')
+    value = _parse_capture_value(payload.get('value'))
+    try:
+        selected_date = datetime.strptime(payload.get('fecha') or '', '%Y-%m-%d').date()
+        a, i, expected = int(payload.get('a', 0)), int(payload.get('i', 0)), int(payload.get('version', 0))
+    except (ValueError, TypeError):
+        return jsonify({'status': 'error', 'message': 'Solicitud de autoguardado inválida.'}), 400
+    if kind not in CELL_KINDS or value is None:
+        return jsonify({'status': 'error', 'message': 'Valor no válido.'}), 400
+
+    layout = services.get_capture_layout(group_upper)
+    if kind in ('pronostico', 'produccion'):
+        axis = layout['turnos'] if kind == 'pronostico' else layout['horas']
+        if not (0 <= a < len(layout['areas']) and 0 <= i < len(axis)):
+            return jsonify({'status': 'error', 'message': 'Celda fuera de rango.'}), 400
+        area = layout['areas'][a]
+    username, now_dt = session.get('username'), now_mexico()
+
+    try:
+        if kind == 'pronostico':
+            turno = layout['turnos'][i]
+            model, field = Pronostico, Pronostico.valor_pronostico
+            filters = dict(fecha=selected_date, grupo=group_upper, area=area, turno=turno)
+            new_row = dict(filters, valor_pronostico=value)
+            extra = {}
+            log_name, log_detail = "Pronóstico", f"Area: {area}, Turno: {turno}"
+        elif kind == 'produccion':
+            hora = layout['horas'][i]
+            model, field = ProduccionCaptura, ProduccionCaptura.valor_producido
+            filters = dict(fecha=selected_date, grupo=group_upper, area=area, hora=hora)
+            extra = {ProduccionCaptura.usuario_captura: username, ProduccionCaptura.fecha_captura: now_dt}
+            new_row = dict(filters, valor_producido=value, usuario_captura=username, fecha_captura=now_dt)
+            log_name, log_detail = "Producción", f"Area: {area}, Hora: {hora}"
+        else:
+            model = OutputData
+            field = OutputData.pronostico if kind == 'output_pronostico' else OutputData.output
+            filters = dict(fecha=selected_date, grupo=group_upper)
+            extra = {OutputData.usuario_captura: username, OutputData.fecha_captura: now_dt}
+            new_row = dict(filters, pronostico=0, output=0, usuario_captura=username, fecha_captura=now_dt)
+            new_row[field.key] = value
+            log_name, log_detail = "Output", "Pronóstico" if kind == 'output_pronostico' else "Producción"
+
+        current = db_session.query(model.id, field, model.version).filter_by(**filters).first()
+        if current is None:
+            if expected != 0:
+                return _cell_conflict('El registro fue eliminado por otro usuario.', None, 0)
+            db_session.add(model(**new_row))
+            db_session.add(activity_entry(f"Creación {log_name}", f"{log_detail}. Valor: {value}", group_upper, 'Datos', 'Info'))
+            rollups.invalidate(selected_date, group_upper)
+            try:
+                db_session.commit()
+            except exc.IntegrityError:
+                db_session.rollback()
+                current = db_session.query(field, model.version).filter_by(**filters).first()
+                return _cell_conflict('Otro usuario capturó este valor al mismo tiempo. Se cargó el valor actual.', current[0], current[1])
+            version, old_val = 1, None
+        else:
+            old_val = current[1]
+            if current.version != expected:
+                return _cell_conflict('Otro usuario modificó este valor. Se cargó el valor actual.', old_val, current.version)
+            if old_val == value:
+                return jsonify({'status': 'success', 'changed': False, 'value': value, 'version': current.version, 'clases': []})
+            updated = db_session.query(model).filter(model.id == current.id, model.version == expected).update(
+                {**extra, field: value, model.version: model.version + 1}, synchronize_session=False)
+            if not updated:
+                db_session.rollback()
+                latest = db_session.query(field, model.version).filter(model.id == current.id).first()
+                return _cell_conflict('Otro usuario modificó este valor. Se cargó el valor actual.', latest[0], latest[1])
+            db_session.add(activity_entry(f"Modificación {log_name}", f"{log_detail}. Valor: {old_val} -> {value}", group_upper, 'Datos', 'Info'))
+            rollups.invalidate(selected_date, group_upper)
+            db_session.commit()
+            version = expected + 1
+        ACTIVITY_LOG_WRITES.inc(result='ok')
+    except exc.SQLAlchemyError as e:
+        db_session.rollback()
+        return jsonify({'status': 'error', 'message': f'Error al guardar en la base de datos: {e}'}), 500
+
+    # Clases de éxito/advertencia que cambian con esta celda: la hora editada, o todas las del turno.
+    clases = []
+    if kind == 'pronostico':
+        horas = [layout['horas'][h] for h in layout['turno_horas'][i]]
+        valores = dict(db_session.query(ProduccionCaptura.hora, ProduccionCaptura.valor_producido).filter(
+            ProduccionCaptura.fecha == selected_date, ProduccionCaptura.grupo == group_upper,
+            ProduccionCaptura.area == area, ProduccionCaptura.hora.in_(horas)).all())
+        clases = [[h, services.get_capture_class(valores.get(layout['horas'][h]), value, turno)] for h in layout['turno_horas'][i]]
+    elif kind == 'produccion':
+        turno = TURNO_DE_HORA[layout['horas'][i]]
+        pronostico = db_session.query(Pronostico.valor_pronostico).filter_by(
+            fecha=selected_date, grupo=group_upper, area=area, turno=turno).scalar()
+        clases = [[i, services.get_capture_class(value, pronostico, turno)]]
+    return jsonify({'status': 'success', 'changed': True, 'value': value, 'version': version, 'clases': clases})
+
 @bp.route('/submit_reason', methods=['POST'])
 @login_required
 @permission_required('captura.access')
@@ -351,6 +808,7 @@ def borrar_datos_fecha(group, fecha):
         db_session.query(ProduccionCaptura).filter_by(fecha=selected_date, grupo=group_upper).delete()
         db_session.query(Pronostico).filter_by(fecha=selected_date, grupo=group_upper).delete()
         db_session.query(OutputData).filter_by(fecha=selected_date, grupo=group_upper).delete()
+        rollups.invalidate(selected_date, group_upper)
         db_session.commit()
         log_activity("Borrado Masivo de Datos", f"Se eliminaron todos los datos del grupo {group_upper} para la fecha {fecha}.", group_upper, 'Seguridad', 'Critical')
         flash(f"Todos los datos de producción para el grupo {group_upper} del día {fecha} han sido eliminados.", "success")
@@ -359,4 +817,8 @@ def borrar_datos_fecha(group, fecha):
         log_activity("Error en Borrado Masivo", f"Error al intentar borrar datos: {e}", group_upper, "Error", "Critical")
         flash(f"Ocurrió un error al intentar eliminar los datos: {e}", "danger")
         
-    return redirect(url_for('production.captura', group=group, fecha=fecha))
\ No newline at end of file
+    return redirect(url_for('production.captura', group=group, fecha=fecha))
+
+register_export('excel_reportes', build_reportes_excel, permission='reportes.view', download_name='Reporte_Produccion_{desde}_{hasta}.xlsx',
+                log_action='Exportación Excel Reportes', area_grupo='REPORTES', detail='{} días exportados.',
+                empty_message='No hay captura en el periodo seleccionado.', params=parse_reportes_export_params)
@@ -0,0 +1,186 @@
+import sys
+import json
+import heapq
+import random
+import marshal
+import itertools
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, session
+
+
+class StackSampler(threading.Thread):
+    """Muestrea la pila de un hilo cada `interval` segundos mientras la petición está en curso."""
+    def __init__(self, thread_id, interval, max_depth=128):
+        super().__init__(daemon=True, name=f'profiler-{thread_id}')
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                # Se guarda de la raíz a la hoja, como lo espera speedscope.
+                self.samples[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+class ProfileStore:
+    """Guarda los N perfiles más lentos por endpoint; los más rápidos se descartan al llenarse."""
+    def __init__(self, per_endpoint, max_endpoints=100):
+        self.per_endpoint = per_endpoint
+        self.max_endpoints = max_endpoints
+        self._heaps = {}
+        self._by_id = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            profile['id'] = next(self._ids)
+            heap = self._heaps.get(profile['endpoint'])
+            if heap is None:
+                if len(self._heaps) >= self.max_endpoints:
+                    return None
+                heap = self._heaps[profile['endpoint']] = []
+            entry = (profile['duration_ms'], profile['id'], profile)
+            if len(heap) < self.per_endpoint:
+                heapq.heappush(heap, entry)
+            elif entry[0] > heap[0][0]:
+                dropped = heapq.heapreplace(heap, entry)
+                self._by_id.pop(dropped[1], None)
+            else:
+                return None
+            self._by_id[profile['id']] = profile
+            return profile['id']
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._by_id.get(profile_id)
+
+    def list(self):
+        with self._lock:
+            profiles = list(self._by_id.values())
+        return sorted(profiles, key=lambda p: (p['endpoint'], -p['duration_ms']))
+
+    def clear(self):
+        with self._lock:
+            self._heaps.clear()
+            self._by_id.clear()
+
+
+store = ProfileStore(per_endpoint=5)
+
+
+def to_pstats(profile):
+    """Convierte las muestras al formato marshal de `pstats`, con tiempos estimados a partir del intervalo."""
+    interval = profile['interval_ms'] / 1000.0
+    stats = {}
+
+    def entry(func):
+        if func not in stats:
+            stats[func] = [0, 0, 0.0, 0.0, {}]
+        return stats[func]
+
+    for stack, count in profile['samples'].items():
+        weight = count * interval
+        seen = set()
+        for depth, func in enumerate(stack):
+            data = entry(func)
+            if func not in seen:
+                seen.add(func)
+                data[0] += count
+                data[1] += count
+                data[3] += weight
+            if depth + 1 == len(stack):
+                data[2] += weight
+            if depth > 0:
+                caller = stack[depth - 1]
+                nc, cc, tt, ct = data[4].get(caller, (0, 0, 0.0, 0.0))
+                data[4][caller] = (nc + count, cc + count, tt + (weight if depth + 1 == len(stack) else 0.0), ct + weight)
+    return marshal.dumps({func: (cc, nc, tt, ct, callers) for func, (cc, nc, tt, ct, callers) in stats.items()})
+
+
+def to_speedscope(profile):
+    """Exporta las muestras como perfil `sampled` de speedscope (https://www.speedscope.app)."""
+    frames, frame_index = [], {}
+    samples, weights = [], []
+    for stack, count in profile['samples'].items():
+        indexed = []
+        for filename, line, name in stack:
+            key = (filename, line, name)
+            if key not in frame_index:
+                frame_index[key] = len(frames)
+                frames.append({'name': name, 'file': filename, 'line': line})
+            indexed.append(frame_index[key])
+        samples.append(indexed)
+        weights.append(count * profile['interval_ms'])
+    name = f"{profile['method']} {profile['path']} ({profile['duration_ms']:.0f} ms)"
+    return json.dumps({
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'nidec-profiler',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled', 'name': name, 'unit': 'milliseconds',
+            'startValue': 0, 'endValue': sum(weights),
+            'samples': samples, 'weights': weights,
+        }],
+    })
+
+
+def _should_profile(app):
+    if request.endpoint in (None, 'static'):
+        return None
+    if request.headers.get(app.config['PROFILING_HEADER']) and session.get('role') in ['ADMIN', 'ARTISAN']:
+        return 'header'
+    rate = app.config['PROFILING_SAMPLE_RATE']
+    if rate > 0 and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def init_app(app):
+    """Perfila por muestreo de pila una fracción de las peticiones, o las que pide un admin por cabecera."""
+    if not app.config['PROFILING_ENABLED']:
+        return
+    store.per_endpoint = app.config['PROFILING_KEEP_PER_ENDPOINT']
+    interval_ms = app.config['PROFILING_INTERVAL_MS']
+
+    @app.before_request
+    def _start_profiler():
+        reason = _should_profile(app)
+        if reason is None:
+            return
+        sampler = StackSampler(threading.get_ident(), interval_ms / 1000.0)
+        g.profiler = (sampler, reason, time.perf_counter(), datetime.now())
+        sampler.start()
+
+    @app.teardown_request
+    def _stop_profiler(exc):
+        if 'profiler' not in g:
+            return
+        sampler, reason, started, started_at = g.pop('profiler')
+        samples = sampler.stop()
+        if not samples:
+            return
+        store.add({
+            'endpoint': request.endpoint, 'method': request.method, 'path': request.full_path.rstrip('?'),
+            'reason': reason, 'started_at': started_at, 'duration_ms': (time.perf_counter() - started) * 1000,
+            'interval_ms': interval_ms, 'samples': samples, 'sample_count': sum(samples.values()),
+        })
@@ -0,0 +1,935 @@
+# app/programs.py
+"""Motor común de los programas de producción (LM, Rotores, ...).
+
+Cada programa es una tabla de órdenes con columnas libres: una orden (`Orden*`), las columnas
+definidas por el administrador (`Columna*`) y una celda por orden y columna (`DatoCelda*`).
+`programa_lm.py` y `programa_rotores.py` solo declaran un `ProgramDefinition` con sus modelos,
+campos fijos, filtros y permisos; `create_blueprint` registra las mismas rutas para todos:
+pendientes, aprobados, búsqueda, cambio de estado, edición de celdas (también por lotes), alta,
+edición y baja de órdenes, acciones masivas (aprobar, devolver a pendientes o eliminar las órdenes
+marcadas o todas las filtradas), exportación a Excel y, si el programa tiene `column_permission`,
+la gestión de columnas (anchos, orden, alta y baja).
+
+Además de la vista paginada, la "vista completa" (static/js/virtual_grid.js) recorre todas las
+pendientes: pide bloques de filas a `rows_<key>` y solo crea en el DOM las que se ven. Cada bloque
+sigue al anterior por llave (timestamp, id) con el cursor que devolvió, así que ni el servidor lee
+OFFSET crecientes ni guarda estado entre peticiones.
+
+El acceso a datos también es uno solo: las celdas de la página se leen como tuplas en una
+consulta, los duplicados se calculan con GROUP BY en la base y el Excel se escribe en streaming
+(una consulta ordenada con yield_per y xlsxwriter en modo constant_memory). Un programa nuevo
+necesita sus tres modelos, sus plantillas (`programa_<key>.html`, `<key>_aprobados.html`,
+`<key>_search_results.html`) y una definición; los endpoints conservan los nombres de siempre
+(`lm.update_cell_lm`, `rotores.export_excel_rotores`, ...).
+
+Las celdas pueden guardarse de dos formas (PROGRAM_CELL_STORAGE). Con 'filas' (la de siempre) cada
+celda es una fila de `datos_celda_*`. Con 'documento' cada orden lleva todas sus celdas en la columna
+JSON/JSONB `celdas_doc` como {"<columna_id>": {"v": valor, "s": estilo_id}}: una página es una sola
+lectura por orden, las ediciones tocan solo las claves que cambian (jsonb_set en PostgreSQL,
+json_set en SQLite) y la búsqueda por valor de celda usa el índice GIN de `celdas_doc`. Para pasar
+de un modo a otro se copian los datos con `flask db-backfill celdas_<key>_documento` (o
+`celdas_<key>_filas` para volver) y se cambia la variable; conviene repetir el backfill con
+--restart justo antes del cambio para llevar las ediciones hechas mientras tanto.
+"""
+import io
+import json
+import math
+import time
+from datetime import datetime
+from collections import namedtuple, defaultdict
+from itertools import chain, groupby
+from operator import itemgetter
+
+import xlsxwriter
+from flask import (Blueprint, render_template, request, redirect, url_for, session,
+                   flash, jsonify, send_file)
+from sqlalchemy import select, update, delete, insert, func, exc, or_, and_, cast, null, literal_column, bindparam, Text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
+from . import db_session, engine, styles
+from .migrations import backfill
+from .decorators import login_required, permission_required, csrf_required
+from .utils import log_activity, activity_entry
+from .metrics import observe_export, ACTIVITY_LOG_WRITES
+from .exports import register_export, XLSX_MIMETYPE
+
+PER_PAGE = 15
+CELL_CHUNK = 900
+EXPORT_BATCH = 2000
+# Filas por petición de la vista completa (por omisión y máximo).
+RANGE_BLOCK = 200
+RANGE_MAX = 500
+# Claves de orden que se citan en el registro de una acción masiva.
+BULK_SAMPLE = 10
+
+# Acción masiva -> (estado de las órdenes a las que aplica, estado nuevo; None es eliminarlas).
+BULK_ACTIONS = {'aprobar': ('Pendiente', 'Aprobada'), 'revertir': ('Aprobada', 'Pendiente'), 'eliminar': ('Pendiente', None)}
+
+CELL_STORAGES = ('filas', 'documento')
+
+_settings = {'storage': 'filas'}
+
+# name: atributo del modelo de orden (y campo del formulario); label: encabezado; type: str o int.
+ProgramField = namedtuple('ProgramField', 'name label type')
+
+# Celda lista para las plantillas: estilos_css es el JSON del menú de la celda y css el atributo style.
+Celda = namedtuple('Celda', 'valor estilos_css css')
+
+
+def configure(storage='filas'):
+    if storage not in CELL_STORAGES:
+        raise ValueError(f"PROGRAM_CELL_STORAGE debe ser uno de {CELL_STORAGES}, no '{storage}'.")
+    _settings['storage'] = storage
+
+
+class Pagination:
+    def __init__(self, query, page, per_page):
+        self.query = query
+        self.page = max(page, 1)
+        self.per_page = per_page
+        self.items = query.limit(per_page).offset((self.page - 1) * per_page).all()
+        # Si la página no se llenó ya se sabe el total y se evita el COUNT.
+        if 0 < len(self.items) < per_page or (self.page == 1 and not self.items):
+            self.total_count = (self.page - 1) * per_page + len(self.items)
+        else:
+            self.total_count = query.order_by(None).count()
+    @property
+    def pages(self): return math.ceil(self.total_count / self.per_page) if self.per_page > 0 else 0
+    @property
+    def has_prev(self): return self.page > 1
+    @property
+    def prev_num(self): return self.page - 1
+    @property
+    def has_next(self): return self.page < self.pages
+    @property
+    def next_num(self): return self.page + 1
+    def iter_pages(self, left_edge=2, left_current=2, right_current=2, right_edge=2):
+        last = 0
+        for num in range(1, self.pages + 1):
+            if num <= left_edge or (self.page - left_current - 1 < num < self.page + right_current + 1) or num > self.pages - right_edge:
+                if last + 1 != num: yield None
+                yield num; last = num
+
+
+def has_permission(permission):
+    return session.get('role') in ['ADMIN', 'ARTISAN'] or permission in session.get('permissions', [])
+
+
+class ProgramDefinition:
+    """Configuración de un programa: modelos, campos fijos de la orden, filtros y permisos.
+
+    `fields[0]` es la clave única de la orden (WIP Order en LM, Item en Rotores). `filters` son
+    pares (argumento GET, campo). `add_permission`/`row_permission` controlan alta y edición/baja
+    de órdenes; `column_permission` habilita la gestión de columnas, y sin el permiso `.admin`
+    solo se editan celdas de columnas con `editable_por_lm` (si el modelo de columna lo tiene).
+    Con `search_includes_approved` la vista de pendientes filtrada muestra también los aprobados
+    que coinciden; `duplicate_fields` marca las pendientes que repiten alguno de esos campos.
+    """
+    def __init__(self, key, nombre, orden_model, columna_model, celda_model, fields, filters,
+                 row_permission, add_permission=None, column_permission=None,
+                 search_includes_approved=False, duplicate_fields=()):
+        self.key = key
+        self.nombre = nombre
+        self.permission = f'programa_{key}'
+        self.area_grupo = f'PROGRAMA_{key.upper()}'
+        self.orden_model = orden_model
+        self.columna_model = columna_model
+        self.celda_model = celda_model
+        self.fields = tuple(fields)
+        self.key_field = self.fields[0]
+        self.filters = tuple(filters)
+        self.row_permission = row_permission
+        self.add_permission = add_permission or row_permission
+        self.column_permission = column_permission
+        self.search_includes_approved = search_includes_approved
+        self.duplicate_fields = tuple(duplicate_fields)
+        self.sheet_name = f'Ordenes_Pendientes_{nombre}'
+        self.download_name = f'Programa_{nombre}_Pendientes.xlsx'
+        self.stores = {'filas': _RowCells(self), 'documento': _DocumentCells(self)}
+        backfill(f'celdas_{key}_documento', f'Celdas de {nombre} de datos_celda a documento por orden',
+                 orden_model.__tablename__, batch_size=500)(self.stores['documento'].copy_from_rows)
+        backfill(f'celdas_{key}_filas', f'Celdas de {nombre} del documento por orden a datos_celda',
+                 orden_model.__tablename__, batch_size=500)(self.stores['filas'].copy_from_document)
+        backfill(f'celdas_{key}_estilos', f'Estilos de celda de {nombre} como id de estilos_celda',
+                 orden_model.__tablename__, batch_size=500)(self._intern_styles)
+
+    def _intern_styles(self, conn, first_id, last_id):
+        return sum(store.intern_styles(conn, first_id, last_id) for store in self.stores.values())
+
+    @property
+    def cells(self):
+        """Almacenamiento de celdas activo según PROGRAM_CELL_STORAGE."""
+        return self.stores[_settings['storage']]
+
+    def read_filters(self):
+        filtros = {arg: request.args.get(arg, '').strip() for arg, _ in self.filters}
+        # Búsqueda por valor exacto de una celda (solo en la página de búsqueda).
+        for arg in ('columna_id', 'valor_celda'):
+            if request.args.get(arg, '').strip():
+                filtros[arg] = request.args[arg].strip()
+        return filtros
+
+    def columns(self):
+        return db_session.query(self.columna_model).order_by(self.columna_model.orden, self.columna_model.id).all()
+
+    def orders_query(self, filtros, status=None):
+        O = self.orden_model
+        query = db_session.query(O)
+        if status:
+            query = query.filter(O.status == status)
+        for arg, field in self.filters:
+            if filtros.get(arg):
+                query = query.filter(getattr(O, field).ilike(f"%{filtros[arg]}%"))
+        if filtros.get('valor_celda') and filtros.get('columna_id', '').isdigit():
+            query = query.filter(self.cells.matching(int(filtros['columna_id']), filtros['valor_celda']))
+        return query.order_by(O.timestamp.desc(), O.id.desc())
+
+    def load_cells(self, orden_ids):
+        """{(orden_id, columna_id): Celda} de las órdenes dadas."""
+        datos = {}
+        orden_ids = list(orden_ids)
+        for i in range(0, len(orden_ids), CELL_CHUNK):
+            datos.update(self.cells.load(orden_ids[i:i + CELL_CHUNK]))
+        return datos
+
+    def rows_range(self, filtros, start, count, after=None, with_total=False):
+        """Pendientes `start`..`start + count - 1` para la vista completa, con sus celdas en el orden de las columnas.
+
+        Con `after` (cursor de la fila `start - 1`) la consulta sigue por llave desde esa fila; sin él
+        (primer bloque o salto con la barra de desplazamiento) usa OFFSET. `next` es el cursor para
+        el bloque siguiente. Con `with_total` incluye el total y los ids de columna que esperan las celdas.
+        """
+        O, C = self.orden_model, self.columna_model
+        query = self.orders_query(filtros, 'Pendiente')
+        columnas = db_session.scalars(select(C.id).order_by(C.orden, C.id)).all()
+        resultado = {'start': start}
+        if with_total:
+            resultado.update(total=query.order_by(None).count(), columns=columnas)
+
+        page = query.with_entities(O.id, O.timestamp, *(getattr(O, f.name) for f in self.fields))
+        if after:
+            timestamp, orden_id = after
+            page = page.filter(or_(O.timestamp < timestamp, and_(O.timestamp == timestamp, O.id < orden_id)))
+        else:
+            page = page.offset(start)
+        ordenes = page.limit(count).all()
+
+        orden_ids = [o.id for o in ordenes]
+        datos = self.load_cells(orden_ids)
+        duplicadas = self.duplicate_ids(orden_ids)
+        resultado['rows'] = [{'id': o.id, 'n': n, 'fields': list(o[2:]), 'duplicate': o.id in duplicadas,
+                              'cells': [[c.valor, c.css, c.estilos_css] if c else None for c in (datos.get((o.id, col)) for col in columnas)]}
+                             for n, o in enumerate(ordenes, start=start + 1)]
+        last = ordenes[-1] if len(ordenes) == count else None
+        resultado['next'] = _cursor(last.timestamp, last.id) if last and last.timestamp else None
+        return resultado
+
+    def bulk_scope(self, status, orden_ids=None, filtros=None):
+        """Condición de las órdenes en `status` con esos ids o, sin ids, de todas las que cumplen `filtros`."""
+        O = self.orden_model
+        if orden_ids is not None:
+            return and_(O.status == status, O.id.in_(orden_ids))
+        return O.id.in_(self.orders_query(filtros, status).with_entities(O.id).order_by(None).scalar_subquery())
+
+    def bulk_apply(self, accion, scope):
+        """Aplica `accion` (ver BULK_ACTIONS) a las órdenes de `scope` con un UPDATE/DELETE por tabla, sin commit.
+
+        Devuelve cuántas órdenes cambiaron y las claves de las primeras para el registro de actividad.
+        """
+        O, C = self.orden_model, self.celda_model
+        muestra = db_session.scalars(select(getattr(O, self.key_field.name)).where(scope).order_by(O.id).limit(BULK_SAMPLE)).all()
+        options = {'synchronize_session': False}
+        nuevo = BULK_ACTIONS[accion][1]
+        if nuevo is None:
+            db_session.execute(delete(C).where(C.orden_id.in_(select(O.id).where(scope))), execution_options=options)
+            result = db_session.execute(delete(O).where(scope), execution_options=options)
+        else:
+            result = db_session.execute(update(O).where(scope).values(status=nuevo), execution_options=options)
+        return result.rowcount, muestra
+
+    def duplicate_ids(self, orden_ids):
+        """Ids (de entre `orden_ids`) de órdenes pendientes que repiten algún campo de `duplicate_fields`."""
+        if not self.duplicate_fields or not orden_ids:
+            return set()
+        O = self.orden_model
+        condiciones = []
+        for name in self.duplicate_fields:
+            column = getattr(O, name)
+            repetidos = (select(column).where(O.status == 'Pendiente', column.isnot(None), column != '')
+                         .group_by(column).having(func.count() > 1))
+            condiciones.append(column.in_(repetidos))
+        return set(db_session.scalars(select(O.id).where(O.id.in_(list(orden_ids)), O.status == 'Pendiente', or_(*condiciones))))
+
+    def read_row(self, form, strict):
+        """Valores de los campos fijos desde el formulario; con `strict` un entero inválido lanza ValueError."""
+        values = {}
+        for field in self.fields:
+            if field.type is int:
+                values[field.name] = int(form.get(field.name)) if strict else form.get(field.name, 1, type=int)
+            else:
+                values[field.name] = form.get(field.name, '').strip()
+        return values
+
+    def export_columns(self):
+        """Columnas fijas del Excel: los campos de la orden, el estado y la fecha de creación."""
+        O = self.orden_model
+        return [getattr(O, f.name) for f in self.fields] + [O.status, O.timestamp]
+
+    def build_excel(self, output):
+        """Escribe en `output` (ruta o buffer) el Excel de órdenes pendientes; devuelve cuántas exportó.
+
+        Las órdenes se leen por lotes de una sola consulta ordenada (`cells.export_rows`) y cada una
+        se escribe en cuanto llega: la memoria no crece con el número de órdenes.
+        """
+        rows = iter(self.cells.export_rows())
+        first = next(rows, None)
+        if first is None:
+            return 0
+
+        columnas = self.columns()
+        fixed = len(self.fields) + 2
+        position = {c.id: fixed + i for i, c in enumerate(columnas)}
+        headers = [f.label for f in self.fields] + ['Status', 'Fecha Creación'] + [c.nombre for c in columnas]
+
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+        header_format = workbook.add_format({'bold': True, 'text_wrap': True, 'valign': 'top', 'fg_color': '#D7E4BC', 'border': 1})
+        worksheet = workbook.add_worksheet(self.sheet_name)
+        worksheet.write_row(0, 0, headers, header_format)
+        worksheet.set_column(0, len(headers) - 1, 20)
+
+        exported = 0
+        for exported, (values, valores) in enumerate(chain((first,), rows), start=1):
+            *values, timestamp = values
+            values.append(timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else '')
+            for col, value in enumerate(values):
+                if isinstance(value, (int, float)):
+                    worksheet.write_number(exported, col, value)
+                elif value:
+                    worksheet.write_string(exported, col, value)
+            # constant_memory exige escribir cada fila de izquierda a derecha.
+            for col, valor in sorted((position[c], v) for c, v in valores.items() if c in position and v):
+                worksheet.write_string(exported, col, valor)
+        workbook.close()
+        return exported
+
+
+def _cursor(timestamp, orden_id):
+    return f"{timestamp.isoformat()}_{orden_id}"
+
+
+def _read_cursor(value):
+    """(timestamp, id) de un cursor de `_cursor`; ValueError si no es válido."""
+    timestamp, _, orden_id = value.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(orden_id)
+
+
+def _style_id(estilos):
+    """Id de estilo a partir del formato anterior: JSON en texto (estilos_css) o dict en el documento."""
+    if isinstance(estilos, str):
+        try:
+            estilos = json.loads(estilos)
+        except ValueError:
+            return None
+    return styles.intern(estilos)
+
+
+def _celda(valor, style):
+    return Celda(valor, style.estilos_css, style.css) if style else Celda(valor, None, '')
+
+
+class _RowCells:
+    """Una fila de `datos_celda_*` por celda; el estilo es `estilo_id` (ver styles.py)."""
+    def __init__(self, p):
+        self.p = p
+
+    def load(self, orden_ids):
+        C = self.p.celda_model
+        rows = db_session.execute(select(C.orden_id, C.columna_id, C.valor, C.estilo_id, C.estilos_css)
+                                  .where(C.orden_id.in_(orden_ids))).all()
+        found = styles.get_many(row.estilo_id for row in rows)
+        return {(row.orden_id, row.columna_id): _celda(row.valor, found.get(row.estilo_id) if row.estilo_id else styles.from_legacy(row.estilos_css))
+                for row in rows}
+
+    def apply(self, cambios):
+        """Aplica {(orden, columna): [valor, estilos]} en la sesión; devuelve (editadas, limpiadas)."""
+        C = self.p.celda_model
+        existentes = {(c.orden_id, c.columna_id): c for c in db_session.query(C).filter(
+            C.orden_id.in_({orden_id for orden_id, _ in cambios}), C.columna_id.in_({columna_id for _, columna_id in cambios}))}
+        editadas, limpiadas = [], []
+        for (orden_id, columna_id), (valor, estilos_dict) in cambios.items():
+            celda = existentes.get((orden_id, columna_id))
+            estilo_id = styles.intern(estilos_dict) if estilos_dict is not None else None
+            if not celda and ((valor is not None and valor.strip()) or estilo_id):
+                celda = C(orden_id=orden_id, columna_id=columna_id)
+                db_session.add(celda)
+            if not celda:
+                continue
+            if valor is not None:
+                celda.valor = valor.strip()
+            if estilos_dict is not None:
+                celda.estilo_id, celda.estilos_css = estilo_id, None
+            if not (celda.valor and celda.valor.strip()) and not celda.estilo_id and not styles.from_legacy(celda.estilos_css):
+                db_session.delete(celda)
+                limpiadas.append((orden_id, columna_id))
+            else:
+                editadas.append((orden_id, columna_id))
+        return editadas, limpiadas
+
+    def matching(self, columna_id, valor):
+        C = self.p.celda_model
+        return self.p.orden_model.id.in_(select(C.orden_id).where(C.columna_id == columna_id, C.valor == valor))
+
+    def drop_column(self, columna_id):
+        pass  # las filas se van con la columna (ON DELETE CASCADE)
+
+    def export_rows(self):
+        """(valores fijos, {columna_id: valor}) de cada orden pendiente, de un join ordenado leído por lotes."""
+        O, C = self.p.orden_model, self.p.celda_model
+        stmt = (select(O.id, C.columna_id, C.valor, *self.p.export_columns())
+                .outerjoin(C, C.orden_id == O.id)
+                .where(O.status == 'Pendiente')
+                .order_by(O.timestamp.desc(), O.id.desc())
+                .execution_options(yield_per=EXPORT_BATCH))
+        for _, rows in groupby(db_session.execute(stmt), key=itemgetter(0)):
+            rows = list(rows)
+            yield tuple(rows[0][3:]), {row.columna_id: row.valor for row in rows if row.columna_id is not None}
+
+    def copy_from_document(self, conn, first_id, last_id):
+        """Backfill: reescribe las filas de celdas de las órdenes del rango a partir de `celdas_doc`."""
+        O, C = self.p.orden_model, self.p.celda_model
+        columnas = set(conn.scalars(select(self.p.columna_model.id)))
+        filas = []
+        for orden_id, doc in conn.execute(select(O.id, O.celdas_doc).where(O.id.between(first_id, last_id))).all():
+            for columna_id, cell in (doc or {}).items():
+                if int(columna_id) in columnas:
+                    estilo = cell.get('s')
+                    filas.append({'orden_id': orden_id, 'columna_id': int(columna_id), 'valor': cell.get('v'), 'estilos_css': None,
+                                  'estilo_id': estilo if isinstance(estilo, int) or estilo is None else _style_id(estilo)})
+        conn.execute(delete(C).where(C.orden_id.between(first_id, last_id)))
+        if filas:
+            conn.execute(insert(C), filas)
+        return len(filas)
+
+    def intern_styles(self, conn, first_id, last_id):
+        """Backfill: pasa el JSON de estilos_css de las celdas del rango a `estilo_id`."""
+        C = self.p.celda_model
+        rows = conn.execute(select(C.id, C.estilos_css).where(C.orden_id.between(first_id, last_id), C.estilos_css.isnot(None))).all()
+        if rows:
+            conn.execute(update(C).where(C.id == bindparam('b_id')).values(estilo_id=bindparam('b_estilo'), estilos_css=null()),
+                         [{'b_id': row.id, 'b_estilo': _style_id(row.estilos_css)} for row in rows])
+        return len(rows)
+
+
+class _DocumentCells:
+    """Todas las celdas de la orden en `celdas_doc`: {"<columna_id>": {"v": valor, "s": estilo_id}}."""
+    def __init__(self, p):
+        self.p = p
+
+    def load(self, orden_ids):
+        O = self.p.orden_model
+        docs = db_session.execute(select(O.id, O.celdas_doc).where(O.id.in_(orden_ids))).all()
+        found = styles.get_many(cell['s'] for _, doc in docs for cell in (doc or {}).values() if isinstance(cell.get('s'), int))
+        datos = {}
+        for orden_id, doc in docs:
+            for columna_id, cell in (doc or {}).items():
+                estilo = cell.get('s')
+                style = found.get(estilo) if isinstance(estilo, int) else styles.from_legacy(json.dumps(estilo) if estilo else None)
+                datos[(orden_id, int(columna_id))] = _celda(cell.get('v'), style)
+        return datos
+
+    def _patch(self, cells):
+        """Expresión que aplica {columna_id: celda o None} sobre `celdas_doc` sin reescribir las demás claves."""
+        column = self.p.orden_model.celdas_doc
+        if engine.dialect.name == 'postgresql':
+            doc = func.coalesce(column, cast({}, postgresql.JSONB))
+            for columna_id, cell in cells.items():
+                if cell is None:
+                    doc = doc.op('-')(cast(str(columna_id), Text))
+                else:
+                    doc = func.jsonb_set(doc, cast(postgresql.array([str(columna_id)]), postgresql.ARRAY(Text)),
+                                         cast(cell, postgresql.JSONB))
+            return doc
+        doc = func.coalesce(column, literal_column("'{}'"))
+        for columna_id, cell in cells.items():
+            path = f'$."{columna_id}"'
+            doc = func.json_remove(doc, path) if cell is None else func.json_set(doc, path, func.json(json.dumps(cell)))
+        return doc
+
+    def apply(self, cambios):
+        O = self.p.orden_model
+        docs = dict(db_session.execute(select(O.id, O.celdas_doc).where(O.id.in_({orden_id for orden_id, _ in cambios}))).all())
+        patches = defaultdict(dict)
+        editadas, limpiadas = [], []
+        for (orden_id, columna_id), (valor, estilos_dict) in cambios.items():
+            if orden_id not in docs:
+                raise LookupError(f"La orden {orden_id} no existe.")
+            actual = (docs[orden_id] or {}).get(str(columna_id)) or {}
+            nuevo_valor = valor.strip() if valor is not None else actual.get('v')
+            if estilos_dict is not None:
+                estilo_id = styles.intern(estilos_dict)
+            else:
+                estilo = actual.get('s')
+                estilo_id = estilo if isinstance(estilo, int) or not estilo else _style_id(estilo)
+            if nuevo_valor or estilo_id:
+                patches[orden_id][columna_id] = {'v': nuevo_valor, 's': estilo_id} if estilo_id else {'v': nuevo_valor}
+                editadas.append((orden_id, columna_id))
+            elif actual:
+                patches[orden_id][columna_id] = None
+                limpiadas.append((orden_id, columna_id))
+        for orden_id, cells in patches.items():
+            db_session.execute(update(O).where(O.id == orden_id).values(celdas_doc=self._patch(cells)))
+        return editadas, limpiadas
+
+    def matching(self, columna_id, valor):
+        column = self.p.orden_model.celdas_doc
+        if engine.dialect.name == 'postgresql':
+            # Contención (@>): la resuelve el índice GIN jsonb_path_ops de celdas_doc.
+            return column.op('@>')(cast({str(columna_id): {'v': valor}}, postgresql.JSONB))
+        return func.json_extract(column, f'$."{columna_id}".v') == valor
+
+    def drop_column(self, columna_id):
+        O = self.p.orden_model
+        db_session.execute(update(O).where(O.celdas_doc.isnot(None)).values(celdas_doc=self._patch({columna_id: None})))
+
+    def export_rows(self):
+        O = self.p.orden_model
+        stmt = (select(O.celdas_doc, *self.p.export_columns())
+                .where(O.status == 'Pendiente')
+                .order_by(O.timestamp.desc(), O.id.desc())
+                .execution_options(yield_per=EXPORT_BATCH))
+        for row in db_session.execute(stmt):
+            yield tuple(row[1:]), {int(columna_id): cell.get('v') for columna_id, cell in (row[0] or {}).items()}
+
+    def _save_docs(self, conn, docs):
+        O = self.p.orden_model
+        conn.execute(update(O).where(O.id == bindparam('b_id')).values(celdas_doc=bindparam('b_doc', type_=O.celdas_doc.type)),
+                     [{'b_id': orden_id, 'b_doc': doc} for orden_id, doc in docs.items()])
+
+    def copy_from_rows(self, conn, first_id, last_id):
+        """Backfill: arma `celdas_doc` de las órdenes del rango a partir de sus filas de celdas."""
+        O, C = self.p.orden_model, self.p.celda_model
+        docs = defaultdict(dict)
+        rows = conn.execute(select(C.orden_id, C.columna_id, C.valor, C.estilo_id, C.estilos_css)
+                            .where(C.orden_id.between(first_id, last_id))).all()
+        for row in rows:
+            estilo_id = row.estilo_id or _style_id(row.estilos_css)
+            docs[row.orden_id][str(row.columna_id)] = {'v': row.valor, 's': estilo_id} if estilo_id else {'v': row.valor}
+        conn.execute(update(O).where(O.id.between(first_id, last_id)).values(celdas_doc=null()))
+        if docs:
+            self._save_docs(conn, docs)
+        return len(docs)
+
+    def intern_styles(self, conn, first_id, last_id):
+        """Backfill: cambia por su id los estilos que los documentos del rango aún guardan como dict."""
+        O = self.p.orden_model
+        docs = {}
+        for orden_id, doc in conn.execute(select(O.id, O.celdas_doc).where(O.id.between(first_id, last_id), O.celdas_doc.isnot(None))).all():
+            legacy = {key: cell for key, cell in (doc or {}).items() if isinstance(cell.get('s'), (dict, str))}
+            if legacy:
+                for cell in legacy.values():
+                    cell['s'] = _style_id(cell['s'])
+                    if not cell['s']:
+                        del cell['s']
+                docs[orden_id] = doc
+        if docs:
+            self._save_docs(conn, docs)
+        return len(docs)
+
+
+def _merge_cell_changes(data):
+    """Normaliza `{orden_id, columna_id, valor, estilos_css}` o `{'celdas': [...]}` a {(orden, columna): [valor, estilos]}.
+
+    Varios cambios a la misma celda se combinan en orden; None significa "no cambia".
+    """
+    cambios = data.get('celdas') if isinstance(data.get('celdas'), list) else [data]
+    merged = {}
+    for cambio in cambios:
+        key = (int(cambio.get('orden_id')), int(cambio.get('columna_id')))
+        actual = merged.setdefault(key, [None, None])
+        if cambio.get('valor') is not None:
+            actual[0] = str(cambio['valor'])
+        if cambio.get('estilos_css') is not None:
+            actual[1] = dict(cambio['estilos_css'])
+    return merged
+
+
+def create_blueprint(p):
+    """Blueprint `p.key` con todas las rutas del programa `p` (ver docstring del módulo)."""
+    bp = Blueprint(p.key, __name__)
+    view_permission, edit_permission, admin_permission = (f'{p.permission}.view', f'{p.permission}.edit', f'{p.permission}.admin')
+    index_endpoint = f'{p.key}.programa_{p.key}'
+
+    def route(rule, endpoint, *permissions, methods=('GET',)):
+        def decorator(f):
+            view = permission_required(*permissions)(f)
+            if 'POST' in methods:
+                view = csrf_required(view)
+            bp.add_url_rule(rule, endpoint, login_required(view), methods=list(methods))
+            return f
+        return decorator
+
+    def editable_columns(columnas):
+        """Ids de las columnas cuyas celdas puede editar el usuario (la misma regla que `update_cell`)."""
+        if has_permission(admin_permission):
+            return {c.id for c in columnas}
+        if has_permission(edit_permission):
+            return {c.id for c in columnas if getattr(c, 'editable_por_lm', True)}
+        return set()
+
+    def bulk_url(filtros):
+        return url_for(f'{p.key}.bulk_{p.key}', **{arg: valor for arg, valor in filtros.items() if valor})
+
+    def bulk_actions(status):
+        """(acción, etiqueta, clase del botón) que el usuario puede aplicar en masa a las órdenes en `status`."""
+        if status == 'Aprobada':
+            return [('revertir', 'Devolver a pendientes', 'btn-warning')] if has_permission(edit_permission) else []
+        acciones = [('aprobar', 'Aprobar', 'btn-success')] if has_permission(edit_permission) else []
+        if has_permission(p.row_permission):
+            acciones.append(('eliminar', 'Eliminar', 'btn-danger'))
+        return acciones
+
+    @route('/', f'programa_{p.key}', view_permission)
+    def programa():
+        try:
+            page = request.args.get('page', 1, type=int)
+            filtros = p.read_filters()
+            columnas = p.columns()
+            pagination = Pagination(p.orders_query(filtros, 'Pendiente'), page, per_page=PER_PAGE)
+            orden_ids = [o.id for o in pagination.items]
+            contexto = dict(ordenes=pagination.items, columnas=columnas, datos=p.load_cells(orden_ids), pagination=pagination,
+                            duplicate_ids=p.duplicate_ids(orden_ids), filtros=filtros, campos=p.fields,
+                            columnas_editables=editable_columns(columnas), rows_url=url_for(f'{p.key}.rows_{p.key}'),
+                            bulk_url=bulk_url(filtros), bulk_actions=bulk_actions('Pendiente'))
+
+            # Con filtros, LM muestra además las aprobadas que coinciden.
+            if p.search_includes_approved and any(filtros.values()):
+                pagination_apr = Pagination(p.orders_query(filtros, 'Aprobada'), page, per_page=PER_PAGE)
+                contexto.update(ordenes_aprobadas=pagination_apr.items, pagination_aprobados=pagination_apr,
+                                datos_aprobados=p.load_cells(o.id for o in pagination_apr.items))
+            return render_template(f'programa_{p.key}.html', **contexto)
+        except exc.SQLAlchemyError as e:
+            flash(f"Error crítico al cargar el programa {p.nombre}: {e}", "danger")
+            return redirect(url_for('production.dashboard'))
+
+    @route('/rows', f'rows_{p.key}', view_permission)
+    def rows():
+        """Bloque de la vista completa (JSON): ?start=N&count=M[&after=cursor][&total=1] más los filtros de la vista."""
+        start = max(request.args.get('start', 0, type=int), 0)
+        count = min(max(request.args.get('count', RANGE_BLOCK, type=int), 1), RANGE_MAX)
+        try:
+            after = _read_cursor(request.args['after']) if request.args.get('after') else None
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'Cursor inválido.'}), 400
+        try:
+            bloque = p.rows_range(p.read_filters(), start, count, after, with_total=request.args.get('total') == '1')
+            return jsonify({'status': 'success', **bloque})
+        except exc.SQLAlchemyError as e:
+            db_session.rollback()
+            return jsonify({'status': 'error', 'message': f'Error de base de datos: {e}'}), 500
+
+    @route('/aprobados', f'programa_{p.key}_aprobados', view_permission)
+    def aprobados():
+        try:
+            page = request.args.get('page', 1, type=int)
+            filtros = p.read_filters()
+            pagination = Pagination(p.orders_query(filtros, 'Aprobada'), page, per_page=PER_PAGE)
+            return render_template(f'{p.key}_aprobados.html', ordenes=pagination.items, columnas=p.columns(),
+                                   datos=p.load_cells(o.id for o in pagination.items), pagination=pagination, filtros=filtros,
+                                   bulk_url=bulk_url(filtros), bulk_actions=bulk_actions('Aprobada'))
+        except exc.SQLAlchemyError as e:
+            flash(f"Error al cargar las órdenes aprobadas de {p.nombre}: {e}", "danger")
+            return redirect(url_for(index_endpoint))
+
+    @route('/search', f'search_{p.key}', view_permission)
+    def search():
+        filtros = p.read_filters()
+        ordenes = p.orders_query(filtros).all() if any(filtros.values()) else []
+        return render_template(f'{p.key}_search_results.html', ordenes=ordenes, columnas=p.columns(),
+                               datos=p.load_cells(o.id for o in ordenes), filtros=filtros)
+
+    @route('/toggle_status/<int:orden_id>', f'toggle_status_{p.key}', edit_permission, methods=('POST',))
+    def toggle_status(orden_id):
+        try:
+            orden = db_session.get(p.orden_model, orden_id)
+            if orden:
+                orden.status = 'Aprobada' if orden.status == 'Pendiente' else 'Pendiente'
+                clave = getattr(orden, p.key_field.name)
+                flash(f"Orden '{clave}' marcada como {orden.status}.", "success")
+                db_session.commit()
+                log_activity(f"Cambio Estado Orden {p.nombre}", f"{p.key_field.label} '{clave}' a '{orden.status}'", p.area_grupo)
+            else:
+                flash("La orden no fue encontrada.", "danger")
+        except Exception as e:
+            db_session.rollback()
+            flash(f"Error al cambiar estado: {e}", "danger")
+        return redirect(request.referrer or url_for(index_endpoint))
+
+    @route('/bulk', f'bulk_{p.key}', edit_permission, admin_permission, p.row_permission, methods=('POST',))
+    def bulk():
+        """Aprobar, devolver a pendientes o eliminar varias órdenes en una transacción y un solo registro.
+
+        Aplica a las órdenes marcadas (`orden_ids`) o, con `todas=1`, a todas las que cumplen los
+        filtros de la vista (los de la URL del formulario).
+        """
+        accion = request.form.get('accion')
+        if accion not in BULK_ACTIONS:
+            flash("Acción masiva no válida.", "danger")
+            return redirect(request.referrer or url_for(index_endpoint))
+        status, nuevo = BULK_ACTIONS[accion]
+        if not has_permission(edit_permission if nuevo else p.row_permission):
+            flash("No tienes permiso para esta acción.", "danger")
+            return redirect(request.referrer or url_for(index_endpoint))
+
+        if request.form.get('todas') == '1':
+            scope = p.bulk_scope(status, filtros=p.read_filters())
+        else:
+            orden_ids = request.form.getlist('orden_ids', type=int)
+            if not orden_ids:
+                flash("No marcaste ninguna orden.", "warning")
+                return redirect(request.referrer or url_for(index_endpoint))
+            scope = p.bulk_scope(status, orden_ids)
+        try:
+            total, muestra = p.bulk_apply(accion, scope)
+            if total:
+                claves = ', '.join(muestra) + (f" y {total - len(muestra)} más" if total > len(muestra) else '')
+                if nuevo:
+                    db_session.add(activity_entry(f"Cambio Estado Masivo {p.nombre}", f"{total} órdenes de '{status}' a '{nuevo}'. {p.key_field.label}: {claves}", p.area_grupo))
+                else:
+                    db_session.add(activity_entry(f"Eliminación Masiva {p.nombre}", f"{total} órdenes eliminadas. {p.key_field.label}: {claves}", p.area_grupo, "Seguridad", "Critical"))
+            db_session.commit()
+            if total:
+                ACTIVITY_LOG_WRITES.inc(result='ok')
+        except exc.SQLAlchemyError as e:
+            db_session.rollback()
+            flash(f"Error en la acción masiva: {e}", "danger")
+            return redirect(request.referrer or url_for(index_endpoint))
+
+        if not total:
+            flash(f"Ninguna de las órdenes seleccionadas está en '{status}'.", "warning")
+        elif nuevo:
+            flash(f"{total} órdenes marcadas como {nuevo}.", "success")
+        else:
+            flash(f"{total} órdenes eliminadas.", "success")
+        return redirect(request.referrer or url_for(index_endpoint))
+
+    @route('/update_cell', f'update_cell_{p.key}', edit_permission, admin_permission, methods=('POST',))
+    def update_cell():
+        """Una celda (`{orden_id, columna_id, valor, estilos_css}`) o varias (`{'celdas': [...]}`) en una transacción."""
+        try:
+            cambios = _merge_cell_changes(request.json or {})
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({'status': 'error', 'message': 'Datos de celda inválidos.'}), 400
+        if not cambios:
+            return jsonify({'status': 'success', 'message': 'Sin cambios'})
+        try:
+            columna_ids = {columna_id for _, columna_id in cambios}
+            columnas = {c.id: c for c in db_session.query(p.columna_model).filter(p.columna_model.id.in_(columna_ids))}
+            if len(columnas) != len(columna_ids):
+                return jsonify({'status': 'error', 'message': 'Columna no encontrada'}), 404
+            if not has_permission(admin_permission) and not all(getattr(c, 'editable_por_lm', True) for c in columnas.values()):
+                return jsonify({'status': 'error', 'message': 'No tienes permiso para editar esta celda.'}), 403
+
+            editadas, limpiadas = p.cells.apply(cambios)
+            db_session.commit()
+
+            if len(cambios) > 1:
+                log_activity(f"Edición Celdas {p.nombre}", f"{len(editadas)} celdas editadas y {len(limpiadas)} limpiadas en una operación.", p.area_grupo)
+            elif limpiadas:
+                log_activity(f"Limpieza Celda {p.nombre}", f"Celda eliminada en Orden ID: {limpiadas[0][0]}, Col ID: {limpiadas[0][1]}", p.area_grupo)
+            elif editadas:
+                log_activity(f"Edición Celda {p.nombre}", f"Orden ID: {editadas[0][0]}, Col: {columnas[editadas[0][1]].nombre}", p.area_grupo)
+            return jsonify({'status': 'success', 'message': 'Celda actualizada' if len(cambios) == 1 else f'{len(cambios)} celdas actualizadas'})
+
+        except Exception as e:
+            db_session.rollback()
+            log_activity(f"Error Celda {p.nombre}", str(e), "Sistema", "Error")
+            return jsonify({'status': 'error', 'message': f'Error del servidor: {str(e)}'}), 500
+
+    @route('/add_row', f'add_row_{p.key}', p.add_permission, methods=('POST',))
+    def add_row():
+        clave = request.form.get(p.key_field.name, '').strip()
+        if not clave:
+            return jsonify({'status': 'error', 'message': f"El campo '{p.key_field.label}' es obligatorio y no puede consistir solo de espacios."})
+        try:
+            db_session.add(p.orden_model(**p.read_row(request.form, strict=False)))
+            db_session.commit()
+            log_activity(f"Creación Fila {p.nombre}", f"Nueva orden {p.key_field.label}: {clave}", p.area_grupo)
+            return jsonify({'status': 'success', 'message': 'Nueva orden agregada correctamente.'})
+        except IntegrityError:
+            db_session.rollback()
+            return jsonify({'status': 'error', 'message': f"{p.key_field.label} '{clave}' ya existe. No se pueden añadir duplicados."})
+        except Exception as e:
+            db_session.rollback()
+            return jsonify({'status': 'error', 'message': f"Ocurrió un error inesperado: {e}"})
+
+    @route('/edit_row/<int:orden_id>', f'edit_row_{p.key}', p.row_permission, methods=('POST',))
+    def edit_row(orden_id):
+        try:
+            orden = db_session.get(p.orden_model, orden_id)
+            if not orden:
+                flash("La orden que intentas editar no existe.", "danger")
+                return redirect(url_for(index_endpoint))
+
+            values = p.read_row(request.form, strict=True)
+            clave = values[p.key_field.name]
+            if not clave:
+                flash(f"El campo '{p.key_field.label}' es obligatorio.", "danger")
+                return redirect(url_for(index_endpoint))
+            key_column = getattr(p.orden_model, p.key_field.name)
+            if clave != getattr(orden, p.key_field.name) and db_session.query(p.orden_model.id).filter(key_column == clave).first():
+                flash(f"{p.key_field.label} '{clave}' ya pertenece a otra orden.", "danger")
+                return redirect(url_for(index_endpoint))
+
+            for name, value in values.items():
+                setattr(orden, name, value)
+            db_session.commit()
+            log_activity(f"Edición Fila {p.nombre}", f"Orden {p.key_field.label} '{clave}' (ID: {orden_id}) actualizada.", p.area_grupo)
+            flash("Orden actualizada correctamente.", "success")
+        except Exception as e:
+            db_session.rollback()
+            flash(f"Error al editar la orden: {e}", "danger")
+        return redirect(url_for(index_endpoint))
+
+    @route('/delete_row/<int:orden_id>', f'delete_row_{p.key}', p.row_permission, methods=('POST',))
+    def delete_row(orden_id):
+        try:
+            orden = db_session.get(p.orden_model, orden_id)
+            if orden:
+                clave = getattr(orden, p.key_field.name)
+                db_session.delete(orden)
+                db_session.commit()
+                log_activity(f"Eliminación Fila {p.nombre}", f"Orden {p.key_field.label} '{clave}' (ID: {orden_id}) eliminada.", p.area_grupo, "Seguridad", "Critical")
+                flash(f"La orden '{clave}' ha sido eliminada.", "success")
+            else:
+                flash("La orden que intentas eliminar no existe.", "danger")
+        except Exception as e:
+            db_session.rollback()
+            flash(f"Error al eliminar la orden: {e}", "danger")
+        return redirect(url_for(index_endpoint))
+
+    @route('/export/excel', f'export_excel_{p.key}', view_permission)
+    def export_excel():
+        started = time.perf_counter()
+        try:
+            output = io.BytesIO()
+            exported = p.build_excel(output)
+            if not exported:
+                flash('No hay órdenes pendientes para exportar.', 'warning')
+                return redirect(url_for(index_endpoint))
+            output.seek(0)
+            observe_export(f'excel_{p.key}', started, output.getbuffer().nbytes)
+
+            log_activity(f"Exportación Excel {p.nombre}", f"{exported} órdenes exportadas.", p.area_grupo)
+            return send_file(output, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=p.download_name)
+        except Exception as e:
+            log_activity(f"Error Exportación Excel {p.nombre}", str(e), "Sistema", "Error")
+            flash(f"Ocurrió un error al generar el archivo Excel: {e}", "danger")
+            return redirect(url_for(index_endpoint))
+
+    register_export(f'excel_{p.key}', p.build_excel, permission=view_permission, download_name=p.download_name,
+                    log_action=f'Exportación Excel {p.nombre}', area_grupo=p.area_grupo, detail='{} órdenes exportadas.',
+                    empty_message='No hay órdenes pendientes para exportar.')
+
+    if p.column_permission:
+        _add_column_routes(p, route, index_endpoint)
+    return bp
+
+
+def _add_column_routes(p, route, index_endpoint):
+    Columna = p.columna_model
+
+    def new_column(nombre):
+        max_orden = db_session.query(func.max(Columna.orden)).scalar() or 100
+        db_session.add(Columna(nombre=nombre, orden=max_orden + 1))
+
+    @route('/update_column_width', 'update_column_width', p.column_permission, methods=('POST',))
+    def update_column_width():
+        try:
+            data = request.json
+            columna = db_session.get(Columna, data.get('columna_id'))
+            if columna:
+                columna.ancho_columna = data.get('width')
+                db_session.commit()
+                return jsonify({'status': 'success'})
+            return jsonify({'status': 'error', 'message': 'Columna no encontrada'}), 404
+        except Exception as e:
+            db_session.rollback()
+            return jsonify({'status': 'error', 'message': str(e)}), 500
+
+    @route('/reorder_columns', 'reorder_columns', p.column_permission, methods=('POST',))
+    def reorder_columns():
+        try:
+            ordered_ids = []
+            for col_id in request.json.get('ordered_ids', []):
+                try:
+                    ordered_ids.append(int(col_id))
+                except (ValueError, TypeError):
+                    continue
+            columnas = {c.id: c for c in db_session.query(Columna).filter(Columna.id.in_(ordered_ids))}
+            for index, col_id in enumerate(ordered_ids):
+                if col_id in columnas:
+                    columnas[col_id].orden = index
+            db_session.commit()
+            log_activity(f"Reordenar Columnas {p.nombre}", "Nuevo orden guardado.", "ADMIN")
+            return jsonify({'status': 'success', 'message': 'Orden de columnas guardado.'})
+        except Exception as e:
+            db_session.rollback()
+            return jsonify({'status': 'error', 'message': str(e)}), 500
+
+    @route('/add_column', f'add_column_{p.key}', p.column_permission, methods=('POST',))
+    def add_column():
+        nombre_columna = request.form.get('nombre_columna')
+        if not nombre_columna:
+            flash("El nombre de la columna es obligatorio.", "danger")
+        elif db_session.query(Columna.id).filter_by(nombre=nombre_columna).first():
+            flash(f"La columna '{nombre_columna}' ya existe.", "warning")
+        else:
+            new_column(nombre_columna)
+            db_session.commit()
+            log_activity(f"Creación Columna {p.nombre}", f"Nueva columna creada: {nombre_columna}", "ADMIN")
+            flash("Nueva columna agregada exitosamente.", "success")
+        return redirect(url_for(index_endpoint))
+
+    @route('/delete_column/<int:columna_id>', f'delete_column_{p.key}', p.column_permission, methods=('POST',))
+    def delete_column(columna_id):
+        try:
+            columna = db_session.get(Columna, columna_id)
+            if columna:
+                nombre_columna = columna.nombre
+                p.cells.drop_column(columna_id)
+                db_session.delete(columna)
+                db_session.commit()
+                log_activity(f"Eliminación Columna {p.nombre}", f"Columna '{nombre_columna}' (ID: {columna_id}) eliminada.", "ADMIN", "Seguridad", "Critical")
+                flash(f"La columna '{nombre_columna}' y todos sus datos han sido eliminados.", "success")
+            else:
+                flash("La columna que intentas eliminar no existe.", "danger")
+        except exc.SQLAlchemyError as e:
+            db_session.rollback()
+            flash(f"Error al eliminar la columna: {e}", "danger")
+        return redirect(url_for(index_endpoint))
+
+    @route('/manage_columns', 'manage_columns', p.column_permission, methods=('POST',))
+    def manage_columns():
+        try:
+            anchos = {int(key.split('_')[1]): int(value) for key, value in request.form.items() if key.startswith('width_')}
+            for columna in db_session.query(Columna).filter(Columna.id.in_(anchos)):
+                columna.ancho_columna = anchos[columna.id]
+
+            nombre_nueva_columna = request.form.get('nombre_nueva_columna')
+            if nombre_nueva_columna:
+                if db_session.query(Columna.id).filter_by(nombre=nombre_nueva_columna).first():
+                    flash(f"La columna '{nombre_nueva_columna}' ya existe.", "warning")
+                else:
+                    new_column(nombre_nueva_columna)
+                    log_activity(f"Creación Columna {p.nombre}", f"Nueva columna: {nombre_nueva_columna}")
+                    flash(f"Columna '{nombre_nueva_columna}' agregada.", "success")
+
+            db_session.commit()
+            log_activity(f"Gestión de Columnas {p.nombre}", "Anchos y/o nuevas columnas guardados.", "ADMIN")
+            flash("Configuración de columnas actualizada.", "success")
+        except Exception as e:
+            db_session.rollback()
+            flash(f"Error al gestionar las columnas: {e}", "danger")
+            log_activity(f"Error Gestión Columnas {p.nombre}", str(e), severity="Error")
+        return redirect(url_for(index_endpoint))
@@ -0,0 +1,94 @@
+# app/rollups.py
+"""Resumen diario de pronóstico y producción (tabla kpi_diario).
+
+Solo se resumen días hábiles cerrados (anteriores a `get_business_date()`). Los reportes leen el
+resumen para esos días y consultan las tablas de captura únicamente para los días que no lo tienen.
+Si se corrige la captura de un día ya resumido, `invalidate` borra su resumen y el día vuelve a
+leerse en vivo hasta que el job de cierre lo reconstruya. `invalidate` también sube la revisión
+del día (tabla data_revisions) con la que se versionan cachés y ETags (services.get_data_version).
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from . import db_session
+from .models import Pronostico, ProduccionCaptura, OutputData, KpiDiario, DataRevision, dialect_insert
+from .utils import get_business_date
+
+GRUPOS = ['IHP', 'FHP']
+
+
+def rebuild_day(fecha):
+    """Recalcula el resumen de `fecha` para ambos grupos. Devuelve False si el día sigue abierto."""
+    if fecha >= get_business_date():
+        return False
+    pronosticos = db_session.query(Pronostico.grupo, Pronostico.area, func.sum(Pronostico.valor_pronostico)).filter(
+        Pronostico.fecha == fecha).group_by(Pronostico.grupo, Pronostico.area).all()
+    producidos = db_session.query(ProduccionCaptura.grupo, ProduccionCaptura.area, func.sum(ProduccionCaptura.valor_producido)).filter(
+        ProduccionCaptura.fecha == fecha).group_by(ProduccionCaptura.grupo, ProduccionCaptura.area).all()
+    outputs = {grupo: (pron, out) for grupo, pron, out in db_session.query(
+        OutputData.grupo, func.sum(OutputData.pronostico), func.sum(OutputData.output)).filter(
+        OutputData.fecha == fecha).group_by(OutputData.grupo).all()}
+
+    totals = {}
+    for grupo, area, valor in pronosticos:
+        totals.setdefault((grupo, area), [0, 0])[0] = valor or 0
+    for grupo, area, valor in producidos:
+        totals.setdefault((grupo, area), [0, 0])[1] = valor or 0
+    now = datetime.utcnow()
+    rows = [dict(fecha=fecha, grupo=grupo, area=area, pronostico=pron, producido=prod, actualizado=now)
+            for (grupo, area), (pron, prod) in totals.items() if grupo in GRUPOS]
+    for grupo in GRUPOS:
+        pron, out = outputs.get(grupo, (0, 0))
+        rows.append(dict(fecha=fecha, grupo=grupo, area=None, pronostico=pron or 0, producido=out or 0, actualizado=now))
+
+    db_session.query(KpiDiario).filter(KpiDiario.fecha == fecha).delete(synchronize_session=False)
+    db_session.bulk_insert_mappings(KpiDiario, rows)
+    db_session.commit()
+    return True
+
+
+def rebuild_range(start_date, end_date, only_missing=False):
+    """Reconstruye los días cerrados del rango; con `only_missing` solo los que no tienen resumen."""
+    end_date = min(end_date, get_business_date() - timedelta(days=1))
+    skip = set()
+    if only_missing:
+        # Un día está completo si tiene la fila de Output de cada grupo (invalidate borra por grupo).
+        skip = {row[0] for row in db_session.query(KpiDiario.fecha).filter(
+            KpiDiario.fecha.between(start_date, end_date), KpiDiario.area.is_(None)).group_by(
+            KpiDiario.fecha).having(func.count(KpiDiario.id) == len(GRUPOS))}
+    rebuilt = []
+    current = start_date
+    while current <= end_date:
+        if current not in skip and rebuild_day(current):
+            rebuilt.append(current)
+        current += timedelta(days=1)
+    return rebuilt
+
+
+def invalidate(fecha, grupo):
+    """Registra que la captura de un día cambió: sube su revisión y, si el día ya cerró, descarta su
+    resumen. Se llama en cada escritura de captura; no hace commit: va con la captura.
+    """
+    stmt = dialect_insert(DataRevision.__table__).values(fecha=fecha, grupo=grupo, revision=1)
+    db_session.execute(stmt.on_conflict_do_update(index_elements=['fecha', 'grupo'],
+                                                  set_={'revision': DataRevision.__table__.c.revision + 1}))
+    if fecha < get_business_date():
+        db_session.query(KpiDiario).filter(KpiDiario.fecha == fecha, KpiDiario.grupo == grupo).delete(synchronize_session=False)
+
+
+def get_period_totals(group, area, start_date, end_date):
+    """Totales diarios resumidos del rango: ({fecha: pronóstico}, {fecha: producido}, fechas cubiertas).
+
+    Con `area=None` suma todas las áreas más el Output del grupo, como los reportes GENERAL.
+    """
+    query = db_session.query(KpiDiario.fecha, KpiDiario.area, KpiDiario.pronostico, KpiDiario.producido).filter(
+        KpiDiario.grupo == group, KpiDiario.fecha.between(start_date, end_date))
+    pron_data, prod_data, covered = {}, {}, set()
+    for fecha, row_area, pronostico, producido in query:
+        if row_area is None:
+            covered.add(fecha)
+        if area is None or row_area == area:
+            pron_data[fecha] = pron_data.get(fecha, 0) + pronostico
+            prod_data[fecha] = prod_data.get(fecha, 0) + producido
+    return pron_data, prod_data, covered
@@ -0,0 +1,218 @@
+# app/scheduler.py
+"""Jobs en segundo plano con Flask-APScheduler.
+
+El scheduler arranca en cada worker de gunicorn. Los jobs que escriben en la base (resúmenes,
+archivado) solo corren en el worker que tiene el candado de líder: un advisory lock de PostgreSQL
+o, en SQLite, un flock sobre un archivo; ambos se liberan solos si el proceso muere y otro worker
+lo toma en su siguiente ejecución. Los que calientan cachés corren en todos, porque cada proceso
+tiene su propia caché en memoria.
+"""
+import os
+import time
+import threading
+from datetime import timedelta
+
+from flask_apscheduler import APScheduler
+from sqlalchemy import text
+
+from . import engine
+from .metrics import registry
+from .utils import HORAS_TURNO, AREAS_IHP, AREAS_FHP, get_business_date
+
+scheduler = APScheduler()
+
+JOB_DURATION = registry.histogram('nidec_job_duration_seconds', 'Duración de los jobs programados.', ('job',),
+                                  buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+JOB_RUNS = registry.counter('nidec_job_runs_total', 'Ejecuciones de jobs programados por resultado.', ('job', 'result'))
+JOB_LAST_SUCCESS = registry.gauge('nidec_job_last_success_timestamp_seconds', 'Hora (epoch) del último éxito de cada job.', ('job',))
+SCHEDULER_LEADER = registry.gauge('nidec_scheduler_leader', '1 si este proceso tiene el candado de líder de jobs.')
+
+# Clave fija del advisory lock de PostgreSQL para el líder de jobs.
+LEADER_LOCK_KEY = 7_203_001
+
+
+class LeaderLock:
+    """Candado de líder no bloqueante que se conserva mientras viva el proceso."""
+
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+        self._conn = None
+        self._fd = None
+
+    def is_leader(self):
+        if engine.dialect.name == 'postgresql':
+            return self._pg_is_leader()
+        return self._file_is_leader()
+
+    def _pg_is_leader(self):
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT 1"))
+                return True
+            except Exception:
+                # Se perdió la conexión y con ella el candado: se cierra y se intenta de nuevo abajo.
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+        # AUTOCOMMIT: el candado es de sesión, y sin transacción abierta la conexión no queda
+        # "idle in transaction" (idle_in_transaction_session_timeout la cerraría).
+        conn = engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        if conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {'k': LEADER_LOCK_KEY}).scalar():
+            self._conn = conn
+            return True
+        conn.close()
+        return False
+
+    def _file_is_leader(self):
+        if self._fd is not None:
+            return True
+        try:
+            import fcntl
+        except ImportError:
+            return True  # Windows: servidor de desarrollo de un solo proceso.
+        os.makedirs(os.path.dirname(self.lock_file), exist_ok=True)
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+
+_leader_lock = None
+_start_lock = threading.Lock()
+
+
+def _run_job(app, job_id, func, leader_only):
+    if leader_only:
+        leader = _leader_lock.is_leader()
+        SCHEDULER_LEADER.set(1 if leader else 0)
+        if not leader:
+            JOB_RUNS.inc(job=job_id, result='skipped')
+            return
+    started = time.perf_counter()
+    with app.app_context():
+        from . import db_session
+        try:
+            func(app)
+        except Exception as e:
+            db_session.rollback()
+            JOB_RUNS.inc(job=job_id, result='error')
+            app.logger.error(f"Error en el job {job_id}: {e}")
+            return
+        finally:
+            JOB_DURATION.observe(time.perf_counter() - started, job=job_id)
+            db_session.remove()
+    JOB_RUNS.inc(job=job_id, result='ok')
+    JOB_LAST_SUCCESS.set(time.time(), job=job_id)
+
+
+# --- Jobs ---
+
+def warm_dashboard_cache(app):
+    """Recalcula los dashboards del día hábil (y del anterior, para la tendencia) en este worker."""
+    from . import services
+    today = get_business_date()
+    services.get_dashboard_data(today)
+    services.get_dashboard_data(today - timedelta(days=1))
+
+
+def rebuild_kpi_rollups(app):
+    """Al cambiar el día hábil resume el día que cerró y cualquier día reciente sin resumen."""
+    from . import rollups
+    yesterday = get_business_date() - timedelta(days=1)
+    rollups.rebuild_day(yesterday)
+    rollups.rebuild_range(yesterday - timedelta(days=app.config['ROLLUP_LOOKBACK_DAYS']), yesterday, only_missing=True)
+
+
+def archive_old_logs(app):
+    from .log_archive import archive_activity_logs
+    from .models import ensure_monthly_partitions
+    archived = archive_activity_logs(app.config['LOG_RETENTION_MONTHS'], app.config['LOG_ARCHIVE_DIR'])
+    for month, count, path in archived:
+        app.logger.info(f"{month}: {count} registros de log archivados en {path}")
+    ensure_monthly_partitions()
+
+
+def cleanup_exports(app):
+    from . import exports
+    removed = exports.cleanup_exports(app)
+    if removed:
+        app.logger.info(f"{removed} archivos de exportación vencidos eliminados.")
+
+
+def precompute_reportes(app):
+    """Calcula los reportes del mes en curso para cada grupo y área en este worker."""
+    from . import services
+    today = get_business_date()
+    for group, areas in (('IHP', AREAS_IHP), ('FHP', AREAS_FHP)):
+        for area in ['GENERAL'] + [a for a in areas if a != 'Output']:
+            services.get_report_data(group, area, today)
+
+
+def _capture_hours():
+    """Horas (0-23) de HORAS_TURNO en formato cron: '10AM' -> 10, '12AM' -> 0, '1PM' -> 13."""
+    hours = []
+    for horas in HORAS_TURNO.values():
+        for hora in horas:
+            value, suffix = int(hora[:-2]), hora[-2:]
+            hours.append(value % 12 + (12 if suffix == 'PM' else 0))
+    return ','.join(str(h) for h in sorted(hours))
+
+
+def job_definitions(app):
+    """(id, función, solo líder, argumentos del trigger cron)."""
+    delay = app.config['SCHEDULER_WARM_DELAY_MIN']
+    return [
+        ('warm_dashboard_cache', warm_dashboard_cache, False, dict(hour=_capture_hours(), minute=delay)),
+        # 7:00 es el corte de get_business_date; se deja un margen para capturas de último minuto.
+        ('rebuild_kpi_rollups', rebuild_kpi_rollups, True, dict(hour=7, minute=5)),
+        ('precompute_reportes', precompute_reportes, False, dict(hour=7, minute=15)),
+        ('archive_old_logs', archive_old_logs, True, dict(hour=2, minute=30)),
+        # Los archivos están en el disco de cada instancia; en Render hay una sola.
+        ('cleanup_exports', cleanup_exports, True, dict(minute='*/15')),
+    ]
+
+
+def run_job_now(app, job_id):
+    """Ejecuta un job una vez en el proceso actual (CLI), sin candado de líder."""
+    for definition_id, func, _, _ in job_definitions(app):
+        if definition_id == job_id:
+            _run_job(app, job_id, func, leader_only=False)
+            return True
+    return False
+
+
+def _start(app):
+    global _leader_lock
+    with _start_lock:
+        if scheduler.running:
+            return
+        _leader_lock = LeaderLock(app.config['SCHEDULER_LOCK_FILE'])
+        scheduler.init_app(app)
+        for job_id, func, leader_only, cron in job_definitions(app):
+            scheduler.add_job(id=job_id, func=_run_job, args=(app, job_id, func, leader_only), trigger='cron',
+                              timezone=app.config['SCHEDULER_TIMEZONE'], coalesce=True, max_instances=1,
+                              misfire_grace_time=600, replace_existing=True, **cron)
+        scheduler.start()
+
+
+def init_app(app):
+    """Arranca el scheduler con la primera petición del proceso.
+
+    Así no corre en los comandos `flask ...` ni en el proceso padre del recargador de depuración,
+    que nunca atienden peticiones.
+    """
+    if not app.config['SCHEDULER_ENABLED']:
+        return
+
+    @app.before_request
+    def _start_scheduler():
+        if not scheduler.running:
+            _start(app)
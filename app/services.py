@@ -1,10 +1,148 @@
-from sqlalchemy import func, exc
+from sqlalchemy import func, exc, select, union_all, literal
 from datetime import datetime, date, timedelta
 import calendar
+import time
+from itertools import groupby
 
-from . import db_session
-from .models import Pronostico, ProduccionCaptura, OutputData
-from .utils import HORAS_TURNO, NOMBRES_TURNOS_PRODUCCION, AREAS_IHP, AREAS_FHP, get_hourly_target
+from . import db_session, rollups, snapshots
+from .cache import TTLCache
+from .models import Pronostico, ProduccionCaptura, OutputData, DataRevision
+from .dimensions import TURNO_DE_HORA
+from .utils import HORAS_TURNO, NOMBRES_TURNOS_PRODUCCION, AREAS_IHP, AREAS_FHP, get_hourly_target, get_business_date, get_kpi_color_class
+
+# Las claves incluyen la versión de los datos que cubre cada resultado: una captura hecha en
+# cualquier worker cambia la versión, así que no hace falta invalidar entre procesos.
+DASHBOARD_CACHE = TTLCache('dashboard', ttl=3600, max_entries=256, shared=True)
+REPORT_CACHE = TTLCache('reportes', ttl=6 * 3600, max_entries=512, shared=True)
+
+def _db_error(message, e):
+    """Registra el error; dentro de `snapshots.serve` los de BD suben para servir el último dato bueno en vez de ceros."""
+    print(f"{message}: {e}")
+    if isinstance(e, exc.SQLAlchemyError) and snapshots.guarded():
+        raise e
+
+def get_data_version(start_date, end_date=None, group=None):
+    """Firma de la captura del rango: suma de las revisiones de cada día (data_revisions) más
+    (filas, suma de `version`) de pronósticos, producción y output.
+
+    Toda escritura de captura pasa por `rollups.invalidate`, que sube la revisión del día en la
+    misma transacción, así que la suma crece con cada alta, baja o edición y la firma no se repite.
+    El conteo de filas cubre los datos cargados por fuera de la aplicación (p. ej. benchmarks).
+    """
+    end_date = end_date or start_date
+    parts = []
+    for i, model in enumerate((Pronostico, ProduccionCaptura, OutputData, DataRevision)):
+        value = DataRevision.revision if model is DataRevision else model.version
+        part = select(literal(i), func.count(), func.coalesce(func.sum(value), 0)).select_from(model).where(
+            model.fecha.between(start_date, end_date))
+        if group:
+            part = part.where(model.grupo == group)
+        parts.append(part)
+    return tuple(sorted(tuple(row) for row in db_session.execute(union_all(*parts)).all()))
+
+def get_dashboard_data(selected_date):
+    """Detalle por área, KPIs, output y vista de tablas de ambos grupos para un día.
+
+    Se cachea por versión de los datos, que también se devuelve (`version`) para las claves de
+    los fragmentos de plantilla. Si la base no responde se sirve el último dato bueno (app/snapshots.py).
+    """
+    return snapshots.serve(('dashboard', selected_date), lambda: _get_dashboard_data(selected_date))
+
+def _get_dashboard_data(selected_date):
+    version = get_data_version(selected_date)
+
+    def build():
+        fecha_str = selected_date.strftime('%Y-%m-%d')
+        detalle = get_detailed_performance_data(selected_date)
+        output = {g: get_output_data(g, fecha_str) for g in ('IHP', 'FHP')}
+        return {'detalle': detalle,
+                'kpis': {g: get_group_performance(g, fecha_str) for g in ('IHP', 'FHP')},
+                'output': output,
+                'vista': build_dashboard_view(detalle, output),
+                'version': version}
+    return DASHBOARD_CACHE.get_or_set(('dia', selected_date, version), build)
+
+def build_dashboard_view(detalle, output):
+    """Tablas de dashboard_admin en listas planas, con números ya formateados y clases de color.
+
+    La plantilla solo recorre filas y celdas: no suma, no formatea ni llama a `get_kpi_color`.
+    """
+    turnos = [{'nombre': t, 'corto': t.replace('Turno ', ''), 'horas': HORAS_TURNO[t], 'colspan': len(HORAS_TURNO[t]) + 2}
+              for t in NOMBRES_TURNOS_PRODUCCION]
+    grupos = []
+    for group in ('IHP', 'FHP'):
+        areas = []
+        for area, turnos_data in detalle.get(group, {}).items():
+            celdas, total_pron, total_prod = [], 0, 0
+            for turno in NOMBRES_TURNOS_PRODUCCION:
+                data = turnos_data[turno]
+                pron, prod = data['pronostico'], data['producido']
+                total_pron += pron or 0
+                total_prod += prod
+                celdas.append({
+                    'pronostico': f"{pron or 0:,.0f}",
+                    'producido': f"{prod:,.0f}",
+                    'horas': [(f"{h['valor']:,.0f}" if h['valor'] is not None else '-', h['class']) for h in data['horas'].values()],
+                    'eficiencia': f"{data['eficiencia']:.0f}%" if pron is not None and pron > 0 else '-',
+                    'eficiencia_class': f"eff-{get_kpi_color_class(data['eficiencia'])}" if pron is not None and pron > 0 else 'eff-neutral',
+                })
+            areas.append({'area': area, 'turnos': celdas, 'total_pronostico': f"{total_pron:,.0f}", 'total_producido': f"{total_prod:,.0f}"})
+        out = output.get(group) or {'pronostico': 0, 'output': 0}
+        grupos.append({'nombre': group, 'areas': areas,
+                       'output_pronostico': f"{out['pronostico']:,.0f}", 'output_producido': f"{out['output']:,.0f}"})
+    return {'turnos': turnos, 'columnas_turnos': sum(t['colspan'] for t in turnos), 'grupos': grupos}
+
+def get_report_data(group, selected_area, selected_date):
+    """(semanal, mensual, detalle del día) de reportes, cacheados por versión de los días que abarcan."""
+    return snapshots.serve(('reporte', group, selected_area, selected_date),
+                           lambda: _get_report_data(group, selected_area, selected_date))
+
+def _get_report_data(group, selected_area, selected_date):
+    start_of_week = selected_date - timedelta(days=selected_date.weekday())
+    end_of_month = selected_date.replace(day=calendar.monthrange(selected_date.year, selected_date.month)[1])
+    version = get_data_version(min(start_of_week, selected_date.replace(day=1)),
+                               max(start_of_week + timedelta(days=6), end_of_month), group)
+
+    def build():
+        weekly_data, monthly_data = get_optimized_report_data(group, selected_area, selected_date)
+        return weekly_data, monthly_data, get_daily_detailed_data(group, selected_area, selected_date)
+    return REPORT_CACHE.get_or_set(('reporte', group, selected_area, selected_date, version), build)
+
+REPORT_PERIODS = ('semana', 'mes', 'dia')
+
+def report_period_range(periodo, selected_date):
+    """(inicio, fin) de la semana (lunes a domingo), el mes o el día que contienen `selected_date`."""
+    if periodo == 'semana':
+        start = selected_date - timedelta(days=selected_date.weekday())
+        return start, start + timedelta(days=6)
+    if periodo == 'mes':
+        return selected_date.replace(day=1), selected_date.replace(day=calendar.monthrange(selected_date.year, selected_date.month)[1])
+    return selected_date, selected_date
+
+def get_report_period(group, selected_area, periodo, selected_date, version=None):
+    """Serie semanal o mensual, o detalle del día, de la API de reportes; cacheado por versión de datos.
+
+    `version` es la de `get_data_version` sobre el rango del periodo; la API la calcula antes para
+    el ETag y la pasa para no consultarla dos veces.
+    """
+    start, end = report_period_range(periodo, selected_date)
+    return snapshots.serve(('periodo', periodo, group, selected_area, start),
+                           lambda: _get_report_period(group, selected_area, periodo, start, end, version))
+
+def _get_report_period(group, selected_area, periodo, start, end, version):
+    if version is None:
+        version = get_data_version(start, end, group)
+
+    def build():
+        if periodo == 'dia':
+            return {'detalle': get_daily_detailed_data(group, selected_area, start)}
+        data = _get_period_data_optimized(group, None if selected_area == 'GENERAL' else selected_area, start, end)
+        if periodo == 'semana':
+            data['labels'] = [(start + timedelta(days=i)).strftime('%a %d') for i in range(7)]
+        else:
+            data['labels'] = [str(day) for day in range(1, end.day + 1)]
+        return data
+    return REPORT_CACHE.get_or_set(('periodo', periodo, group, selected_area, start, version), build)
 
 def get_group_performance(group_name, start_date_str, end_date_str=None):
     try:
@@ -19,7 +157,7 @@ def get_group_performance(group_name, start_date_str, end_date_str=None):
         eficiencia = (total_producido / total_pronostico * 100) if total_pronostico > 0 else 0
         return {'pronostico': f"{total_pronostico:,.0f}", 'producido': f"{total_producido:,.0f}", 'eficiencia': round(eficiencia, 2)}
     except Exception as e:
-        print(f"ERROR CRÍTICO en get_group_performance para {group_name}: {e}")
+        _db_error(f"ERROR CRÍTICO en get_group_performance para {group_name}", e)
         return {'pronostico': '0', 'producido': '0', 'eficiencia': 0}
 
 def get_daily_area_summary(group, area, target_date):
@@ -55,66 +193,82 @@ def get_area_data_for_period(group, area, start_date, end_date):
         current_date += timedelta(days=1)
     return {'labels': labels, 'producido': prod_data, 'pronostico': pron_data}
 
-def get_structured_capture_data(group_name, selected_date):
-    data_to_render = {}
+CAPTURE_CLASSES = ['', 'input-success', 'input-warning']
+
+def get_capture_layout(group_name):
+    """Ejes del formulario de captura; los índices de estas listas identifican cada celda en la API."""
+    areas = [a for a in (AREAS_IHP if group_name == 'IHP' else AREAS_FHP) if a != 'Output']
+    horas, turno_horas = [], []
+    for turno in NOMBRES_TURNOS_PRODUCCION:
+        turno_horas.append(list(range(len(horas), len(horas) + len(HORAS_TURNO[turno]))))
+        horas.extend(HORAS_TURNO[turno])
+    return {'areas': areas, 'turnos': list(NOMBRES_TURNOS_PRODUCCION), 'horas': horas, 'turno_horas': turno_horas}
+
+def get_capture_class(valor, pronostico_turno, turno_name):
+    """Índice en CAPTURE_CLASSES para una celda de producción según la meta por hora del turno."""
+    hourly_target = get_hourly_target(pronostico_turno, turno_name)
+    if valor is None or hourly_target <= 0:
+        return 0
+    return 1 if valor >= hourly_target else 2
+
+def get_capture_state(group_name, selected_date):
+    """Estado de captura de un grupo y día en arreglos planos.
+
+    `pronostico[a][t]`, `razon[a][t]` y `produccion[a][h]` / `clase[a][h]` se indexan con las
+    listas `areas`, `turnos` y `horas` de `get_capture_layout`. Los arreglos `*_version` llevan la
+    versión de cada fila (0 si aún no existe) para el autoguardado con concurrencia optimista.
+    """
+    layout = get_capture_layout(group_name)
+    area_idx = {a: i for i, a in enumerate(layout['areas'])}
+    turno_idx = {t: i for i, t in enumerate(layout['turnos'])}
+    hora_idx = {h: i for i, h in enumerate(layout['horas'])}
+
+    pronostico = [[None] * len(layout['turnos']) for _ in layout['areas']]
+    razon = [[0] * len(layout['turnos']) for _ in layout['areas']]
+    pronostico_version = [[0] * len(layout['turnos']) for _ in layout['areas']]
+    produccion = [[None] * len(layout['horas']) for _ in layout['areas']]
+    produccion_version = [[0] * len(layout['horas']) for _ in layout['areas']]
+    output = {'pronostico': 0, 'output': 0, 'version': 0}
+    clase = [[0] * len(layout['horas']) for _ in layout['areas']]
     try:
-        areas_list = AREAS_IHP if group_name == 'IHP' else AREAS_FHP
-        
-        # 1. Prepara la estructura de datos anidada
-        for area in [a for a in areas_list if a != 'Output']:
-            data_to_render[area] = {}
-            for turno in NOMBRES_TURNOS_PRODUCCION:
-                # La estructura ahora incluye un diccionario 'horas'
-                data_to_render[area][turno] = {
-                    'pronostico': None, 
-                    'razon_desviacion': None,
-                    'horas': {hora: {'valor': None, 'class': ''} for hora in HORAS_TURNO.get(turno, [])}
-                }
+        pron_rows = db_session.query(Pronostico.area, Pronostico.turno, Pronostico.valor_pronostico, Pronostico.razon_desviacion, Pronostico.version).filter(
+            Pronostico.fecha == selected_date, Pronostico.grupo == group_name).all()
+        for area, turno, valor, razon_desviacion, version in pron_rows:
+            if area in area_idx and turno in turno_idx:
+                pronostico[area_idx[area]][turno_idx[turno]] = valor
+                razon[area_idx[area]][turno_idx[turno]] = 1 if razon_desviacion else 0
+                pronostico_version[area_idx[area]][turno_idx[turno]] = version
 
-        # 2. Rellena los datos de pronóstico y producción
-        all_pronosticos = db_session.query(Pronostico).filter_by(fecha=selected_date, grupo=group_name).all()
-        for p in all_pronosticos:
-            if p.area in data_to_render and p.turno in data_to_render[p.area]:
-                data_to_render[p.area][p.turno]['pronostico'] = p.valor_pronostico
-                data_to_render[p.area][p.turno]['razon_desviacion'] = p.razon_desviacion
-
-        all_produccion = db_session.query(ProduccionCaptura).filter_by(fecha=selected_date, grupo=group_name).all()
-        for prod in all_produccion:
-            for turno, horas in HORAS_TURNO.items():
-                if prod.hora in horas and prod.area in data_to_render and turno in data_to_render[prod.area]:
-                    # Almacena el valor en la estructura anidada
-                    data_to_render[prod.area][turno]['horas'][prod.hora]['valor'] = prod.valor_producido
-                    break
-        
-        # 3. Itera sobre la estructura ya poblada para calcular y asignar las clases
-        for area, turnos in data_to_render.items():
-            for turno_name, turno_data in turnos.items():
-                pronostico_turno = turno_data.get('pronostico')
-                
-                # Calcula la meta por hora para este turno específico
-                hourly_target = get_hourly_target(pronostico_turno, turno_name)
-
-                if hourly_target > 0:
-                    for hora, hora_data in turno_data['horas'].items():
-                        prod_hora = hora_data.get('valor')
-                        # Si hay un valor de producción, se le asigna una clase
-                        if prod_hora is not None:
-                            if prod_hora >= hourly_target:
-                                hora_data['class'] = 'input-success'
-                            else:
-                                hora_data['class'] = 'input-warning'
+        prod_rows = db_session.query(ProduccionCaptura.area, ProduccionCaptura.hora, ProduccionCaptura.valor_producido, ProduccionCaptura.version).filter(
+            ProduccionCaptura.fecha == selected_date, ProduccionCaptura.grupo == group_name).all()
+        for area, hora, valor, version in prod_rows:
+            if area in area_idx and hora in hora_idx:
+                produccion[area_idx[area]][hora_idx[hora]] = valor
+                produccion_version[area_idx[area]][hora_idx[hora]] = version
 
+        output_row = db_session.query(OutputData.pronostico, OutputData.output, OutputData.version).filter(
+            OutputData.fecha == selected_date, OutputData.grupo == group_name).first()
+        if output_row:
+            output = {'pronostico': output_row.pronostico or 0, 'output': output_row.output or 0, 'version': output_row.version}
+
+        for a in range(len(layout['areas'])):
+            for h, hora in enumerate(layout['horas']):
+                turno = TURNO_DE_HORA[hora]
+                clase[a][h] = get_capture_class(produccion[a][h], pronostico[a][turno_idx[turno]], turno)
     except exc.SQLAlchemyError as e:
-        print(f"Error al obtener datos estructurados para captura: {e}")
-        
-    return data_to_render
+        print(f"Error al obtener el estado de captura: {e}")
+
+    return dict(layout, grupo=group_name, fecha=selected_date.strftime('%Y-%m-%d'), clases=CAPTURE_CLASSES,
+                pronostico=pronostico, razon=razon, produccion=produccion, clase=clase,
+                pronostico_version=pronostico_version, produccion_version=produccion_version, output=output)
+
 def get_output_data(group, date_str):
     try:
         selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         output_row = db_session.query(OutputData).filter_by(fecha=selected_date, grupo=group).first()
         return {'pronostico': output_row.pronostico or 0, 'output': output_row.output or 0} if output_row else {'pronostico': 0, 'output': 0}
     except (exc.SQLAlchemyError, ValueError) as e:
-        print(f"Error al obtener datos de Output: {e}")
+        _db_error("Error al obtener datos de Output", e)
         return {'pronostico': 0, 'output': 0}
 
 def get_detailed_performance_data(selected_date):
@@ -130,12 +284,11 @@ def get_detailed_performance_data(selected_date):
         for p in pronosticos:
             if p.grupo in performance_data and p.area in performance_data[p.grupo] and p.turno in performance_data[p.grupo][p.area]: performance_data[p.grupo][p.area][p.turno]['pronostico'] = p.valor_pronostico
         for prod in produccion_horas:
-            for turno_name, horas_del_turno in HORAS_TURNO.items():
-                if prod.hora in horas_del_turno and prod.grupo in performance_data and prod.area in performance_data[prod.grupo] and turno_name in performance_data[prod.grupo][prod.area]:
-                    valor = prod.valor_producido or 0
-                    performance_data[prod.grupo][prod.area][turno_name]['horas'][prod.hora]['valor'] = valor
-                    performance_data[prod.grupo][prod.area][turno_name]['producido'] += valor
-                    break
+            turno_name = TURNO_DE_HORA.get(prod.hora)
+            if turno_name and prod.grupo in performance_data and prod.area in performance_data[prod.grupo]:
+                valor = prod.valor_producido or 0
+                performance_data[prod.grupo][prod.area][turno_name]['horas'][prod.hora]['valor'] = valor
+                performance_data[prod.grupo][prod.area][turno_name]['producido'] += valor
         for group in performance_data:
             for area in performance_data[group]:
                 for turno_name, turno_data in performance_data[group][area].items():
@@ -152,9 +305,30 @@ def get_detailed_performance_data(selected_date):
                                     hora_data['class'] = 'text-warning font-weight-bold'
                     else: turno_data['eficiencia'] = 0
     except exc.SQLAlchemyError as e:
-        print(f"Error al generar datos detallados del dashboard: {e}")
+        _db_error("Error al generar datos detallados del dashboard", e)
     return performance_data
 
+def get_live_production_snapshot():
+    """Foto del día hábil actual por grupo y área (pronóstico, producido, eficiencia) para métricas."""
+    selected_date = get_business_date()
+    performance = get_detailed_performance_data(selected_date)
+    areas, grupos = [], {}
+    for group, group_data in performance.items():
+        group_pron, group_prod = 0, 0
+        for area, turnos in group_data.items():
+            pronostico = sum(t['pronostico'] or 0 for t in turnos.values())
+            producido = sum(t['producido'] or 0 for t in turnos.values())
+            areas.append({'grupo': group, 'area': area, 'pronostico': pronostico, 'producido': producido})
+            group_pron += pronostico
+            group_prod += producido
+        output = get_output_data(group, selected_date.strftime('%Y-%m-%d'))
+        areas.append({'grupo': group, 'area': 'Output', 'pronostico': output['pronostico'], 'producido': output['output']})
+        group_pron += output['pronostico']
+        group_prod += output['output']
+        grupos[group] = {'pronostico': group_pron, 'producido': group_prod,
+                         'eficiencia': round(group_prod / group_pron * 100, 2) if group_pron > 0 else 0}
+    return {'fecha': selected_date.isoformat(), 'generated_at': time.time(), 'areas': areas, 'grupos': grupos}
+
 def get_daily_summary(group, target_date):
     try:
         pronostico_areas = db_session.query(func.sum(Pronostico.valor_pronostico)).filter_by(grupo=group, fecha=target_date).scalar() or 0
@@ -195,179 +369,163 @@ def get_optimized_report_data(group, selected_area, selected_date):
         return weekly_data, monthly_data
     
     except Exception as e:
-        print(f"Error en get_optimized_report_data: {e}")
+        _db_error("Error en get_optimized_report_data", e)
         # Datos vacíos en caso de error
         empty_weekly = {'labels': [], 'producido': [0]*7, 'pronostico': [0]*7}
         empty_monthly = {'labels': [], 'producido': [0]*days_in_month, 'pronostico': [0]*days_in_month}
         return empty_weekly, empty_monthly
 
 def get_daily_detailed_data(group, selected_area, selected_date):
+    """Detalle del día por área y turno (pronóstico, producción por hora, eficiencia) para la tabla de reportes.
+
+    Todo el día sale de las tres consultas de `iter_daily_detail` en lugar de una por área, turno y hora.
     """
-    Obtiene datos detallados del día específico para análisis en tabla
-    """
-    from .utils import AREAS_IHP, AREAS_FHP, NOMBRES_TURNOS_PRODUCCION
-    from .models import Pronostico, ProduccionCaptura, OutputData
-    
     try:
         areas_list = AREAS_IHP if group == 'IHP' else AREAS_FHP
         areas_to_query = [selected_area] if selected_area != 'GENERAL' else [a for a in areas_list if a != 'Output']
-        
+        [(_, pronosticos, producciones, outputs)] = list(iter_daily_detail([group], selected_date, selected_date))
+
         daily_details = []
-        
-        # Definir horas por turno usando los nombres correctos
-        turno_hours = {
-            'Turno A': ['10AM', '1PM', '4PM'],
-            'Turno B': ['7PM', '10PM', '12AM'],
-            'Turno C': ['3AM', '6AM']
-        }
-        
         for area in areas_to_query:
-            area_data = {
-                'area': area,
-                'turnos': {},
-                'total_pronostico': 0,
-                'total_producido': 0,
-                'eficiencia': 0
-            }
-            
-            # Inicializar todos los turnos con valores por defecto
-            for turno in NOMBRES_TURNOS_PRODUCCION:
-                area_data['turnos'][turno] = {
-                    'pronostico': 0,
-                    'producido': 0,
-                    'eficiencia': 0,
-                    'horas': {}
-                }
-            
+            area_data = {'area': area, 'turnos': {}, 'total_pronostico': 0, 'total_producido': 0, 'eficiencia': 0}
             for turno in NOMBRES_TURNOS_PRODUCCION:
-                # Obtener pronóstico
-                pronostico_query = db_session.query(Pronostico).filter_by(
-                    fecha=selected_date, grupo=group, area=area, turno=turno
-                ).first()
-                pronostico_val = pronostico_query.valor_pronostico if pronostico_query and pronostico_query.valor_pronostico else 0
-                
-                # Obtener producción por hora del turno
-                horas_turno = turno_hours.get(turno, [])
-                produccion_por_hora = {}
-                producido_total = 0
-                
-                for hora in horas_turno:
-                    produccion_hora = db_session.query(ProduccionCaptura).filter_by(
-                        fecha=selected_date, grupo=group, area=area, hora=hora
-                    ).first()
-                    valor_hora = produccion_hora.valor_producido if produccion_hora and produccion_hora.valor_producido else 0
-                    produccion_por_hora[hora] = valor_hora
-                    producido_total += valor_hora
-                
-                # Calcular eficiencia del turno
-                eficiencia_turno = (producido_total / pronostico_val * 100) if pronostico_val > 0 else 0
-                
+                pronostico_val = pronosticos.get((group, area, turno), 0)
+                produccion_por_hora = {hora: producciones.get((group, area, hora), 0) for hora in HORAS_TURNO[turno]}
+                producido_total = sum(produccion_por_hora.values())
                 area_data['turnos'][turno] = {
                     'pronostico': pronostico_val,
                     'producido': producido_total,
-                    'eficiencia': eficiencia_turno,
+                    'eficiencia': (producido_total / pronostico_val * 100) if pronostico_val > 0 else 0,
                     'horas': produccion_por_hora
                 }
-                
                 area_data['total_pronostico'] += pronostico_val
                 area_data['total_producido'] += producido_total
-            
-            # Calcular eficiencia total del área
             if area_data['total_pronostico'] > 0:
                 area_data['eficiencia'] = (area_data['total_producido'] / area_data['total_pronostico']) * 100
-            
             daily_details.append(area_data)
-        
+
         # Si es GENERAL, agregar datos de Output
         if selected_area == 'GENERAL':
-            output_query = db_session.query(OutputData).filter_by(
-                fecha=selected_date, grupo=group
-            ).first()
-            
-            output_data = {
+            output_pron, output_prod = outputs.get(group, (0, 0))
+            daily_details.append({
                 'area': 'Output',
-                'turnos': {
-                    'Turno A': {'pronostico': 0, 'producido': 0, 'eficiencia': 0, 'horas': {}},
-                    'Turno B': {'pronostico': 0, 'producido': 0, 'eficiencia': 0, 'horas': {}},
-                    'Turno C': {'pronostico': 0, 'producido': 0, 'eficiencia': 0, 'horas': {}}
-                },
-                'total_pronostico': 0,
-                'total_producido': 0,
-                'eficiencia': 0
-            }
-            
-            if output_query:
-                output_data['total_pronostico'] = output_query.pronostico or 0
-                output_data['total_producido'] = output_query.output or 0
-                if output_data['total_pronostico'] > 0:
-                    output_data['eficiencia'] = (output_data['total_producido'] / output_data['total_pronostico']) * 100
-            
-            daily_details.append(output_data)
-        
+                'turnos': {turno: {'pronostico': 0, 'producido': 0, 'eficiencia': 0, 'horas': {}} for turno in NOMBRES_TURNOS_PRODUCCION},
+                'total_pronostico': output_pron,
+                'total_producido': output_prod,
+                'eficiencia': (output_prod / output_pron * 100) if output_pron > 0 else 0
+            })
 
         return daily_details
-        
+
     except Exception as e:
-        print(f"Error en get_daily_detailed_data: {e}")
+        _db_error("Error en get_daily_detailed_data", e)
         # Devolver datos vacíos en caso de error
         return []
 
-def _get_period_data_optimized(group, area, start_date, end_date):
-    """Función auxiliar para obtener datos de un período con consultas optimizadas."""
-    try:
-        # Consulta optimizada para pronósticos
-        pron_query = db_session.query(
-            Pronostico.fecha,
-            func.sum(Pronostico.valor_pronostico).label('total_pronostico')
+def iter_daily_detail(groups, start_date, end_date, batch_size=2000):
+    """Recorre día por día la captura de `groups` en el rango, con memoria acotada a un día.
+
+    Tres consultas ordenadas por fecha (pronóstico por turno, producción por hora y output) se leen
+    en lotes y se combinan. Produce (fecha, pronósticos {(grupo, area, turno): valor},
+    producción {(grupo, area, hora): valor}, output {grupo: (pronóstico, output)}) para cada día
+    del rango, aunque no tenga captura.
+    """
+    queries = (
+        db_session.query(Pronostico.fecha, Pronostico.grupo, Pronostico.area, Pronostico.turno, Pronostico.valor_pronostico).filter(
+            Pronostico.grupo.in_(groups), Pronostico.fecha.between(start_date, end_date)).order_by(Pronostico.fecha),
+        db_session.query(ProduccionCaptura.fecha, ProduccionCaptura.grupo, ProduccionCaptura.area, ProduccionCaptura.hora, ProduccionCaptura.valor_producido).filter(
+            ProduccionCaptura.grupo.in_(groups), ProduccionCaptura.fecha.between(start_date, end_date)).order_by(ProduccionCaptura.fecha),
+        db_session.query(OutputData.fecha, OutputData.grupo, OutputData.pronostico, OutputData.output).filter(
+            OutputData.grupo.in_(groups), OutputData.fecha.between(start_date, end_date)).order_by(OutputData.fecha),
+    )
+    streams = [groupby(query.yield_per(batch_size), key=lambda row: row[0]) for query in queries]
+    heads = [next(stream, None) for stream in streams]
+
+    current = start_date
+    while current <= end_date:
+        pronosticos, producciones, outputs = {}, {}, {}
+        for i, stream in enumerate(streams):
+            if heads[i] is None or heads[i][0] != current:
+                continue
+            for row in heads[i][1]:
+                if i == 2:
+                    outputs[row[1]] = (row[2] or 0, row[3] or 0)
+                else:
+                    target = pronosticos if i == 0 else producciones
+                    target[row[1:4]] = target.get(row[1:4], 0) + (row[4] or 0)
+            heads[i] = next(stream, None)
+        yield current, pronosticos, producciones, outputs
+        current += timedelta(days=1)
+
+def _add_live_period_data(group, area, start_date, end_date, covered, pron_data, prod_data):
+    """Suma a pron_data/prod_data los totales en vivo de los días del rango fuera de `covered`."""
+    # Consulta optimizada para pronósticos
+    pron_query = db_session.query(
+        Pronostico.fecha,
+        func.sum(Pronostico.valor_pronostico).label('total_pronostico')
+    ).filter(
+        Pronostico.grupo == group,
+        Pronostico.fecha.between(start_date, end_date),
+        Pronostico.fecha.notin_(covered)
+    )
+    
+    if area:
+        pron_query = pron_query.filter(Pronostico.area == area)
+    
+    for row in pron_query.group_by(Pronostico.fecha).all():
+        pron_data[row.fecha] = pron_data.get(row.fecha, 0) + (row.total_pronostico or 0)
+    
+    # Consulta optimizada para producción
+    prod_query = db_session.query(
+        ProduccionCaptura.fecha,
+        func.sum(ProduccionCaptura.valor_producido).label('total_producido')
+    ).filter(
+        ProduccionCaptura.grupo == group,
+        ProduccionCaptura.fecha.between(start_date, end_date),
+        ProduccionCaptura.fecha.notin_(covered)
+    )
+    
+    if area:
+        prod_query = prod_query.filter(ProduccionCaptura.area == area)
+    
+    for row in prod_query.group_by(ProduccionCaptura.fecha).all():
+        prod_data[row.fecha] = prod_data.get(row.fecha, 0) + (row.total_producido or 0)
+    
+    # Consultas para Output si es GENERAL
+    if not area:
+        # Output pronósticos
+        output_pron_query = db_session.query(
+            OutputData.fecha,
+            func.sum(OutputData.pronostico).label('total_pronostico')
         ).filter(
-            Pronostico.grupo == group,
-            Pronostico.fecha.between(start_date, end_date)
-        )
-        
-        if area:
-            pron_query = pron_query.filter(Pronostico.area == area)
+            OutputData.grupo == group,
+            OutputData.fecha.between(start_date, end_date),
+            OutputData.fecha.notin_(covered)
+        ).group_by(OutputData.fecha).all()
         
-        pron_data = {row.fecha: row.total_pronostico for row in pron_query.group_by(Pronostico.fecha).all()}
+        for row in output_pron_query:
+            pron_data[row.fecha] = pron_data.get(row.fecha, 0) + (row.total_pronostico or 0)
         
-        # Consulta optimizada para producción
-        prod_query = db_session.query(
-            ProduccionCaptura.fecha,
-            func.sum(ProduccionCaptura.valor_producido).label('total_producido')
+        # Output producción
+        output_prod_query = db_session.query(
+            OutputData.fecha,
+            func.sum(OutputData.output).label('total_output')
         ).filter(
-            ProduccionCaptura.grupo == group,
-            ProduccionCaptura.fecha.between(start_date, end_date)
-        )
-        
-        if area:
-            prod_query = prod_query.filter(ProduccionCaptura.area == area)
-        
-        prod_data = {row.fecha: row.total_producido for row in prod_query.group_by(ProduccionCaptura.fecha).all()}
+            OutputData.grupo == group,
+            OutputData.fecha.between(start_date, end_date),
+            OutputData.fecha.notin_(covered)
+        ).group_by(OutputData.fecha).all()
         
-        # Consultas para Output si es GENERAL
-        if not area:
-            # Output pronósticos
-            output_pron_query = db_session.query(
-                OutputData.fecha,
-                func.sum(OutputData.pronostico).label('total_pronostico')
-            ).filter(
-                OutputData.grupo == group,
-                OutputData.fecha.between(start_date, end_date)
-            ).group_by(OutputData.fecha).all()
-            
-            for row in output_pron_query:
-                pron_data[row.fecha] = pron_data.get(row.fecha, 0) + (row.total_pronostico or 0)
-            
-            # Output producción
-            output_prod_query = db_session.query(
-                OutputData.fecha,
-                func.sum(OutputData.output).label('total_output')
-            ).filter(
-                OutputData.grupo == group,
-                OutputData.fecha.between(start_date, end_date)
-            ).group_by(OutputData.fecha).all()
-            
-            for row in output_prod_query:
-                prod_data[row.fecha] = prod_data.get(row.fecha, 0) + (row.total_output or 0)
+        for row in output_prod_query:
+            prod_data[row.fecha] = prod_data.get(row.fecha, 0) + (row.total_output or 0)
+
+def _get_period_data_optimized(group, area, start_date, end_date):
+    """Función auxiliar para obtener datos de un período con consultas optimizadas."""
+    try:
+        # Los días cerrados salen del resumen kpi_diario; solo los demás se consultan en vivo.
+        pron_data, prod_data, covered = rollups.get_period_totals(group, area, start_date, end_date)
+        if len(covered) <= (end_date - start_date).days:
+            _add_live_period_data(group, area, start_date, end_date, covered, pron_data, prod_data)
         
         # Construir arrays de datos
         producido_array = []
@@ -385,7 +543,7 @@ def _get_period_data_optimized(group, area, start_date, end_date):
         }
         
     except Exception as e:
-        print(f"Error en _get_period_data_optimized: {e}")
+        _db_error("Error en _get_period_data_optimized", e)
         days_count = (end_date - start_date).days + 1
         return {
             'producido': [0] * days_count,
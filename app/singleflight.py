@@ -0,0 +1,142 @@
+# app/singleflight.py
+"""Coalescencia de cálculos idénticos concurrentes ("single-flight").
+
+Al cambio de turno muchos usuarios abren el mismo dashboard o reporte a la vez y cada petición
+recalcularía las mismas agregaciones. Con `SingleFlight.do(clave, fn)` la primera llamada con una
+clave calcula y las que llegan mientras tanto en el mismo proceso esperan y reciben ese resultado.
+
+Opcionalmente (SINGLEFLIGHT_SHARED_DIR) también se coalescen los workers de gunicorn de la misma
+máquina: quien calcula toma un flock por clave y deja el resultado en un archivo (pickle) que los
+demás workers leen al obtener el candado, mientras tenga menos de SINGLEFLIGHT_RESULT_TTL segundos.
+Si la espera pasa de SINGLEFLIGHT_WAIT_SECONDS se calcula sin coalescer.
+"""
+import os
+import time
+import pickle
+import hashlib
+import threading
+
+from .metrics import registry
+
+COALESCED = registry.counter('nidec_singleflight_coalesced_total',
+                             'Llamadas que reutilizaron el cálculo en curso de otra petición.', ('name', 'scope'))
+
+_settings = {'shared_dir': None, 'result_ttl': 30, 'wait_seconds': 30}
+_last_sweep = [0.0]
+
+
+def configure(shared_dir=None, result_ttl=30, wait_seconds=30):
+    _settings.update(shared_dir=shared_dir, result_ttl=result_ttl, wait_seconds=wait_seconds)
+    if shared_dir:
+        os.makedirs(shared_dir, exist_ok=True)
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name, shared=False):
+        self.name = name
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if call.event.wait(_settings['wait_seconds']):
+                COALESCED.inc(name=self.name, scope='proceso')
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            return fn()
+        try:
+            call.result = self._shared_do(key, fn) if self.shared and _settings['shared_dir'] else fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _shared_do(self, key, fn):
+        try:
+            import fcntl
+        except ImportError:
+            return fn()
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        path = os.path.join(_settings['shared_dir'], f"{self.name}-{digest}.pickle")
+        fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            deadline = time.monotonic() + _settings['wait_seconds']
+            locked = False
+            while not locked:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except OSError:
+                    if time.monotonic() > deadline:
+                        break
+                    time.sleep(0.05)
+            result = _read_result(path)
+            if result is not _MISSING:
+                COALESCED.inc(name=self.name, scope='workers')
+                return result
+            result = fn()
+            if locked:
+                _write_result(path, result)
+            return result
+        finally:
+            os.close(fd)  # también libera el flock
+
+
+_MISSING = object()
+
+
+def _read_result(path):
+    try:
+        if os.path.getmtime(path) < time.time() - _settings['result_ttl']:
+            return _MISSING
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return _MISSING
+
+
+def _write_result(path, result):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except (OSError, pickle.PicklingError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _sweep()
+
+
+def _sweep():
+    """Borra, como mucho una vez por minuto, los resultados y candados que ya no sirven."""
+    now = time.time()
+    if now - _last_sweep[0] < 60:
+        return
+    _last_sweep[0] = now
+    expiry = now - max(_settings['result_ttl'] * 10, 300)
+    for entry in os.scandir(_settings['shared_dir']):
+        try:
+            if entry.stat().st_mtime < expiry:
+                os.remove(entry.path)
+        except OSError:
+            pass
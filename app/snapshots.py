@@ -0,0 +1,246 @@
+# app/snapshots.py
+"""Último dato bueno de dashboards y reportes, con cortacircuitos hacia la base de datos.
+
+Antes, si PostgreSQL estaba lento o caído, cada función de services atrapaba el error y devolvía
+ceros: las pantallas de piso mostraban 0 % y cada recarga volvía a golpear a la base. Ahora
+`serve(clave, calcular)` guarda el último resultado que se calculó bien (en memoria y, si hay
+SNAPSHOT_DIR, en disco para los demás workers y para después de un reinicio). Si el cálculo falla,
+o el cortacircuitos está abierto, devuelve esa copia y deja en `g.datos_al` la hora a la que
+corresponde para que la página la muestre.
+
+`DB_BREAKER` se abre tras SNAPSHOT_BREAKER_FAILURES fallos seguidos (un cálculo que tarda más de
+SNAPSHOT_SLOW_SECONDS también cuenta como fallo) y mientras está abierto estas rutas no consultan
+la base. Pasados SNAPSHOT_BREAKER_OPEN_SECONDS, la siguiente petición que recibe una copia lanza
+una sola actualización en segundo plano; si sale bien, el circuito se cierra.
+"""
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import exc
+from werkzeug.exceptions import ServiceUnavailable
+
+from . import db_session
+from .metrics import registry
+
+_settings = {'failures': 3, 'open_seconds': 30, 'slow_seconds': 5.0, 'dir': None, 'persist_seconds': 60, 'max_entries': 512}
+_local = threading.local()
+
+
+def configure(directory=None, failures=3, open_seconds=30, slow_seconds=5.0, max_entries=512):
+    _settings.update(dir=directory, failures=failures, open_seconds=open_seconds, slow_seconds=slow_seconds, max_entries=max_entries)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+class CircuitBreaker:
+    """Cerrado: se consulta la base. Abierto: no, salvo una prueba cuando vence `open_seconds`."""
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def try_probe(self):
+        """True para una sola llamada cuando el circuito lleva abierto el tiempo configurado."""
+        with self._lock:
+            if self.opened_at is None or self._probing or time.monotonic() - self.opened_at < _settings['open_seconds']:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures, self.opened_at, self._probing = 0, None, False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= _settings['failures']:
+                if self.opened_at is None:
+                    BREAKER_OPENED.inc(name=self.name)
+                self.opened_at = time.monotonic()
+
+
+DB_BREAKER = CircuitBreaker('db')
+
+BREAKER_OPENED = registry.counter('nidec_circuit_breaker_opened_total', 'Veces que se abrió el cortacircuitos.', ('name',))
+STALE_RESPONSES = registry.counter('nidec_snapshot_stale_total', 'Resultados servidos desde el último dato bueno.', ('kind',))
+registry.gauge('nidec_circuit_breaker_open', 'Cortacircuitos abierto (1) o cerrado (0).', ('name',),
+               callback=lambda: [({'name': DB_BREAKER.name}, 1 if DB_BREAKER.is_open else 0)])
+
+
+class _SnapshotStore:
+    """clave -> [hora (epoch), valor, hora en que se escribió a disco], LRU en memoria."""
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                return entry[0], entry[1]
+        loaded = self._load(key)
+        if loaded is not None:
+            with self._lock:
+                self._data.setdefault(key, [loaded[0], loaded[1], loaded[0]])
+        return loaded
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            # Un acierto de caché devuelve el mismo objeto: solo se actualiza la hora en memoria.
+            persist = entry is None or entry[1] is not value or now - entry[2] > _settings['persist_seconds']
+            self._data[key] = [now, value, now if persist else entry[2]]
+            self._data.move_to_end(key)
+            while len(self._data) > _settings['max_entries']:
+                self._data.popitem(last=False)
+        if persist:
+            self._save(key, now, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _path(self, key):
+        return os.path.join(_settings['dir'], f"{hashlib.sha1(repr(key).encode()).hexdigest()}.pickle")
+
+    def _load(self, key):
+        if not _settings['dir']:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                stored_key, as_of, value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        return (as_of, value) if stored_key == key else None
+
+    def _save(self, key, as_of, value):
+        if not _settings['dir']:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((key, as_of, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+_store = _SnapshotStore()
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def guarded():
+    """True dentro de un cálculo protegido: ahí services deja subir los errores de BD en vez de devolver ceros."""
+    return getattr(_local, 'depth', 0) > 0
+
+
+def _rollback():
+    try:
+        db_session.rollback()
+    except exc.SQLAlchemyError:
+        pass
+
+
+def _compute(key, compute):
+    started = time.perf_counter()
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        value = compute()
+    except exc.SQLAlchemyError:
+        DB_BREAKER.failure()
+        _rollback()
+        raise
+    finally:
+        _local.depth -= 1
+    if time.perf_counter() - started > _settings['slow_seconds']:
+        DB_BREAKER.failure()
+    else:
+        DB_BREAKER.success()
+    _store.put(key, value)
+    return value
+
+
+def _refresh(app, key, compute):
+    with app.app_context():
+        try:
+            _compute(key, compute)
+        except exc.SQLAlchemyError as e:
+            app.logger.warning(f"La actualización en segundo plano de {key[0]} falló: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+            db_session.remove()
+
+
+def _refresh_async(key, compute):
+    with _refreshing_lock:
+        if key in _refreshing or not DB_BREAKER.try_probe():
+            return
+        _refreshing.add(key)
+    threading.Thread(target=_refresh, args=(current_app._get_current_object(), key, compute),
+                     name=f"snapshot-{key[0]}", daemon=True).start()
+
+
+def _stale(key, snapshot):
+    as_of = datetime.fromtimestamp(snapshot[0])
+    g.datos_al = min(g.get('datos_al') or as_of, as_of)
+    STALE_RESPONSES.inc(kind=key[0])
+    return snapshot[1]
+
+
+def serve(key, compute):
+    """Resultado de `compute()` o, si la base no responde, el último bueno de `key` (ver docstring del módulo).
+
+    `key[0]` nombra el tipo de dato en las métricas. Fuera de una petición (jobs) no hay copia:
+    los errores se propagan. Sin copia guardada responde 503.
+    """
+    if not has_request_context():
+        return _compute(key, compute)
+    if not DB_BREAKER.is_open:
+        try:
+            return _compute(key, compute)
+        except exc.SQLAlchemyError as e:
+            current_app.logger.error(f"Error de base de datos al calcular {key[0]}: {e}")
+    snapshot = _store.get(key)
+    if DB_BREAKER.is_open:
+        _refresh_async(key, compute)
+    if snapshot is None:
+        raise ServiceUnavailable('La base de datos no responde y no hay datos guardados para esta consulta. '
+                                 'Intenta de nuevo en unos segundos.', retry_after=_settings['open_seconds'])
+    return _stale(key, snapshot)
+
+
+def attempt(compute):
+    """`compute()` con el cortacircuitos, sin guardar copia: None si está abierto o la base falla."""
+    if DB_BREAKER.is_open:
+        return None
+    started = time.perf_counter()
+    try:
+        value = compute()
+    except exc.SQLAlchemyError as e:
+        DB_BREAKER.failure()
+        _rollback()
+        current_app.logger.error(f"Error de base de datos: {e}")
+        return None
+    if time.perf_counter() - started > _settings['slow_seconds']:
+        DB_BREAKER.failure()
+    return value
@@ -0,0 +1,46 @@
+// Acciones masivas de los programas: las casillas [data-bulk-select] de la tabla pertenecen al
+// formulario [data-bulk-form] (atributo form) y envían los ids marcados. "Todas las filtradas"
+// desactiva las casillas y el servidor aplica la acción a todo lo que cumple los filtros de la
+// vista. Antes de enviar se confirma con el número de órdenes afectadas.
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.querySelector('form[data-bulk-form]');
+    if (!form) return;
+
+    const boxes = Array.from(document.querySelectorAll('[data-bulk-select]'));
+    const selectAll = document.querySelector('[data-bulk-select-all]');
+    const allFiltered = form.querySelector('input[name="todas"]');
+    const counter = form.querySelector('.bulk-count');
+    const buttons = form.querySelectorAll('button[name="accion"]');
+
+    function selectedCount() {
+        return allFiltered.checked ? Number(allFiltered.dataset.total) : boxes.filter(box => box.checked).length;
+    }
+
+    function refresh() {
+        const count = selectedCount();
+        counter.textContent = allFiltered.checked ? `${count} órdenes filtradas` : `${count} órdenes marcadas`;
+        buttons.forEach(button => { button.disabled = count === 0; });
+        boxes.forEach(box => { box.disabled = allFiltered.checked; });
+        if (selectAll) {
+            selectAll.checked = boxes.length > 0 && boxes.every(box => box.checked);
+            selectAll.disabled = allFiltered.checked;
+        }
+    }
+
+    boxes.forEach(box => box.addEventListener('change', refresh));
+    if (selectAll) {
+        selectAll.addEventListener('change', () => {
+            boxes.forEach(box => { box.checked = selectAll.checked; });
+            refresh();
+        });
+    }
+    allFiltered.addEventListener('change', refresh);
+
+    form.addEventListener('submit', event => {
+        const action = event.submitter ? event.submitter.textContent.trim() : 'Aplicar';
+        if (!confirm(`${action}: ${selectedCount()} órdenes. ¿Continuar?`)) {
+            event.preventDefault();
+        }
+    });
+    refresh();
+});
@@ -1,20 +1,40 @@
 let PRONOSTICOS_DATA;
 let HORAS_TURNO;
 let NOMBRES_TURNOS;
+let CAPTURE_STATE;
+let hasUnsavedChanges = false;
+const DIRTY_FIELDS = new Set();
+const IN_FLIGHT = new Map();
 
 /**
- * Inicializa la página de captura, configurando listeners y calculando totales.
+ * Inicializa la página de captura: dibuja la tabla a partir del estado en JSON,
+ * configura el autoguardado por celda y calcula totales.
  */
-function initializeCapturaPage(horasTurnoData, nombresTurnosData, pronosticosData) {
-    HORAS_TURNO = horasTurnoData;
-    NOMBRES_TURNOS = nombresTurnosData;
-    PRONOSTICOS_DATA = pronosticosData;
+function initializeCapturaPage(state, bloquearPronostico) {
+    CAPTURE_STATE = state;
+    NOMBRES_TURNOS = state.turnos;
+    HORAS_TURNO = {};
+    state.turnos.forEach((turno, t) => { HORAS_TURNO[turno] = state.turno_horas[t].map(h => state.horas[h]); });
+    PRONOSTICOS_DATA = {};
+    state.areas.forEach((area, a) => {
+        PRONOSTICOS_DATA[area] = {};
+        state.turnos.forEach((turno, t) => {
+            PRONOSTICOS_DATA[area][turno] = { razon_desviacion: state.razon[a][t] ? true : null };
+        });
+    });
+
+    renderCaptureState(state, bloquearPronostico);
 
-    let hasUnsavedChanges = false;
     const productionForm = document.getElementById('productionForm');
     if (productionForm) {
-        productionForm.addEventListener('input', () => { hasUnsavedChanges = true; });
-        productionForm.addEventListener('submit', () => { hasUnsavedChanges = false; });
+        productionForm.addEventListener('submit', (e) => {
+            e.preventDefault();
+            flushPendingCells(productionForm);
+        });
+        // Autoguardado por celda al confirmar el valor (blur o Enter).
+        productionForm.addEventListener('change', (e) => {
+            if (e.target.matches('input.capture-input')) autosaveCell(e.target);
+        });
     }
     window.addEventListener('beforeunload', (e) => {
         if (hasUnsavedChanges) { e.preventDefault(); e.returnValue = ''; }
@@ -28,6 +48,181 @@ function initializeCapturaPage(horasTurnoData, nombresTurnosData, pronosticosDat
     });
 }
 
+function escapeHtml(text) {
+    return String(text).replace(/[&<>"']/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[c]));
+}
+
+function valueAttr(value) {
+    return value === null || value === undefined ? '' : escapeHtml(value);
+}
+
+/**
+ * Genera las filas de escritorio y las tarjetas móviles de cada área.
+ * Los inputs conservan los nombres del formulario y guardan sus índices en data-*.
+ */
+function renderCaptureState(state, bloquearPronostico) {
+    const desktopRows = [];
+    const mobileCards = [];
+    const date = escapeHtml(state.fecha);
+
+    state.areas.forEach((area, a) => {
+        const areaSlug = toSlug(area);
+        const areaName = escapeHtml(area);
+        const desktopCells = [];
+        const mobileSections = [];
+
+        state.turnos.forEach((turno, t) => {
+            const turnoSlug = toSlug(turno);
+            const turnoName = escapeHtml(turno);
+            const pronostico = state.pronostico[a][t];
+            const locked = bloquearPronostico && pronostico !== null;
+            const lockedClass = locked ? ' bg-light text-muted' : '';
+            const lockedAttr = locked ? ' readonly tabindex="-1"' : '';
+            const pronAttrs = `name="pronostico_${areaSlug}_${turnoSlug}" value="${valueAttr(pronostico)}" data-kind="pronostico" data-a="${a}" data-i="${t}" oninput="onInputChanged(this)"${lockedAttr}`;
+
+            desktopCells.push(`<td class="turno-separator"><input type="number" ${pronAttrs} class="form-control form-control-sm capture-input pronostico-turno-input${lockedClass}"></td>`);
+            const mobileHours = [];
+            state.turno_horas[t].forEach(h => {
+                const hora = state.horas[h];
+                const prodAttrs = `name="produccion_${areaSlug}_${hora}" value="${valueAttr(state.produccion[a][h])}" data-kind="produccion" data-a="${a}" data-i="${h}" oninput="onInputChanged(this)"`;
+                const cls = state.clases[state.clase[a][h]];
+                desktopCells.push(`<td><input type="number" ${prodAttrs} class="form-control form-control-sm capture-input produccion-hora-input ${cls}"></td>`);
+                mobileHours.push(`<div class="input-row-mobile"><label for="mobile_produccion_${areaSlug}_${hora}">Prod. ${hora}:</label><input type="number" id="mobile_produccion_${areaSlug}_${hora}" ${prodAttrs} class="form-control capture-input produccion-hora-input ${cls}"></div>`);
+            });
+            desktopCells.push(`<td class="text-center align-middle font-weight-bold total-column"><span id="total_produccion_turno_${areaSlug}_${turnoSlug}">0</span><span class="validation-icon-container ml-2" id="validation_icon_container_${areaSlug}_${turnoSlug}" data-area-name="${areaName}" data-turno-name="${turnoName}" data-date="${date}" onclick="handleValidationIconClick(this)"></span></td>`);
+            mobileSections.push(`<div class="turno-section-mobile"><h6>${turnoName}</h6>
+                <div class="input-row-mobile"><label for="mobile_pronostico_${areaSlug}_${turnoSlug}">Pronóstico:</label><input type="number" id="mobile_pronostico_${areaSlug}_${turnoSlug}" ${pronAttrs} class="form-control capture-input pronostico-turno-input${lockedClass}"></div>
+                ${mobileHours.join('')}
+                <div class="turno-totals-mobile d-flex justify-content-between align-items-center"><strong>Total Producido:</strong><div class="d-flex align-items-center"><span id="mobile_total_produccion_turno_${areaSlug}_${turnoSlug}">0</span><span class="validation-icon-container ml-3" id="mobile_validation_icon_container_${areaSlug}_${turnoSlug}" data-area-name="${areaName}" data-turno-name="${turnoName}" data-date="${date}" onclick="handleValidationIconClick(this)"></span></div></div>
+            </div>`);
+        });
+
+        desktopRows.push(`<tr data-area-slug="${areaSlug}" data-area-name="${areaName}"><td class="area-name-cell">${areaName}</td>${desktopCells.join('')}</tr>`);
+        mobileCards.push(`<div class="card" data-area-slug="${areaSlug}" data-area-name="${areaName}">
+            <div class="card-header" id="heading_mobile_${areaSlug}"><button class="btn btn-link btn-block" type="button" data-toggle="collapse" data-target="#collapse_mobile_${areaSlug}">${areaName}</button></div>
+            <div id="collapse_mobile_${areaSlug}" class="collapse" data-parent="#accordionCapturaMobile"><div class="card-body">${mobileSections.join('')}</div></div>
+        </div>`);
+    });
+
+    document.getElementById('captureDesktopBody').innerHTML = desktopRows.join('');
+    document.getElementById('accordionCapturaMobile').insertAdjacentHTML('afterbegin', mobileCards.join(''));
+}
+
+/**
+ * Describe la celda de un input para el autoguardado: tipo, índices y versión leída.
+ */
+function cellForInput(input) {
+    if (input.name === 'pronostico_output' || input.name === 'produccion_output') {
+        const kind = input.name === 'pronostico_output' ? 'output_pronostico' : 'output_output';
+        return { kind, a: 0, i: 0, version: CAPTURE_STATE.output.version };
+    }
+    const kind = input.dataset.kind;
+    const a = Number(input.dataset.a);
+    const i = Number(input.dataset.i);
+    return { kind, a, i, version: CAPTURE_STATE[`${kind}_version`][a][i] };
+}
+
+function setCellVersion(cell, version) {
+    if (cell.kind.startsWith('output_')) CAPTURE_STATE.output.version = version;
+    else CAPTURE_STATE[`${cell.kind}_version`][cell.a][cell.i] = version;
+}
+
+/**
+ * Guarda una sola celda. Los guardados de una misma celda se encadenan para que cada uno
+ * envíe la versión devuelta por el anterior.
+ */
+function autosaveCell(input) {
+    const name = input.name;
+    const previous = IN_FLIGHT.get(name) || Promise.resolve();
+    const next = previous.then(() => sendCell(name)).finally(() => {
+        if (IN_FLIGHT.get(name) === next) IN_FLIGHT.delete(name);
+    });
+    IN_FLIGHT.set(name, next);
+    return next;
+}
+
+function sendCell(name) {
+    const form = document.getElementById('productionForm');
+    const inputs = document.querySelectorAll(`input[name="${name}"]`);
+    const input = inputs[0];
+    if (!input || input.readOnly || input.value === '' || !DIRTY_FIELDS.has(name)) return Promise.resolve(true);
+    const cell = cellForInput(input);
+    const value = input.value;
+    inputs.forEach(el => el.classList.add('input-saving'));
+
+    return fetch(form.dataset.autosaveUrl, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            csrf_token: form.querySelector('input[name="csrf_token"]').value,
+            fecha: CAPTURE_STATE.fecha, kind: cell.kind, a: cell.a, i: cell.i, value, version: cell.version
+        })
+    })
+        .then(response => response.json().then(data => ({ status: response.status, data })))
+        .then(({ status, data }) => {
+            if (status === 409) {
+                setCellVersion(cell, data.version);
+                inputs.forEach(el => {
+                    el.value = data.value ?? '';
+                    el.classList.add('input-conflict');
+                });
+                if (input.value === value) DIRTY_FIELDS.delete(name);
+                showCaptureMessage(data.message, 'warning');
+            } else if (data.status === 'success') {
+                setCellVersion(cell, data.version);
+                inputs.forEach(el => el.classList.remove('input-conflict'));
+                // Si el usuario siguió escribiendo, la celda sigue pendiente.
+                if (input.value === value) DIRTY_FIELDS.delete(name);
+                applyCellClasses(cell.a, data.clases);
+            } else {
+                showCaptureMessage(data.message || 'No se pudo guardar el valor.', 'danger');
+                return false;
+            }
+            hasUnsavedChanges = DIRTY_FIELDS.size > 0;
+            if (!cell.kind.startsWith('output_')) calculateAllTotalsForArea(toSlug(CAPTURE_STATE.areas[cell.a]), false);
+            return status !== 409;
+        })
+        .catch(() => {
+            showCaptureMessage('No se pudo comunicar con el servidor.', 'danger');
+            return false;
+        })
+        .finally(() => inputs.forEach(el => el.classList.remove('input-saving')));
+}
+
+function applyCellClasses(a, clases) {
+    clases.forEach(([h, cls]) => {
+        CAPTURE_STATE.clase[a][h] = cls;
+        document.querySelectorAll(`input[data-kind="produccion"][data-a="${a}"][data-i="${h}"]`).forEach(input => {
+            input.classList.remove('input-success', 'input-warning');
+            if (CAPTURE_STATE.clases[cls]) input.classList.add(CAPTURE_STATE.clases[cls]);
+        });
+    });
+}
+
+/**
+ * El botón de guardar solo envía las celdas que aún no se autoguardaron.
+ */
+function flushPendingCells(form) {
+    const pending = Array.from(DIRTY_FIELDS);
+    if (pending.length === 0) {
+        showCaptureMessage('No hay cambios pendientes; todo está guardado.', 'info');
+        return;
+    }
+    const saveButtons = form.querySelectorAll('button[type="submit"]');
+    saveButtons.forEach(b => b.disabled = true);
+    Promise.all(pending.map(name => autosaveCell(document.querySelector(`input[name="${name}"]`))))
+        .then(results => {
+            if (results.every(Boolean)) showCaptureMessage('Cambios guardados exitosamente.', 'success');
+        })
+        .finally(() => saveButtons.forEach(b => b.disabled = false));
+}
+
+function showCaptureMessage(message, category) {
+    const container = document.getElementById('captureStatus');
+    if (!container) { alert(message); return; }
+    container.innerHTML = `<div class="alert alert-${category} alert-dismissible fade show" role="alert">${escapeHtml(message)}<button type="button" class="close" data-dismiss="alert" aria-label="Cerrar"><span aria-hidden="true">&times;</span></button></div>`;
+}
+
 function toSlug(text) {
     if (typeof text !== 'string') return '';
     return text.replace(/ /g, '_').replace(/\./g, '').replace(/\//g, '');
@@ -40,6 +235,8 @@ function toSlug(text) {
 function onInputChanged(inputElement) {
     const name = inputElement.name;
     const value = inputElement.value;
+    DIRTY_FIELDS.add(name);
+    hasUnsavedChanges = true;
 
     document.querySelectorAll(`input[name="${name}"]`).forEach(counterpart => {
         if (counterpart !== inputElement) {
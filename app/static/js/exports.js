@@ -0,0 +1,65 @@
+// Exportaciones en segundo plano: los botones con data-export-url encolan el archivo en el
+// servidor, consultan su estado y lo descargan cuando está listo. Si el botón está dentro de un
+// formulario, sus campos se envían como parámetros. El href del botón (o el action del formulario)
+// queda como exportación directa si este script no carga.
+document.addEventListener('DOMContentLoaded', function() {
+    const POLL_INTERVAL_MS = 1000;
+    // Por encima de EXPORT_JOB_TIMEOUT_SECONDS (10 min por defecto), tras el cual el servidor ya responde Error.
+    const MAX_WAIT_MS = 15 * 60 * 1000;
+
+    function notify(icon, title, text) {
+        if (window.Swal) {
+            Swal.fire({ icon: icon, title: title, text: text });
+        } else {
+            alert(text ? `${title}\n${text}` : title);
+        }
+    }
+
+    async function pollUntilDone(statusUrl) {
+        const deadline = Date.now() + MAX_WAIT_MS;
+        while (Date.now() < deadline) {
+            const response = await fetch(statusUrl, { headers: { 'Accept': 'application/json' } });
+            const job = await response.json();
+            if (!response.ok) throw new Error(job.message || 'No se pudo consultar la exportación.');
+            if (job.status !== 'Pendiente' && job.status !== 'Procesando') return job;
+            await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+        }
+        throw new Error('La exportación tardó demasiado; inténtalo de nuevo más tarde.');
+    }
+
+    document.querySelectorAll('[data-export-url]').forEach(button => {
+        button.addEventListener('click', async function(event) {
+            event.preventDefault();
+            if (button.classList.contains('disabled')) return;
+            const form = button.closest('form');
+            if (form && !form.reportValidity()) return;
+            const params = form ? Object.fromEntries(new FormData(form)) : {};
+            const originalHtml = button.innerHTML;
+            button.classList.add('disabled');
+            button.innerHTML = '<i class="fas fa-spinner fa-spin"></i><span class="d-none d-md-inline ml-1">Generando...</span>';
+            try {
+                const response = await fetch(button.dataset.exportUrl, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+                    body: JSON.stringify({ ...params, csrf_token: button.dataset.csrfToken })
+                });
+                let job = await response.json();
+                if (!response.ok) throw new Error(job.message || 'No se pudo iniciar la exportación.');
+                if (!job.download_url) job = await pollUntilDone(job.status_url);
+
+                if (job.status === 'Listo') {
+                    window.location.href = job.download_url;
+                } else if (job.status === 'Sin datos') {
+                    notify('warning', job.detalle);
+                } else {
+                    notify('error', 'Ocurrió un error al generar el archivo Excel.', job.error || '');
+                }
+            } catch (error) {
+                notify('error', 'Ocurrió un error al generar el archivo Excel.', error.message);
+            } finally {
+                button.classList.remove('disabled');
+                button.innerHTML = originalHtml;
+            }
+        });
+    });
+});
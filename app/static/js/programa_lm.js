@@ -211,20 +211,23 @@ function saveCellData(url, token, cell, payload) {
 }
 
 /**
- * Lógica para las celdas editables.
+ * Lógica para las celdas editables. Los eventos se escuchan en el contenedor para que también
+ * funcionen en las filas que la vista completa (virtual_grid.js) crea al desplazarse.
  */
 function initializeEditableCells(url, token) {
-    document.querySelectorAll('.lm-table .editable-cell').forEach(cell => {
-        let originalValue = cell.textContent.trim();
-        cell.addEventListener('focus', () => {
-            originalValue = cell.textContent.trim();
-        });
-        cell.addEventListener('blur', (e) => {
-            const newValue = e.target.textContent.trim();
-            if (newValue !== originalValue) {
-                saveCellData(url, token, cell, { valor: newValue });
-            }
-        });
+    const container = document.querySelector('.programa-lm-container');
+    let originalValue = '';
+    container.addEventListener('focusin', (e) => {
+        const cell = e.target.closest('.lm-table .editable-cell');
+        if (cell) originalValue = cell.textContent.trim();
+    });
+    container.addEventListener('focusout', (e) => {
+        const cell = e.target.closest('.lm-table .editable-cell');
+        if (!cell) return;
+        const newValue = cell.textContent.trim();
+        if (newValue !== originalValue) {
+            saveCellData(url, token, cell, { valor: newValue });
+        }
     });
 }
 
@@ -235,39 +238,39 @@ function initializeContextMenu(url, token) {
     const menu = document.getElementById('cell-context-menu');
     let activeCell = null;
 
-    document.querySelectorAll('.lm-table .editable-cell').forEach(cell => {
-        cell.addEventListener('contextmenu', e => {
-            e.preventDefault();
-            activeCell = cell;
+    document.querySelector('.programa-lm-container').addEventListener('contextmenu', e => {
+        const cell = e.target.closest('.lm-table .editable-cell');
+        if (!cell) return;
+        e.preventDefault();
+        activeCell = cell;
 
-            // Hace el menú visible pero fuera de la vista para medir sus dimensiones
-            menu.style.visibility = 'hidden';
-            menu.style.display = 'block';
+        // Hace el menú visible pero fuera de la vista para medir sus dimensiones
+        menu.style.visibility = 'hidden';
+        menu.style.display = 'block';
 
-            const { offsetWidth: menuWidth, offsetHeight: menuHeight } = menu;
-            const { innerWidth: viewportWidth, innerHeight: viewportHeight } = window;
-            
-            let left = e.clientX;
-            let top = e.clientY;
+        const { offsetWidth: menuWidth, offsetHeight: menuHeight } = menu;
+        const { innerWidth: viewportWidth, innerHeight: viewportHeight } = window;
+        
+        let left = e.clientX;
+        let top = e.clientY;
 
-            // Ajusta la posición horizontal si se desborda
-            if (left + menuWidth > viewportWidth) {
-                left = viewportWidth - menuWidth - 5; // Añade un margen de 5px
-            }
+        // Ajusta la posición horizontal si se desborda
+        if (left + menuWidth > viewportWidth) {
+            left = viewportWidth - menuWidth - 5; // Añade un margen de 5px
+        }
 
-            // Ajusta la posición vertical si se desborda
-            if (top + menuHeight > viewportHeight) {
-                top = viewportHeight - menuHeight - 5; // Añade un margen de 5px
-            }
+        // Ajusta la posición vertical si se desborda
+        if (top + menuHeight > viewportHeight) {
+            top = viewportHeight - menuHeight - 5; // Añade un margen de 5px
+        }
 
-            // Aplica las posiciones calculadas y hace visible el menú
-            menu.style.left = `${left}px`;
-            menu.style.top = `${top}px`;
-            menu.style.visibility = 'visible';
-            
-            const styles = JSON.parse(cell.dataset.styles || '{}');
-            document.getElementById('bold-checkbox').checked = styles.fontWeight === 'bold';
-        });
+        // Aplica las posiciones calculadas y hace visible el menú
+        menu.style.left = `${left}px`;
+        menu.style.top = `${top}px`;
+        menu.style.visibility = 'visible';
+        
+        const styles = JSON.parse(cell.dataset.styles || '{}');
+        document.getElementById('bold-checkbox').checked = styles.fontWeight === 'bold';
     });
 
     document.addEventListener('click', () => { if (menu.style.display === 'block') { menu.style.display = 'none'; } });
@@ -111,24 +111,30 @@ function saveCellData(url, token, cell, payload) {
 }
 
 /**
- * Lógica para celdas editables (guardado de texto).
+ * Lógica para celdas editables (guardado de texto). Los eventos se escuchan en el contenedor para
+ * que también funcionen en las filas que la vista completa (virtual_grid.js) crea al desplazarse.
  */
 function initializeEditableCells(url, token) {
-    document.querySelectorAll('.editable-cell').forEach(cell => {
-        let originalValue = cell.textContent.trim();
-        cell.addEventListener('blur', () => {
-            const newValue = cell.textContent.trim();
-            if (newValue !== originalValue) {
-                saveCellData(url, token, cell, { valor: newValue });
-                originalValue = newValue;
-            }
-        });
-        cell.addEventListener('keydown', (e) => {
-            if (e.key === 'Enter') {
-                e.preventDefault();
-                cell.blur();
-            }
-        });
+    const container = document.querySelector('.programa-rotores-container');
+    let originalValue = '';
+    container.addEventListener('focusin', (e) => {
+        const cell = e.target.closest('.editable-cell');
+        if (cell) originalValue = cell.textContent.trim();
+    });
+    container.addEventListener('focusout', (e) => {
+        const cell = e.target.closest('.editable-cell');
+        if (!cell) return;
+        const newValue = cell.textContent.trim();
+        if (newValue !== originalValue) {
+            saveCellData(url, token, cell, { valor: newValue });
+        }
+    });
+    container.addEventListener('keydown', (e) => {
+        const cell = e.target.closest('.editable-cell');
+        if (cell && e.key === 'Enter') {
+            e.preventDefault();
+            cell.blur();
+        }
     });
 }
 
@@ -140,21 +146,20 @@ function initializeContextMenu(url, token) {
     if (!menu) return;
     let activeCell = null;
 
-    document.querySelectorAll('.programa-rotores-container .editable-cell').forEach(cell => {
-        cell.addEventListener('contextmenu', e => {
-            if (!cell.isContentEditable) return;
-            e.preventDefault();
-            activeCell = cell;
-            menu.style.display = 'block';
-            menu.style.left = `${e.pageX}px`;
-            menu.style.top = `${e.pageY}px`;
-            
-            const styles = JSON.parse(cell.dataset.styles || '{}');
-            const boldCheckbox = document.getElementById('bold-checkbox');
-            if (boldCheckbox) {
-                boldCheckbox.checked = styles.fontWeight === 'bold';
-            }
-        });
+    document.querySelector('.programa-rotores-container').addEventListener('contextmenu', e => {
+        const cell = e.target.closest('.editable-cell');
+        if (!cell || !cell.isContentEditable) return;
+        e.preventDefault();
+        activeCell = cell;
+        menu.style.display = 'block';
+        menu.style.left = `${e.pageX}px`;
+        menu.style.top = `${e.pageY}px`;
+        
+        const styles = JSON.parse(cell.dataset.styles || '{}');
+        const boldCheckbox = document.getElementById('bold-checkbox');
+        if (boldCheckbox) {
+            boldCheckbox.checked = styles.fontWeight === 'bold';
+        }
     });
 
     document.addEventListener('click', () => { if (menu.style.display === 'block') menu.style.display = 'none'; });
@@ -1,174 +1,205 @@
+// Reportes: gráficas semanal y mensual, resumen y tabla del día.
+// Al cambiar los filtros solo se piden a /api/reportes los periodos que cambiaron (semana, mes o
+// día); el navegador revalida cada respuesta con su ETag y el servidor contesta 304 si no hubo
+// captura nueva. Si la API falla se recurre al envío normal del formulario.
 document.addEventListener('DOMContentLoaded', function() {
-    // Contenedor principal que tiene todos los datos del backend.
-    const container = document.getElementById('reports-container');
-    if (!container) return;
-
-    // --- 1. Leer datos del backend desde los atributos data-* ---
-    const weeklyData = JSON.parse(container.dataset.weeklyData);
-    const monthlyData = JSON.parse(container.dataset.monthlyData);
-    const areaWeeklyData = JSON.parse(container.dataset.areaWeeklyData);
-    const areaMonthlyData = JSON.parse(container.dataset.areaMonthlyData);
-    const rangeData = JSON.parse(container.dataset.rangeChartData);
-    const comparisonData = JSON.parse(container.dataset.comparisonChartData);
-    const areas = {
-        IHP: JSON.parse(container.dataset.areasIhp),
-        FHP: JSON.parse(container.dataset.areasFhp)
-    };
-    const selectedArea = container.dataset.selectedArea;
+    const HORAS_TURNO = { 'Turno A': ['10AM', '1PM', '4PM'], 'Turno B': ['7PM', '10PM', '12AM'], 'Turno C': ['3AM', '6AM'] };
 
-    // --- 2. Referencias a elementos del DOM ---
-    const reportTypeSelect = document.getElementById('report_type');
-    const groupSelect = document.getElementById('group');
-    const groupSelectorContainer = document.getElementById('group_selector_container');
-    const singleDayInputs = document.getElementById('single_day_inputs');
-    const dateRangeInputs = document.getElementById('date_range_inputs');
-    const singleDateField = document.getElementById('single_date');
-    const rangeStartDateField = document.getElementById('range_start_date');
-    const areaSelectorContainer = document.getElementById('area_selector_container');
-    const areaSelector = document.getElementById('area_selector');
-
-    // --- 3. Lógica para los selectores dinámicos ---
-    function updateAreaSelector() {
-        const selectedGroup = groupSelect.value;
-        areaSelector.innerHTML = ''; // Limpiar opciones anteriores
-        
-        if (areas[selectedGroup]) {
-            areas[selectedGroup].forEach(area => {
-                const option = document.createElement('option');
-                option.value = area;
-                option.textContent = area;
-                if (area === selectedArea) {
-                    option.selected = true;
-                }
-                areaSelector.appendChild(option);
-            });
-        }
+    function formatNumber(num) {
+        return Math.round(num).toString().replace(/\B(?=(\d{3})+(?!\d))/g, ',');
+    }
+
+    function sum(values) {
+        return values.reduce((total, value) => total + value, 0);
     }
 
-    function toggleInputs() {
-        const selectedType = reportTypeSelect.value;
-        // Resetear visibilidad
-        groupSelectorContainer.style.display = 'none';
-        singleDayInputs.style.display = 'none';
-        dateRangeInputs.style.display = 'none';
-        areaSelectorContainer.style.display = 'none';
-
-        if (selectedType === 'group_comparison') {
-            dateRangeInputs.style.display = 'flex';
-        } else if (selectedType === 'date_range') {
-            groupSelectorContainer.style.display = 'block';
-            dateRangeInputs.style.display = 'flex';
-        } else if (selectedType === 'area_analysis') {
-            groupSelectorContainer.style.display = 'block';
-            singleDayInputs.style.display = 'block';
-            areaSelectorContainer.style.display = 'block';
-        } else { // 'single_day'
-            groupSelectorContainer.style.display = 'block';
-            singleDayInputs.style.display = 'block';
+    function readJson(id) {
+        const element = document.getElementById(id);
+        if (!element) return null;
+        try {
+            return JSON.parse(element.textContent);
+        } catch (e) {
+            console.error(`Error al parsear ${id}:`, e);
+            return null;
         }
-        
-        // Asignar el nombre correcto al campo de fecha para el envío del formulario
-        if (selectedType === 'date_range' || selectedType === 'group_comparison') {
-            rangeStartDateField.name = 'start_date';
-            singleDateField.name = 'start_date_single_disabled';
-        } else {
-            rangeStartDateField.name = 'start_date_range_disabled';
-            singleDateField.name = 'start_date';
+    }
+
+    const areasData = readJson('areas-data');
+    const groupSelect = document.getElementById('group');
+    const areaSelect = document.getElementById('area');
+    const dateInput = document.getElementById('date');
+    if (!areasData || !groupSelect || !areaSelect || !dateInput) return;
+
+    // Actualizar áreas cuando cambie el grupo
+    function updateAreas() {
+        const currentArea = areaSelect.value;
+        areaSelect.innerHTML = '<option value="GENERAL">General</option>';
+        (areasData[groupSelect.value] || []).forEach(area => {
+            const option = document.createElement('option');
+            option.value = area;
+            option.textContent = area;
+            if (area === currentArea) option.selected = true;
+            areaSelect.appendChild(option);
+        });
+    }
+    groupSelect.addEventListener('change', updateAreas);
+    updateAreas();
+
+    const container = document.getElementById('reportes-container');
+    const weeklyData = readJson('weekly-data');
+    const monthlyData = readJson('monthly-data');
+    if (!container || !weeklyData || !monthlyData) return;
+
+    const chartOptions = {
+        responsive: true,
+        maintainAspectRatio: false,
+        scales: {
+            y: { beginAtZero: true, ticks: { callback: value => formatNumber(value) } }
+        },
+        plugins: {
+            legend: { position: 'top' },
+            tooltip: {
+                callbacks: { label: context => context.dataset.label + ': ' + formatNumber(context.parsed.y) }
+            }
         }
+    };
+
+    const weeklyChart = new Chart(document.getElementById('weeklyChart'), {
+        type: 'line',
+        data: {
+            labels: weeklyData.labels,
+            datasets: [{
+                label: 'Producido', data: weeklyData.producido,
+                borderColor: 'rgb(40, 167, 69)', backgroundColor: 'rgba(40, 167, 69, 0.1)', tension: 0.1
+            }, {
+                label: 'Pronóstico', data: weeklyData.pronostico,
+                borderColor: 'rgb(255, 193, 7)', backgroundColor: 'rgba(255, 193, 7, 0.1)', tension: 0.1
+            }]
+        },
+        options: chartOptions
+    });
+
+    const monthlyChart = new Chart(document.getElementById('monthlyChart'), {
+        type: 'bar',
+        data: {
+            labels: monthlyData.labels,
+            datasets: [{
+                label: 'Producido', data: monthlyData.producido,
+                backgroundColor: 'rgba(40, 167, 69, 0.8)', borderColor: 'rgb(40, 167, 69)', borderWidth: 1
+            }, {
+                label: 'Pronóstico', data: monthlyData.pronostico,
+                backgroundColor: 'rgba(255, 193, 7, 0.8)', borderColor: 'rgb(255, 193, 7)', borderWidth: 1
+            }]
+        },
+        options: chartOptions
+    });
+
+    // --- Carga parcial por periodo ---
+
+    function periodKeys(group, area, dateStr) {
+        const date = new Date(dateStr + 'T00:00:00Z');
+        const monday = new Date(date.getTime() - ((date.getUTCDay() + 6) % 7) * 86400000);
+        const base = `${group}|${area}|`;
+        return { semana: base + monday.toISOString().slice(0, 10), mes: base + dateStr.slice(0, 7), dia: base + dateStr };
     }
-    
-    // Asignar eventos y ejecutar al cargar
-    groupSelect.addEventListener('change', updateAreaSelector);
-    reportTypeSelect.addEventListener('change', toggleInputs);
-    updateAreaSelector();
-    toggleInputs();
-
-    // --- 4. Inicialización de Gráficos ---
-
-    // Gráfico de Análisis de Día (Semanal)
-    const weeklyCtx = document.getElementById('weeklyChart');
-    if (weeklyData && weeklyCtx) {
-        new Chart(weeklyCtx, { /* ... configuración del gráfico ... */ });
+
+    let current = {
+        group: container.dataset.group,
+        area: container.dataset.area,
+        date: container.dataset.date,
+        keys: periodKeys(container.dataset.group, container.dataset.area, container.dataset.date)
+    };
+
+    async function fetchPeriod(group, periodo, area, dateStr) {
+        const url = container.dataset.apiUrl.replace('GRUPO', group).replace('PERIODO', periodo)
+            + `?area=${encodeURIComponent(area)}&fecha=${dateStr}`;
+        const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.json();
     }
 
-    // Gráfico de Análisis de Día (Mensual)
-    const monthlyCtx = document.getElementById('monthlyChart');
-    if (monthlyData && monthlyCtx) {
-        new Chart(monthlyCtx, { /* ... configuración del gráfico ... */ });
+    function updateChart(chart, data) {
+        chart.data.labels = data.labels;
+        chart.data.datasets[0].data = data.producido;
+        chart.data.datasets[1].data = data.pronostico;
+        chart.update();
     }
 
-    // Gráfico de Análisis de Área (Semanal)
-    const areaWeeklyCtx = document.getElementById('areaWeeklyChart');
-    if (areaWeeklyData && areaWeeklyCtx) {
-        new Chart(areaWeeklyCtx, {
-            type: 'bar',
-            data: {
-                labels: areaWeeklyData.labels,
-                datasets: [
-                    { label: 'Producido', data: areaWeeklyData.producido, backgroundColor: 'rgba(36, 184, 23, 0.8)', order: 2 },
-                    { label: 'Pronóstico', data: areaWeeklyData.pronostico, type: 'line', borderColor: 'rgba(255, 99, 132, 1)', fill: false, order: 1 }
-                ]
-            },
-            options: { responsive: true, maintainAspectRatio: false, scales: { y: { beginAtZero: true } } }
-        });
+    function updateWeekly(data) {
+        updateChart(weeklyChart, data);
+        document.getElementById('weeklyProduced').textContent = formatNumber(sum(data.producido));
+        document.getElementById('weeklyForecast').textContent = formatNumber(sum(data.pronostico));
     }
 
-    // Gráfico de Análisis de Área (Mensual)
-    const areaMonthlyCtx = document.getElementById('areaMonthlyChart');
-    if (areaMonthlyData && areaMonthlyCtx) {
-        new Chart(areaMonthlyCtx, {
-            type: 'line',
-            data: {
-                labels: areaMonthlyData.labels,
-                datasets: [
-                    { label: 'Producido', data: areaMonthlyData.producido, borderColor: 'rgb(36, 184, 23)', tension: 0.1 },
-                    { label: 'Pronóstico', data: areaMonthlyData.pronostico, borderColor: 'rgb(255, 99, 132)', tension: 0.1, borderDash: [5, 5] }
-                ]
-            },
-            options: { responsive: true, maintainAspectRatio: false, scales: { y: { beginAtZero: true } } }
-        });
+    function updateMonthly(data) {
+        updateChart(monthlyChart, data);
+        const produced = sum(data.producido);
+        const forecast = sum(data.pronostico);
+        document.getElementById('monthlyProduced').textContent = formatNumber(produced);
+        document.getElementById('monthlyForecast').textContent = formatNumber(forecast);
+        document.getElementById('monthlyEfficiency').textContent = forecast > 0 ? `${(produced / forecast * 100).toFixed(1)}%` : 'N/A';
     }
-    
-    // Gráfico de Rango de Fechas
-    const rangeCtx = document.getElementById('rangeChart');
-    if (rangeData && rangeCtx) {
-        new Chart(rangeCtx, {
-            type: 'bar',
-            data: {
-                labels: rangeData.labels,
-                datasets: [
-                    { label: 'Producido', data: rangeData.producido, backgroundColor: 'rgba(36, 184, 23, 0.8)' },
-                    { label: 'Pronóstico', data: rangeData.pronostico, backgroundColor: 'rgba(201, 203, 207, 0.8)' },
-                    { label: 'Eficiencia (%)', data: rangeData.eficiencia, type: 'line', borderColor: '#ffc107', yAxisID: 'y1', tension: 0.1 }
-                ]
-            },
-            options: {
-                responsive: true, maintainAspectRatio: false,
-                scales: {
-                    x: { stacked: false },
-                    y: { type: 'linear', display: true, position: 'left', stacked: false, title: { display: true, text: 'Unidades' } },
-                    y1: { type: 'linear', display: true, position: 'right', grid: { drawOnChartArea: false }, title: { display: true, text: 'Eficiencia (%)' }, suggestedMax: 110 }
-                }
-            }
-        });
+
+    function efficiencyBadge(eff) {
+        const badge = eff >= 100 ? 'badge-success' : (eff >= 80 ? 'badge-warning' : 'badge-danger');
+        return `<span class="badge ${badge} font-weight-bold">${eff.toFixed(1)}%</span>`;
     }
 
-    // Gráfico de Comparación de Grupos
-    const comparisonCtx = document.getElementById('comparisonChart');
-    if (comparisonData && comparisonCtx) {
-        new Chart(comparisonCtx, {
-            type: 'line',
-            data: {
-                labels: comparisonData.labels,
-                datasets: [
-                    { label: 'IHP', data: comparisonData.ihp_data, borderColor: '#007bff', backgroundColor: 'rgba(0, 123, 255, 0.1)', fill: true, tension: 0.1 },
-                    { label: 'FHP', data: comparisonData.fhp_data, borderColor: '#28a745', backgroundColor: 'rgba(40, 167, 69, 0.1)', fill: true, tension: 0.1 }
-                ]
-            },
-            options: {
-                responsive: true, maintainAspectRatio: false,
-                scales: { y: { beginAtZero: true, title: { display: true, text: 'Unidades Producidas' } } }
-            }
-        });
+    function renderDailyRow(areaData) {
+        const turnos = Object.keys(HORAS_TURNO).map(turno => {
+            const data = areaData.turnos[turno];
+            const horas = areaData.area === 'Output' ? '' : `<div class="text-muted" style="font-size: 0.7em;">${
+                HORAS_TURNO[turno].map(hora => `<div>${hora}: ${formatNumber(data.horas[hora] || 0)}</div>`).join('')}</div>`;
+            return `<td class="text-center"><div class="d-flex flex-column">
+                <small class="text-warning font-weight-bold mb-1">Pron: ${formatNumber(data.pronostico)}</small>
+                <small class="text-success font-weight-bold mb-1">Total: ${formatNumber(data.producido)}</small>${horas}</div></td>`;
+        }).join('');
+        const row = document.createElement('tr');
+        row.innerHTML = `<td class="font-weight-bold"></td>${turnos}
+            <td class="text-center"><div class="d-flex flex-column">
+                <small class="text-warning font-weight-bold">${formatNumber(areaData.total_pronostico)}</small>
+                <small class="text-success font-weight-bold">${formatNumber(areaData.total_producido)}</small>
+            </div></td>
+            <td class="text-center">${efficiencyBadge(areaData.eficiencia)}</td>`;
+        row.firstElementChild.textContent = areaData.area;
+        return row;
     }
+
+    function updateDaily(data, dateStr) {
+        const body = document.getElementById('daily-detail-body');
+        body.replaceChildren(...data.detalle.map(renderDailyRow));
+        document.getElementById('daily-date').textContent = dateStr;
+        document.getElementById('daily-detail-section').style.display = data.detalle.length ? '' : 'none';
+    }
+
+    const form = groupSelect.closest('form');
+    form.addEventListener('submit', async function(event) {
+        event.preventDefault();
+        const group = groupSelect.value;
+        const area = areaSelect.value;
+        const dateStr = dateInput.value;
+        if (!dateStr) return;
+        const keys = periodKeys(group, area, dateStr);
+        const updaters = { semana: updateWeekly, mes: updateMonthly, dia: data => updateDaily(data, dateStr) };
+        const changed = Object.keys(keys).filter(periodo => keys[periodo] !== current.keys[periodo]);
+        const button = form.querySelector('button[type="submit"]');
+        button.disabled = true;
+        try {
+            const results = await Promise.all(changed.map(periodo => fetchPeriod(group, periodo, area, dateStr)));
+            // Datos guardados porque la base no responde: la página completa muestra el aviso con su fecha.
+            if (results.some(data => data.datos_al)) throw new Error('datos no actualizados');
+            changed.forEach((periodo, i) => updaters[periodo](results[i]));
+        } catch (error) {
+            console.error('Error al cargar el reporte; se recarga la página:', error);
+            form.submit();
+            return;
+        } finally {
+            button.disabled = false;
+        }
+        current = { group, area, date: dateStr, keys };
+        document.getElementById('report-title').textContent =
+            `Reporte para ${group}${area !== 'GENERAL' ? ' - ' + area : ''} (${dateStr})`;
+        const params = new URLSearchParams({ group, area, date: dateStr });
+        history.replaceState(null, '', `${window.location.pathname}?${params}`);
+    });
 });
\ No newline at end of file
@@ -0,0 +1,199 @@
+// Vista completa de los programas (LM, Rotores): todas las órdenes pendientes en una sola tabla
+// desplazable. Las filas se piden al servidor por bloques (data-rows-url, ver rows_range en
+// programs.py) y solo existen en el DOM las visibles más un margen; el resto de la altura son dos
+// filas espaciadoras. Cada bloque se pide con el cursor del anterior cuando se conoce, y en memoria
+// se guardan como mucho MAX_BLOCKS bloques. Las celdas usan las mismas clases que la tabla
+// paginada (.lm-table .editable-cell), así que la edición y el menú de estilos de programa_*.js
+// funcionan igual. El botón [data-virtual-grid-toggle] cambia entre las dos vistas y recuerda la
+// elección en localStorage (data-storage-key).
+document.addEventListener('DOMContentLoaded', function() {
+    const BLOCK_SIZE = 200;
+    const MAX_BLOCKS = 12;
+    const OVERSCAN = 10;
+
+    document.querySelectorAll('.virtual-grid[data-rows-url]').forEach(grid => {
+        const page = grid.closest('.content-section');
+        const toggleBtn = document.querySelector('[data-virtual-grid-toggle]');
+        const viewport = grid.querySelector('.virtual-grid-viewport');
+        const table = grid.querySelector('table');
+        const tbody = table.querySelector('tbody');
+        const status = grid.querySelector('.virtual-grid-status');
+        const headers = Array.from(table.querySelectorAll('thead th'));
+        const columns = headers.filter(th => th.dataset.colId).map(th => ({ id: Number(th.dataset.colId), editable: th.dataset.editable === '1' }));
+        const filters = new URLSearchParams(window.location.search);
+        filters.delete('page');
+
+        const blocks = new Map();   // índice de bloque -> filas
+        const cursors = new Map();  // índice de bloque -> cursor de su última fila
+        const loading = new Set();
+        let rowHeight = 37;
+        let total = null;
+        let frame = null;
+        let started = false;
+        let renderedKey = '';
+        let version = 0;
+
+        table.style.width = `${headers.reduce((sum, th) => sum + (parseInt(th.style.width, 10) || 150), 0)}px`;
+
+        function rowAt(index) {
+            const block = blocks.get(Math.floor(index / BLOCK_SIZE));
+            return block ? block[index % BLOCK_SIZE] : undefined;
+        }
+
+        function evictFarBlocks(current) {
+            while (blocks.size > MAX_BLOCKS) {
+                let farthest = null;
+                blocks.forEach((_, index) => {
+                    if (farthest === null || Math.abs(index - current) > Math.abs(farthest - current)) farthest = index;
+                });
+                blocks.delete(farthest);
+            }
+        }
+
+        function fetchBlock(index) {
+            if (blocks.has(index) || loading.has(index)) return;
+            loading.add(index);
+            const params = new URLSearchParams(filters);
+            params.set('start', index * BLOCK_SIZE);
+            params.set('count', BLOCK_SIZE);
+            if (cursors.has(index - 1)) params.set('after', cursors.get(index - 1));
+            if (total === null) params.set('total', '1');
+
+            fetch(`${grid.dataset.rowsUrl}?${params}`, { headers: { 'Accept': 'application/json' } })
+                .then(response => response.json().then(data => response.ok ? data : Promise.reject(data)))
+                .then(data => {
+                    if (data.total !== undefined) {
+                        total = data.total;
+                        const sameColumns = data.columns.length === columns.length && data.columns.every((id, i) => id === columns[i].id);
+                        status.textContent = sameColumns ? `${total} órdenes pendientes.` : 'Las columnas cambiaron; recarga la página para ver la tabla actualizada.';
+                    }
+                    blocks.set(index, data.rows);
+                    if (data.next) cursors.set(index, data.next);
+                    evictFarBlocks(index);
+                    version++;
+                    schedule();
+                })
+                .catch(error => {
+                    status.textContent = `No se pudieron cargar las órdenes: ${error.message || 'Error de red'}`;
+                })
+                .finally(() => loading.delete(index));
+        }
+
+        // Lleva al bloque en memoria lo editado en las filas visibles antes de volver a pintarlas.
+        function syncRenderedRows() {
+            tbody.querySelectorAll('tr[data-index]').forEach(tr => {
+                const row = rowAt(Number(tr.dataset.index));
+                if (!row) return;
+                tr.querySelectorAll('.editable-cell').forEach((td, i) => {
+                    row.cells[i] = [td.textContent.trim(), td.style.cssText, td.dataset.styles];
+                });
+            });
+        }
+
+        function spacer(height) {
+            const tr = document.createElement('tr');
+            tr.className = 'virtual-grid-spacer';
+            const td = document.createElement('td');
+            td.colSpan = headers.length;
+            td.style.height = `${height}px`;
+            tr.appendChild(td);
+            return tr;
+        }
+
+        function buildRow(index) {
+            const tr = document.createElement('tr');
+            const row = rowAt(index);
+            if (!row) {
+                const td = document.createElement('td');
+                td.colSpan = headers.length;
+                td.className = 'text-muted';
+                td.textContent = 'Cargando…';
+                tr.appendChild(td);
+                return tr;
+            }
+            tr.dataset.index = index;
+            if (row.duplicate) tr.classList.add('duplicate-row');
+
+            const number = document.createElement('td');
+            number.className = 'text-center';
+            number.textContent = row.n;
+            tr.appendChild(number);
+            row.fields.forEach((value, i) => {
+                const td = document.createElement('td');
+                if (i === 0) td.className = 'font-weight-bold';
+                else if (typeof value === 'number') td.className = 'text-center';
+                td.textContent = value === null ? '' : value;
+                tr.appendChild(td);
+            });
+            columns.forEach((column, i) => {
+                const cell = row.cells[i];
+                const td = document.createElement('td');
+                td.className = 'editable-cell';
+                td.dataset.ordenId = row.id;
+                td.dataset.columnaId = column.id;
+                td.dataset.styles = (cell && cell[2]) || '{}';
+                td.style.cssText = cell ? cell[1] : '';
+                td.textContent = cell && cell[0] !== null ? cell[0] : '';
+                td.contentEditable = column.editable ? 'true' : 'false';
+                tr.appendChild(td);
+            });
+            return tr;
+        }
+
+        function render() {
+            frame = null;
+            if (total === null) return;
+            const first = Math.max(0, Math.floor(viewport.scrollTop / rowHeight) - OVERSCAN);
+            const last = Math.min(total, Math.ceil((viewport.scrollTop + viewport.clientHeight) / rowHeight) + OVERSCAN);
+            for (let block = Math.floor(first / BLOCK_SIZE); block <= Math.floor((last - 1) / BLOCK_SIZE); block++) {
+                fetchBlock(block);
+            }
+            const key = `${first}:${last}:${version}`;
+            if (key === renderedKey) return;
+            renderedKey = key;
+
+            // Quitar el foco guarda la celda en edición (focusout de programa_*.js) antes de reemplazarla.
+            if (tbody.contains(document.activeElement)) document.activeElement.blur();
+            syncRenderedRows();
+            const fragment = document.createDocumentFragment();
+            fragment.appendChild(spacer(first * rowHeight));
+            for (let index = first; index < last; index++) fragment.appendChild(buildRow(index));
+            fragment.appendChild(spacer((total - last) * rowHeight));
+            tbody.replaceChildren(fragment);
+
+            const sample = tbody.querySelector('tr[data-index]');
+            if (sample && sample.offsetHeight && sample.offsetHeight !== rowHeight) {
+                rowHeight = sample.offsetHeight;
+                renderedKey = '';
+                schedule();
+            }
+        }
+
+        function schedule() {
+            if (frame === null) frame = requestAnimationFrame(render);
+        }
+
+        function setActive(active) {
+            page.classList.toggle('virtual-grid-active', active);
+            if (toggleBtn) toggleBtn.classList.toggle('active', active);
+            if (active && !started) {
+                started = true;
+                status.textContent = 'Cargando órdenes…';
+                fetchBlock(0);
+            }
+            if (active) schedule();
+        }
+
+        viewport.addEventListener('scroll', schedule, { passive: true });
+        window.addEventListener('resize', schedule);
+        if (toggleBtn) {
+            const storageKey = toggleBtn.dataset.storageKey;
+            toggleBtn.addEventListener('click', () => {
+                const active = !page.classList.contains('virtual-grid-active');
+                if (storageKey) localStorage.setItem(storageKey, active);
+                setActive(active);
+            });
+            setActive(Boolean(storageKey) && localStorage.getItem(storageKey) === 'true');
+        }
+    });
+});
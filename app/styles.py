@@ -0,0 +1,114 @@
+# app/styles.py
+"""Diccionario de estilos de celda de los programas LM/Rotores (tabla estilos_celda).
+
+Las celdas solo usan unas cuantas combinaciones de color de fondo, color de letra y negritas, pero
+cada una guardaba su propio JSON y cada plantilla lo parseaba al renderizar. Ahora cada combinación
+se guarda una vez en `estilos_celda` y la celda lleva su id (`estilo_id` en datos_celda_*, "s" en
+el documento de la orden). Aquí se mantiene en memoria hash -> id, para internar sin consultar, e
+id -> `Style` con el CSS ya armado y el JSON que usa el menú de la celda. Un estilo nunca cambia ni
+se borra, así que la caché no se invalida; un id que este proceso no conoce (lo internó otro
+worker) se lee de la base.
+"""
+import json
+import hashlib
+import threading
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from . import engine
+from .metrics import registry
+from .models import EstiloCelda
+
+# Propiedades que guarda el menú de la celda (programa_*.js) y su nombre en CSS.
+STYLE_PROPERTIES = (('backgroundColor', 'background-color'), ('color', 'color'), ('fontWeight', 'font-weight'))
+
+# estilos_css: JSON canónico para data-styles; css: atributo style ya armado.
+Style = namedtuple('Style', 'id estilos_css css')
+
+STYLE_LOOKUPS = registry.counter('nidec_cell_style_lookups_total', 'Búsquedas de estilos de celda por resultado.', ('result',))
+
+_lock = threading.Lock()
+_by_hash = {}
+_by_id = {}
+
+
+def normalize(estilos):
+    """Solo las propiedades conocidas con valor; None si no queda ninguna."""
+    if not isinstance(estilos, dict):
+        return None
+    estilos = {key: str(estilos[key]) for key, _ in STYLE_PROPERTIES if estilos.get(key)}
+    return estilos or None
+
+
+def render_css(estilos):
+    return ' '.join(f"{prop}:{estilos[key]};" for key, prop in STYLE_PROPERTIES if key in estilos)
+
+
+def _remember(style, digest=None):
+    with _lock:
+        _by_id[style.id] = style
+        if digest:
+            _by_hash[digest] = style.id
+
+
+def _insert_ignore(table):
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def intern(estilos):
+    """Id de la combinación `estilos` (dict del menú de la celda), creándola si no existe; None si está vacía.
+
+    El alta va en su propia transacción: el id queda válido aunque la edición que lo pidió se revierta.
+    """
+    estilos = normalize(estilos)
+    if not estilos:
+        return None
+    canonical = json.dumps(estilos, sort_keys=True, separators=(',', ':'))
+    digest = hashlib.sha1(canonical.encode()).hexdigest()
+    with _lock:
+        style_id = _by_hash.get(digest)
+    if style_id is not None:
+        STYLE_LOOKUPS.inc(result='hit')
+        return style_id
+    STYLE_LOOKUPS.inc(result='miss')
+    table = EstiloCelda.__table__
+    css = render_css(estilos)
+    with engine.begin() as conn:
+        conn.execute(_insert_ignore(table).values(hash=digest, estilos=canonical, css=css).on_conflict_do_nothing(index_elements=['hash']))
+        style_id = conn.execute(select(table.c.id).where(table.c.hash == digest)).scalar_one()
+    _remember(Style(style_id, canonical, css), digest)
+    return style_id
+
+
+def get_many(style_ids):
+    """{id: Style} de los ids dados; los que no están en memoria se leen en una sola consulta."""
+    style_ids = {i for i in style_ids if i is not None}
+    with _lock:
+        found = {i: _by_id[i] for i in style_ids if i in _by_id}
+    missing = style_ids - found.keys()
+    STYLE_LOOKUPS.inc(len(found), result='hit')
+    if missing:
+        STYLE_LOOKUPS.inc(len(missing), result='miss')
+        table = EstiloCelda.__table__
+        with engine.connect() as conn:
+            for row in conn.execute(select(table.c.id, table.c.hash, table.c.estilos, table.c.css).where(table.c.id.in_(missing))):
+                style = Style(row.id, row.estilos, row.css)
+                _remember(style, row.hash)
+                found[row.id] = style
+    return found
+
+
+def from_legacy(estilos_css):
+    """Style (sin id) de una celda que aún guarda su JSON en estilos_css; None si está vacío o no es válido."""
+    try:
+        estilos = normalize(json.loads(estilos_css)) if estilos_css else None
+    except ValueError:
+        return None
+    if not estilos:
+        return None
+    return Style(None, json.dumps(estilos, sort_keys=True, separators=(',', ':')), render_css(estilos))
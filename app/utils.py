@@ -29,8 +29,9 @@ def now_mexico():
         import pytz
         return datetime.now(pytz.timezone("America/Mexico_City"))
 
-def get_business_date():
-    now = now_mexico()
+def get_business_date(now=None):
+    """Día hábil (corte a las 7:00) de `now`, hora de México; por defecto, el actual."""
+    now = now or now_mexico()
     return (now - timedelta(days=1)).date() if now.hour < 7 else now.date()
 
 def get_kpi_color_class(eficiencia):
@@ -42,24 +43,30 @@ def get_kpi_color_class(eficiencia):
     except (ValueError, TypeError):
         return 'red' # Devuelve 'red' por defecto en caso de error
 
+def activity_entry(action, details="", area_grupo=None, category="General", severity="Info"):
+    """Registro de actividad sin guardar, para confirmarlo en la misma transacción que los datos."""
+    from .models import ActivityLog
+    return ActivityLog(
+        timestamp=datetime.utcnow(), 
+        username=session.get('username', 'Sistema'), 
+        action=action, 
+        details=details, 
+        area_grupo=area_grupo, 
+        ip_address=request.remote_addr, 
+        category=category, 
+        severity=severity
+    )
+
 def log_activity(action, details="", area_grupo=None, category="General", severity="Info"):
     from . import db_session
-    from .models import ActivityLog
+    from .metrics import ACTIVITY_LOG_WRITES
     try:
-        log_entry = ActivityLog(
-            timestamp=datetime.utcnow(), 
-            username=session.get('username', 'Sistema'), 
-            action=action, 
-            details=details, 
-            area_grupo=area_grupo, 
-            ip_address=request.remote_addr, 
-            category=category, 
-            severity=severity
-        )
-        db_session.add(log_entry)
+        db_session.add(activity_entry(action, details, area_grupo, category, severity))
         db_session.commit()
+        ACTIVITY_LOG_WRITES.inc(result='ok')
     except exc.SQLAlchemyError as e:
         db_session.rollback()
+        ACTIVITY_LOG_WRITES.inc(result='error')
         print(f"Error al registrar actividad: {e}")
 
 def get_hourly_target(pronostico_turno, turno_name):
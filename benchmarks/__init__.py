@@ -0,0 +1,11 @@
+"""Suite de benchmarks de la aplicación.
+
+Uso:
+    python -m benchmarks run --years 1 --scale 0.2 --iterations 5
+    python -m benchmarks compare benchmarks/results/a.json benchmarks/results/b.json
+
+`run` crea una base SQLite temporal (o usa --database-url), la llena con datos
+sintéticos deterministas (`datagen`), mide los endpoints principales con el
+test client de Flask (`harness`) y guarda el resultado en JSON para poder
+compararlo entre commits.
+"""
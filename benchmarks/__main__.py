@@ -0,0 +1,53 @@
+import sys
+import json
+import argparse
+
+from . import harness
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks de la aplicación de producción.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_p = sub.add_parser('run', help='Genera datos sintéticos y mide los endpoints.')
+    run_p.add_argument('--years', type=float, default=1.0, help='Años de historial de producción a generar.')
+    run_p.add_argument('--scale', type=float, default=0.2, help='Escala de órdenes LM/Rotores y registros de log.')
+    run_p.add_argument('--seed', type=int, default=42)
+    run_p.add_argument('--iterations', type=int, default=5)
+    run_p.add_argument('--warmup', type=int, default=1)
+    run_p.add_argument('--endpoint', action='append', dest='endpoints', help='Limita la corrida a estos endpoints (repetible).')
+    run_p.add_argument('--database-url', default=None, help='Base de datos destino; por defecto un SQLite temporal.')
+    run_p.add_argument('--output-dir', default='benchmarks/results')
+
+    cmp_p = sub.add_parser('compare', help='Compara dos archivos de resultados.')
+    cmp_p.add_argument('baseline')
+    cmp_p.add_argument('current')
+    cmp_p.add_argument('--threshold', type=float, default=0.10, help='Aumento relativo tolerado antes de marcar regresión.')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = harness.run(years=args.years, scale=args.scale, seed=args.seed, iterations=args.iterations,
+                             warmup=args.warmup, endpoints=args.endpoints, database_url=args.database_url,
+                             output_dir=args.output_dir)
+        print(f"{'Endpoint':<22}{'p50 ms':>10}{'p95 ms':>10}{'queries':>10}{'peak KB':>12}  status")
+        for name, r in report['endpoints'].items():
+            print(f"{name:<22}{r['latency_ms']['p50']:>10}{r['latency_ms']['p95']:>10}{r['queries']['mean']:>10}{r['peak_memory_kb']:>12}  {r['status_codes']}")
+        if report.get('path'):
+            print(f"\nResultados guardados en {report['path']}")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as fh:
+        baseline = json.load(fh)
+    with open(args.current, encoding='utf-8') as fh:
+        current = json.load(fh)
+    rows = harness.compare(baseline, current, threshold=args.threshold)
+    print(f"{'Endpoint':<22}{'p50 base':>10}{'p50 act':>10}{'Δ':>8}{'q base':>8}{'q act':>8}")
+    for r in rows:
+        flag = '  REGRESIÓN' if r['regression'] else ''
+        print(f"{r['endpoint']:<22}{r['p50_base']:>10}{r['p50_current']:>10}{r['p50_delta']:>8.1%}{r['queries_base']:>8}{r['queries_current']:>8}{flag}")
+    return 1 if any(r['regression'] for r in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Generador determinista de datos sintéticos para benchmarks.
+
+Todas las tablas se llenan con inserciones masivas (executemany) en lotes y con
+un `random.Random(seed)` propio, de modo que dos corridas con los mismos
+parámetros producen exactamente los mismos datos.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app.models import (Pronostico, ProduccionCaptura, OutputData, OrdenLM, ColumnaLM, DatoCeldaLM,
+                        OrdenRotores, ColumnaRotores, DatoCeldaRotores, ActivityLog)
+from app.utils import AREAS_IHP, AREAS_FHP, HORAS_TURNO, NOMBRES_TURNOS_PRODUCCION, get_business_date
+
+BATCH_SIZE = 5000
+GROUPS = {'IHP': AREAS_IHP, 'FHP': AREAS_FHP}
+LM_COLUMNS = 30
+HIGHLIGHT_STYLES = [{'backgroundColor': '#fff3cd'}, {'backgroundColor': '#d4edda'}, {'color': '#dc3545', 'fontWeight': 'bold'}]
+LOG_ACTIONS = [('Inicio de sesión', 'Autenticación', 'Info', 'Sistema'),
+               ('Modificación Producción', 'Datos', 'Info', 'IHP'),
+               ('Modificación Producción', 'Datos', 'Info', 'FHP'),
+               ('Edición Celda LM', 'General', 'Info', 'PROGRAMA_LM'),
+               ('Intento de inicio de sesión fallido', 'Seguridad', 'Warning', 'Sistema'),
+               ('Eliminación Fila LM', 'Seguridad', 'Critical', 'ADMIN')]
+
+
+def _bulk_insert(session, model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        session.execute(insert(model), rows[start:start + BATCH_SIZE])
+    session.commit()
+    return len(rows)
+
+
+def generate_production(session, rng, start_date, end_date):
+    """Pronóstico por turno, producción por hora y Output diario para ambos grupos."""
+    pronosticos, producciones, outputs = [], [], []
+    current = start_date
+    while current <= end_date:
+        for grupo, areas in GROUPS.items():
+            for area in [a for a in areas if a != 'Output']:
+                for turno in NOMBRES_TURNOS_PRODUCCION:
+                    pronostico = rng.randint(60, 240)
+                    pronosticos.append({'fecha': current, 'grupo': grupo, 'area': area, 'turno': turno,
+                                        'valor_pronostico': pronostico, 'status': 'Nuevo'})
+                    horas = HORAS_TURNO[turno]
+                    for hora in horas:
+                        producciones.append({'fecha': current, 'grupo': grupo, 'area': area, 'hora': hora,
+                                             'valor_producido': int(pronostico / len(horas) * rng.uniform(0.6, 1.15)),
+                                             'usuario_captura': 'bench', 'fecha_captura': datetime.combine(current, datetime.min.time())})
+            outputs.append({'fecha': current, 'grupo': grupo, 'pronostico': rng.randint(400, 900),
+                            'output': rng.randint(300, 950), 'usuario_captura': 'bench',
+                            'fecha_captura': datetime.combine(current, datetime.min.time())})
+        current += timedelta(days=1)
+    return {
+        'pronosticos': _bulk_insert(session, Pronostico, pronosticos),
+        'produccion_capturas': _bulk_insert(session, ProduccionCaptura, producciones),
+        'output_data': _bulk_insert(session, OutputData, outputs),
+    }
+
+
+def _generate_program(session, rng, orden_model, columna_model, celda_model, columnas, orders, make_order):
+    if not session.query(columna_model).count():
+        _bulk_insert(session, columna_model, [{'nombre': nombre, 'orden': i} for i, nombre in enumerate(columnas)])
+    column_ids = [c.id for c in session.query(columna_model).order_by(columna_model.orden)]
+    base_ts = datetime(2020, 1, 1)
+    _bulk_insert(session, orden_model, [make_order(i, base_ts + timedelta(minutes=17 * i)) for i in range(orders)])
+
+    order_ids = [o_id for (o_id,) in session.query(orden_model.id).order_by(orden_model.id)]
+    celdas = []
+    for orden_id in order_ids:
+        for columna_id in column_ids:
+            if rng.random() < 0.6:
+                estilos = json.dumps(rng.choice(HIGHLIGHT_STYLES)) if rng.random() < 0.15 else None
+                celdas.append({'orden_id': orden_id, 'columna_id': columna_id, 'valor': f"V{rng.randint(1, 9999)}", 'estilos_css': estilos})
+    return len(order_ids), _bulk_insert(session, celda_model, celdas)
+
+
+def generate_programs(session, rng, lm_orders, rotores_orders):
+    lm_total, lm_cells = _generate_program(
+        session, rng, OrdenLM, ColumnaLM, DatoCeldaLM, [f"Columna {i + 1}" for i in range(LM_COLUMNS)], lm_orders,
+        lambda i, ts: {'wip_order': f"WIP-{i:07d}", 'item': f"ITEM-{i % 500:04d}", 'qty': 1 + i % 20, 'timestamp': ts,
+                       'status': 'Aprobada' if i % 4 == 0 else 'Pendiente'})
+    rot_total, rot_cells = _generate_program(
+        session, rng, OrdenRotores, ColumnaRotores, DatoCeldaRotores, ['Rotor', 'Lamina', 'Flecha', 'Comentarios'], rotores_orders,
+        lambda i, ts: {'item': f"ROT-{i:07d}", 'item_number': f"N-{i % 300:04d}", 'cantidad': 1 + i % 10, 'timestamp': ts,
+                       'status': 'Aprobada' if i % 4 == 0 else 'Pendiente'})
+    return {'ordenes_lm': lm_total, 'datos_celda_lm': lm_cells, 'ordenes_rotores': rot_total, 'datos_celda_rotores': rot_cells}
+
+
+def generate_activity_logs(session, rng, total, start_date, end_date):
+    span = (datetime.combine(end_date, datetime.min.time()) - datetime.combine(start_date, datetime.min.time())).total_seconds()
+    base = datetime.combine(start_date, datetime.min.time())
+    rows = []
+    for i in range(total):
+        action, category, severity, area = rng.choice(LOG_ACTIONS)
+        rows.append({'timestamp': base + timedelta(seconds=span * i / max(total, 1)), 'username': f"user{rng.randint(1, 40):02d}",
+                     'action': action, 'details': f"Registro sintético {i}", 'area_grupo': area, 'ip_address': '10.0.0.1',
+                     'category': category, 'severity': severity})
+    return {'activity_logs': _bulk_insert(session, ActivityLog, rows)}
+
+
+def generate(session, years=1.0, scale=1.0, seed=42, end_date=None):
+    """Llena la base con `years` años de producción y un volumen de programas/logs proporcional a `scale`.
+
+    Devuelve un diccionario con el número de filas insertadas por tabla.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or get_business_date()
+    start_date = end_date - timedelta(days=int(365 * years) - 1)
+    counts = {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()}
+    counts.update(generate_production(session, rng, start_date, end_date))
+    counts.update(generate_programs(session, rng, int(2000 * scale), int(1000 * scale)))
+    counts.update(generate_activity_logs(session, rng, int(50000 * scale), start_date, end_date))
+    return counts
@@ -0,0 +1,197 @@
+"""Arnés de medición sobre el test client de Flask.
+
+Por cada endpoint registra latencia (p50/p95/p99/máx), número de consultas SQL
+por petición y memoria pico (tracemalloc). La base de datos se configura vía
+DATABASE_URL antes de importar `app`, porque el engine se crea al importar.
+"""
+import os
+import json
+import time
+import tempfile
+import platform
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+ENDPOINTS = [
+    ('dashboard_admin', 'GET', '/dashboard/admin', None),
+    ('dashboard_group', 'GET', '/dashboard/ihp', None),
+    ('reportes', 'GET', '/reportes?group=IHP&area=GENERAL', None),
+    ('reportes_area', 'GET', '/reportes?group=FHP&area=Cuerpos', None),
+    ('reportes_api_mes', 'GET', '/api/reportes/ihp/mes?area=GENERAL', None),
+    ('reportes_api_dia', 'GET', '/api/reportes/fhp/dia?area=GENERAL', None),
+    ('captura_get', 'GET', '/captura/ihp', None),
+    ('captura_post', 'POST', '/captura/ihp', 'captura_form'),
+    ('captura_api_get', 'GET', '/api/captura/ihp', None),
+    ('captura_api_save', 'POST', '/api/captura/ihp', 'captura_json'),
+    ('programa_lm', 'GET', '/programa_lm/', None),
+    ('programa_rotores', 'GET', '/programa_rotores/', None),
+    ('programa_lm_rows', 'GET', '/programa_lm/rows?start=0&count=200&total=1', None),
+    ('centro_acciones', 'GET', '/admin/centro_acciones', None),
+    ('activity_log', 'GET', '/admin/activity_log', None),
+    ('export_lm', 'GET', '/programa_lm/export/excel', None),
+    ('export_rotores', 'GET', '/programa_rotores/export/excel', None),
+    ('export_activity_log', 'GET', '/admin/activity_log/export?format=csv&gzip=1', None),
+    ('export_reportes', 'GET', '/reportes/export/excel?grupo=AMBOS', None),
+]
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def _captura_form(app, client, fecha):
+    from app.utils import AREAS_IHP, HORAS_TURNO, NOMBRES_TURNOS_PRODUCCION, to_slug
+    with client.session_transaction() as sess:
+        token = sess.get('csrf_token')
+    form = {'csrf_token': token, 'fecha': fecha}
+    for area in [a for a in AREAS_IHP if a != 'Output']:
+        for turno in NOMBRES_TURNOS_PRODUCCION:
+            form[f'pronostico_{to_slug(area)}_{to_slug(turno)}'] = '120'
+            for hora in HORAS_TURNO[turno]:
+                form[f'produccion_{to_slug(area)}_{hora}'] = str(35 + int(time.time()) % 7)
+    form['pronostico_output'] = '500'
+    form['produccion_output'] = '480'
+    return form
+
+
+def _captura_json(app, client, fecha):
+    """Guardado parcial típico desde captura.js: una hora de cada área."""
+    from app.utils import AREAS_IHP
+    with client.session_transaction() as sess:
+        token = sess.get('csrf_token')
+    areas = [a for a in AREAS_IHP if a != 'Output']
+    value = 35 + int(time.time()) % 7
+    return {'csrf_token': token, 'fecha': fecha, 'pronostico': [], 'produccion': [[a, 0, value] for a in range(len(areas))]}
+
+
+def setup_database(database_url, years, scale, seed):
+    """Configura DATABASE_URL, crea el esquema y genera los datos. Devuelve (app, conteos)."""
+    os.environ['DATABASE_URL'] = database_url
+    from app import create_app, db_session
+    from app.models import init_db, create_default_admin
+    from .datagen import generate
+
+    app = create_app()
+    init_db()
+    create_default_admin()
+    counts = generate(db_session, years=years, scale=scale, seed=seed)
+    db_session.remove()
+    if app.config['PROGRAM_CELL_STORAGE'] == 'documento':
+        from app.migrations import run_backfill
+        for name in ('celdas_lm_documento', 'celdas_rotores_documento'):
+            run_backfill(name, sleep=0, restart=True, echo=lambda *_: None)
+    return app, counts
+
+
+def run_benchmarks(app, iterations=5, warmup=1, endpoints=None, username='admin', password='password'):
+    from app import engine
+    from app.instrumentation import percentile
+    from app.utils import get_business_date
+
+    counter = QueryCounter(engine)
+    client = app.test_client()
+    response = client.post('/', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f"No se pudo iniciar sesión como '{username}' (HTTP {response.status_code}).")
+
+    fecha = get_business_date().strftime('%Y-%m-%d')
+    results = {}
+    selected = [e for e in ENDPOINTS if not endpoints or e[0] in endpoints]
+    for name, method, url, body in selected:
+        latencies, queries, peaks, statuses, sizes = [], [], [], set(), []
+        for i in range(warmup + iterations):
+            kwargs = {}
+            if body == 'captura_form':
+                kwargs['data'] = _captura_form(app, client, fecha)
+            elif body == 'captura_json':
+                kwargs['json'] = _captura_json(app, client, fecha)
+            tracemalloc.start()
+            counter.count = 0
+            start = time.perf_counter()
+            resp = client.open(url, method=method, **kwargs)
+            body_bytes = resp.get_data()
+            elapsed = (time.perf_counter() - start) * 1000
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            if i < warmup:
+                continue
+            latencies.append(elapsed)
+            queries.append(counter.count)
+            peaks.append(peak)
+            statuses.add(resp.status_code)
+            sizes.append(len(body_bytes))
+        results[name] = {
+            'method': method,
+            'url': url,
+            'status_codes': sorted(statuses),
+            'iterations': iterations,
+            'latency_ms': {'p50': round(percentile(latencies, 50), 2), 'p95': round(percentile(latencies, 95), 2),
+                           'p99': round(percentile(latencies, 99), 2), 'max': round(max(latencies), 2)},
+            'queries': {'min': min(queries), 'max': max(queries), 'mean': round(sum(queries) / len(queries), 1)},
+            'peak_memory_kb': round(max(peaks) / 1024, 1),
+            'response_bytes': max(sizes),
+        }
+    return results
+
+
+def run(years=1.0, scale=0.2, seed=42, iterations=5, warmup=1, endpoints=None, database_url=None, output_dir=None):
+    tmp_dir = None
+    if not database_url:
+        tmp_dir = tempfile.mkdtemp(prefix='nidec_bench_')
+        database_url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+    started = time.perf_counter()
+    app, counts = setup_database(database_url, years, scale, seed)
+    setup_seconds = round(time.perf_counter() - started, 2)
+    results = run_benchmarks(app, iterations=iterations, warmup=warmup, endpoints=endpoints)
+
+    report = {
+        'commit': _git_commit(),
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'database': database_url.split(':', 1)[0],
+        'params': {'years': years, 'scale': scale, 'seed': seed, 'iterations': iterations, 'warmup': warmup},
+        'dataset': counts,
+        'setup_seconds': setup_seconds,
+        'endpoints': results,
+    }
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"{report['commit'] or 'local'}_{datetime.utcnow():%Y%m%d_%H%M%S}.json")
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+        report['path'] = path
+    return report
+
+
+def compare(baseline, current, threshold=0.10):
+    """Compara dos reportes; marca como regresión un aumento de p50 o de consultas mayor al umbral."""
+    rows = []
+    for name, cur in current['endpoints'].items():
+        base = baseline['endpoints'].get(name)
+        if not base:
+            continue
+        p50_base, p50_cur = base['latency_ms']['p50'], cur['latency_ms']['p50']
+        q_base, q_cur = base['queries']['mean'], cur['queries']['mean']
+        p50_delta = (p50_cur - p50_base) / p50_base if p50_base else 0.0
+        rows.append({
+            'endpoint': name,
+            'p50_base': p50_base, 'p50_current': p50_cur, 'p50_delta': round(p50_delta, 3),
+            'queries_base': q_base, 'queries_current': q_cur,
+            'regression': p50_delta > threshold or q_cur > q_base * (1 + threshold),
+        })
+    return rows
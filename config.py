@@ -22,4 +22,58 @@ class Config:
         DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    LOG_PAGE_SIZE = int(os.environ.get('LOG_PAGE_SIZE', 100))
+    LOG_RETENTION_MONTHS = int(os.environ.get('LOG_RETENTION_MONTHS', 12))
+    LOG_ARCHIVE_DIR = os.environ.get('LOG_ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'log_archive')
+
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '1') == '1'
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+    METRICS_WINDOW = int(os.environ.get('METRICS_WINDOW', 500))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.0))
+    PROFILING_HEADER = os.environ.get('PROFILING_HEADER', 'X-Profile')
+    PROFILING_INTERVAL_MS = float(os.environ.get('PROFILING_INTERVAL_MS', 5))
+    PROFILING_KEEP_PER_ENDPOINT = int(os.environ.get('PROFILING_KEEP_PER_ENDPOINT', 5))
+
+    # Jobs en segundo plano (app/scheduler.py); activos por defecto solo en Render.
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '1' if os.getenv('RENDER') else '0') == '1'
+    SCHEDULER_API_ENABLED = False
+    SCHEDULER_TIMEZONE = os.environ.get('SCHEDULER_TIMEZONE', 'America/Mexico_City')
+    SCHEDULER_LOCK_FILE = os.environ.get('SCHEDULER_LOCK_FILE') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'scheduler.lock')
+    SCHEDULER_WARM_DELAY_MIN = int(os.environ.get('SCHEDULER_WARM_DELAY_MIN', 5))
+    ROLLUP_LOOKBACK_DAYS = int(os.environ.get('ROLLUP_LOOKBACK_DAYS', 40))
+
+    # Exportaciones en segundo plano (app/exports.py).
+    EXPORT_DIR = os.environ.get('EXPORT_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'exports')
+    EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 2))
+    EXPORT_TTL_SECONDS = int(os.environ.get('EXPORT_TTL_SECONDS', 1800))
+    EXPORT_REUSE_SECONDS = int(os.environ.get('EXPORT_REUSE_SECONDS', 60))
+    EXPORT_JOB_TIMEOUT_SECONDS = int(os.environ.get('EXPORT_JOB_TIMEOUT_SECONDS', 600))
+
+    # Coalescencia de cálculos de dashboards/reportes (app/singleflight.py); entre workers solo si hay directorio.
+    SINGLEFLIGHT_SHARED_DIR = os.environ.get('SINGLEFLIGHT_SHARED_DIR')
+    SINGLEFLIGHT_RESULT_TTL = int(os.environ.get('SINGLEFLIGHT_RESULT_TTL', 30))
+    SINGLEFLIGHT_WAIT_SECONDS = int(os.environ.get('SINGLEFLIGHT_WAIT_SECONDS', 30))
+
+    # Último dato bueno y cortacircuitos de dashboards/reportes (app/snapshots.py); SNAPSHOT_DIR vacío = solo en memoria.
+    SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'snapshots'))
+    SNAPSHOT_MAX_ENTRIES = int(os.environ.get('SNAPSHOT_MAX_ENTRIES', 512))
+    SNAPSHOT_BREAKER_FAILURES = int(os.environ.get('SNAPSHOT_BREAKER_FAILURES', 3))
+    SNAPSHOT_BREAKER_OPEN_SECONDS = int(os.environ.get('SNAPSHOT_BREAKER_OPEN_SECONDS', 30))
+    SNAPSHOT_SLOW_SECONDS = float(os.environ.get('SNAPSHOT_SLOW_SECONDS', 5))
+
+    # Ingesta de contadores de máquina (app/ingest.py). INGEST_TOKENS = "linea1:token1,linea2:token2".
+    INGEST_TOKENS = os.environ.get('INGEST_TOKENS', '')
+    INGEST_DIR = os.environ.get('INGEST_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'ingest')
+    INGEST_FLUSH_SECONDS = float(os.environ.get('INGEST_FLUSH_SECONDS', 5))
+    INGEST_FLUSH_EVENTS = int(os.environ.get('INGEST_FLUSH_EVENTS', 5000))
+    INGEST_MAX_AGE_DAYS = int(os.environ.get('INGEST_MAX_AGE_DAYS', 7))
+    INGEST_FSYNC = os.environ.get('INGEST_FSYNC', '1') == '1'
+    INGEST_MAX_BYTES = int(os.environ.get('INGEST_MAX_BYTES', 10 * 1024 * 1024))
+
+    # Almacenamiento de celdas de los programas LM/Rotores (app/programs.py): 'filas' (datos_celda_*) o 'documento' (JSON por orden).
+    PROGRAM_CELL_STORAGE = os.environ.get('PROGRAM_CELL_STORAGE', 'filas')